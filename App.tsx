@@ -1,5 +1,5 @@
 
-import React from 'react';
+import React, { useCallback } from 'react';
 import { HashRouter, Routes, Route, Navigate } from 'react-router-dom';
 import Layout from './components/Layout';
 import Dashboard from './pages/Dashboard';
@@ -14,7 +14,8 @@ function App() {
   const [matches, setMatches] = useLocalStorage<Match[]>('matches', []);
   const [players, setPlayers] = useLocalStorage<Player[]>('players', []);
 
-  const addOrUpdateMatch = (match: Match) => {
+  // Stable callbacks: pages keep long-lived subscriptions that must not be recreated on every render
+  const addOrUpdateMatch = useCallback((match: Match) => {
     setMatches(prevMatches => {
       const existingMatchIndex = prevMatches.findIndex(m => m.id === match.id);
       if (existingMatchIndex > -1) {
@@ -25,20 +26,22 @@ function App() {
       // Add new matches and re-sort by date
       return [match, ...prevMatches].sort((a, b) => new Date(b.match_date).getTime() - new Date(a.match_date).getTime());
     });
-  };
+  }, [setMatches]);
   
-  const updatePlayers = (newPlayers: Player[] | undefined) => {
+  const updatePlayers = useCallback((newPlayers: Player[] | undefined) => {
     if (!newPlayers) return;
-    // Overwrite existing players with the new, most up-to-date list from the analysis
-    const playerMap = new Map<string, Player>();
-    
-    // Add existing players first
-    players.forEach(p => playerMap.set(p.name, p));
-    // Overwrite and add new players
-    newPlayers.forEach(p => playerMap.set(p.name, p));
+    setPlayers(prevPlayers => {
+      // Overwrite existing players with the new, most up-to-date list from the analysis
+      const playerMap = new Map<string, Player>();
+      
+      // Add existing players first
+      prevPlayers.forEach(p => playerMap.set(p.name, p));
+      // Overwrite and add new players
+      newPlayers.forEach(p => playerMap.set(p.name, p));
 
-    setPlayers(Array.from(playerMap.values()));
-  }
+      return Array.from(playerMap.values());
+    });
+  }, [setPlayers]);
 
   const deleteMatch = (matchId: string) => {
     setMatches(prevMatches => prevMatches.filter(m => m.id !== matchId));
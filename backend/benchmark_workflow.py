@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ARQV18 Enhanced v18.0 - Workflow Benchmark
+Carga sobre o enhanced_workflow_bp: inícios, status e resultados com N sessões simultâneas
+
+Transportes:
+    client   Flask test client no mesmo processo (sem rede)
+    http     servidor werkzeug local em thread + gerador de carga HTTP multi-thread
+    --url    servidor já em execução (métricas de threads/disco do processo não se aplicam)
+
+Exemplos:
+    python benchmark_workflow.py --sessions 1,10,100,1000 --stage-latency 0
+    python benchmark_workflow.py --mode http --sessions 100 --stage-latency latencias.json --output run.json
+
+A saída é JSON (stdout ou --output) para comparar execuções; o resumo legível vai para stderr.
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+# Teto de espera honrado quando o servidor responde 503/429 + Retry-After
+MAX_RETRY_SLEEP = 2.0
+
+
+# ==========================================
+# TRANSPORTES
+# ==========================================
+
+class ClienteTeste:
+    """Flask test client, um por thread do gerador de carga"""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method: str, path: str, body: Dict = None) -> Tuple[int, bytes, Dict]:
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        resposta = client.open(path, method=method, json=body)
+        return resposta.status_code, resposta.get_data(), dict(resposta.headers)
+
+
+class ClienteHTTP:
+    """Requisições HTTP/1.1 com http.client (uma conexão por requisição)"""
+
+    def __init__(self, base_url: str):
+        partes = urlsplit(base_url)
+        self.host = partes.hostname
+        self.port = partes.port or 80
+        self.prefixo = partes.path.rstrip("/")
+
+    def request(self, method: str, path: str, body: Dict = None) -> Tuple[int, bytes, Dict]:
+        conexao = http.client.HTTPConnection(self.host, self.port, timeout=120)
+        try:
+            headers = {}
+            dados = None
+            if body is not None:
+                dados = json.dumps(body).encode("utf-8")
+                headers["Content-Type"] = "application/json"
+            conexao.request(method, self.prefixo + path, body=dados, headers=headers)
+            resposta = conexao.getresponse()
+            return resposta.status, resposta.read(), dict(resposta.getheaders())
+        finally:
+            conexao.close()
+
+
+def iniciar_servidor_local(app):
+    """Sobe o app em um servidor werkzeug threaded numa porta livre de 127.0.0.1"""
+    from werkzeug.serving import make_server
+    servidor = make_server("127.0.0.1", 0, app, threaded=True)
+    thread = threading.Thread(target=servidor.serve_forever, name="benchmark-http", daemon=True)
+    thread.start()
+    return servidor, f"http://127.0.0.1:{servidor.server_port}"
+
+
+# ==========================================
+# MEDIÇÕES
+# ==========================================
+
+def percentil(valores: List[float], p: float) -> Optional[float]:
+    """Percentil por posição mais próxima (valores já ordenados)"""
+    if not valores:
+        return None
+    indice = max(0, min(len(valores) - 1, int(round(p / 100.0 * len(valores) + 0.5)) - 1))
+    return valores[indice]
+
+
+class Registro:
+    """Latências e códigos de status por endpoint"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latencias: Dict[str, List[float]] = {}
+        self._status: Dict[str, Dict[int, int]] = {}
+        self._janelas: Dict[str, List[float]] = {}
+
+    def medir(self, cliente, endpoint: str, method: str, path: str, body: Dict = None):
+        inicio = time.perf_counter()
+        status, corpo, headers = cliente.request(method, path, body)
+        fim = time.perf_counter()
+        with self._lock:
+            self._latencias.setdefault(endpoint, []).append(fim - inicio)
+            contagem = self._status.setdefault(endpoint, {})
+            contagem[status] = contagem.get(status, 0) + 1
+            janela = self._janelas.setdefault(endpoint, [inicio, fim])
+            janela[0] = min(janela[0], inicio)
+            janela[1] = max(janela[1], fim)
+        return status, corpo, headers
+
+    def resumo(self) -> Dict[str, Dict]:
+        resultado = {}
+        with self._lock:
+            for endpoint, latencias in self._latencias.items():
+                ordenadas = sorted(latencias)
+                duracao = self._janelas[endpoint][1] - self._janelas[endpoint][0]
+                status = self._status[endpoint]
+                resultado[endpoint] = {
+                    "requests": len(ordenadas),
+                    "status": {str(codigo): total for codigo, total in sorted(status.items())},
+                    "errors": sum(total for codigo, total in status.items() if codigo >= 500 and codigo != 503),
+                    "rejected": status.get(503, 0) + status.get(429, 0),
+                    "throughput_rps": round(len(ordenadas) / duracao, 2) if duracao > 0 else None,
+                    "p50_ms": round(percentil(ordenadas, 50) * 1000, 3),
+                    "p99_ms": round(percentil(ordenadas, 99) * 1000, 3),
+                    "max_ms": round(ordenadas[-1] * 1000, 3),
+                }
+        return resultado
+
+
+class AmostradorThreads:
+    """Amostra threading.active_count() em segundo plano e guarda o pico"""
+
+    def __init__(self, intervalo: float = 0.05):
+        self.intervalo = intervalo
+        self.pico = threading.active_count()
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="benchmark-threads", daemon=True)
+
+    def _loop(self):
+        while not self._parar.wait(self.intervalo):
+            self.pico = max(self.pico, threading.active_count())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._parar.set()
+        self._thread.join()
+
+
+def bytes_escritos_processo() -> Optional[int]:
+    """write_bytes de /proc/self/io (Linux); None quando indisponível"""
+    try:
+        with open("/proc/self/io", "r") as f:
+            for linha in f:
+                if linha.startswith("write_bytes:"):
+                    return int(linha.split(":", 1)[1])
+    except OSError:
+        pass
+    return None
+
+
+def tamanho_diretorio(path: str) -> int:
+    total = 0
+    for raiz, _, arquivos in os.walk(path):
+        for nome in arquivos:
+            try:
+                total += os.path.getsize(os.path.join(raiz, nome))
+            except OSError:
+                pass
+    return total
+
+
+def contar_arquivos(path: str) -> int:
+    return sum(len(arquivos) for _, _, arquivos in os.walk(path))
+
+
+# ==========================================
+# FASES
+# ==========================================
+
+def iniciar_sessao(cliente, registro: Registro, nivel: int, indice: int, prazo: float) -> Optional[str]:
+    """POST /start; em 503/429 espera o Retry-After (limitado) e tenta de novo até o prazo"""
+    corpo_requisicao = {
+        "segmento": "benchmark",
+        "force_refresh": True,
+        "context": {"opponent": f"Benchmark {nivel}-{indice}", "competition": "benchmark"},
+    }
+    while True:
+        status, corpo, headers = registro.medir(
+            cliente, "start", "POST", "/api/workflow/full_workflow/start", corpo_requisicao
+        )
+        if status == 200:
+            return json.loads(corpo)["session_id"]
+        if status not in (429, 503) or time.monotonic() >= prazo:
+            return None
+        try:
+            espera = float(headers.get("Retry-After", "1"))
+        except ValueError:
+            espera = 1.0
+        time.sleep(min(max(espera, 0.05), MAX_RETRY_SLEEP))
+
+
+def aguardar_sessoes(cliente, registro: Registro, executor, session_ids: List[str],
+                     intervalo: float, prazo: float) -> Tuple[int, int]:
+    """Consulta /status de todas as sessões pendentes até concluírem (ou falharem) ou o prazo vencer"""
+    pendentes = set(session_ids)
+    concluidas = falhas = 0
+
+    def consultar(session_id):
+        status, corpo, _ = registro.medir(cliente, "status", "GET", f"/api/workflow/status/{session_id}")
+        if status != 200:
+            return session_id, None
+        return session_id, json.loads(corpo)
+
+    while pendentes and time.monotonic() < prazo:
+        for session_id, dados in executor.map(consultar, list(pendentes)):
+            if dados is None:
+                continue
+            if dados.get("error"):
+                pendentes.discard(session_id)
+                falhas += 1
+            elif dados.get("progress_percentage", 0) >= 100:
+                pendentes.discard(session_id)
+                concluidas += 1
+        if pendentes:
+            time.sleep(intervalo)
+
+    return concluidas, falhas
+
+
+def buscar_resultados(cliente, registro: Registro, executor, session_ids: List[str]):
+    def buscar(session_id):
+        registro.medir(cliente, "results_synthesis", "GET", f"/api/workflow/results/synthesis/{session_id}")
+        registro.medir(cliente, "results", "GET", f"/api/workflow/results/{session_id}")
+
+    list(executor.map(buscar, session_ids))
+
+
+def executar_nivel(cliente, nivel: int, args, data_dir: Optional[str]) -> Dict:
+    """Uma rodada completa com `nivel` sessões simultâneas"""
+    registro = Registro()
+    threads = args.threads or min(max(nivel, 1), 64)
+    journal_dir = os.path.join(data_dir, "analyses_data") if data_dir else None
+
+    bytes_disco_antes = tamanho_diretorio(journal_dir) if journal_dir else None
+    arquivos_antes = contar_arquivos(journal_dir) if journal_dir else None
+    io_antes = bytes_escritos_processo() if data_dir else None
+
+    inicio = time.perf_counter()
+    prazo = time.monotonic() + args.timeout
+
+    with AmostradorThreads() as amostrador, ThreadPoolExecutor(max_workers=threads) as executor:
+        session_ids = list(executor.map(
+            lambda i: iniciar_sessao(cliente, registro, nivel, i, prazo), range(nivel)
+        ))
+        iniciadas = [sid for sid in session_ids if sid]
+        fim_inicio = time.perf_counter()
+
+        concluidas, falhas = aguardar_sessoes(
+            cliente, registro, executor, iniciadas, args.poll_interval, prazo
+        )
+        fim_sessoes = time.perf_counter()
+
+        buscar_resultados(cliente, registro, executor, iniciadas)
+
+    fim = time.perf_counter()
+    io_depois = bytes_escritos_processo() if data_dir else None
+
+    rodada = {
+        "sessions": nivel,
+        "load_threads": threads,
+        "started": len(iniciadas),
+        "completed": concluidas,
+        "failed": falhas,
+        "timed_out": len(iniciadas) - concluidas - falhas,
+        "start_phase_seconds": round(fim_inicio - inicio, 4),
+        "completion_seconds": round(fim_sessoes - inicio, 4),
+        "wall_seconds": round(fim - inicio, 4),
+        "sessions_per_second": round(concluidas / (fim_sessoes - inicio), 2) if fim_sessoes > inicio else None,
+        "endpoints": registro.resumo(),
+        "peak_threads": amostrador.pico if data_dir else None,
+        "disk": None,
+    }
+    if journal_dir:
+        rodada["disk"] = {
+            "bytes_added": tamanho_diretorio(journal_dir) - bytes_disco_antes,
+            "files_added": contar_arquivos(journal_dir) - arquivos_antes,
+            "process_write_bytes": (io_depois - io_antes) if io_antes is not None and io_depois is not None else None,
+        }
+    return rodada
+
+
+def resumo_legivel(rodada: Dict) -> str:
+    linhas = [f"--- {rodada['sessions']} sessões: {rodada['completed']} concluídas, "
+              f"{rodada['failed']} falhas, {rodada['timed_out']} sem concluir em {rodada['wall_seconds']}s "
+              f"({rodada['sessions_per_second']} sessões/s, pico de threads: {rodada['peak_threads']})"]
+    for endpoint, dados in rodada["endpoints"].items():
+        linhas.append(f"    {endpoint:<18} {dados['requests']:>7} req  {dados['throughput_rps']} req/s  "
+                      f"p50 {dados['p50_ms']}ms  p99 {dados['p99_ms']}ms  503/429: {dados['rejected']}  "
+                      f"erros: {dados['errors']}")
+    if rodada["disk"]:
+        linhas.append(f"    disco: +{rodada['disk']['bytes_added']} bytes em {rodada['disk']['files_added']} arquivos "
+                      f"(write_bytes do processo: {rodada['disk']['process_write_bytes']})")
+    return "\n".join(linhas)
+
+
+# ==========================================
+# EXECUÇÃO
+# ==========================================
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark do enhanced_workflow_bp")
+    parser.add_argument("--mode", choices=("client", "http"), default="client",
+                        help="transporte: Flask test client ou HTTP local (padrão: client)")
+    parser.add_argument("--url", help="servidor externo já em execução (ex.: http://localhost:5000)")
+    parser.add_argument("--sessions", default="1,10,100",
+                        help="níveis de sessões simultâneas, separados por vírgula (padrão: 1,10,100)")
+    parser.add_argument("--stage-latency", default="0",
+                        help="segundos por etapa ou arquivo JSON com amostras por etapa (padrão: 0)")
+    parser.add_argument("--workers", type=int, help="WORKFLOW_MAX_WORKERS do processo testado")
+    parser.add_argument("--threads", type=int, help="threads do gerador de carga (padrão: min(sessões, 64))")
+    parser.add_argument("--poll-interval", type=float, default=0.05, help="intervalo entre varreduras de status")
+    parser.add_argument("--timeout", type=float, default=600, help="prazo por nível (segundos)")
+    parser.add_argument("--data-dir", help="diretório de trabalho para analyses_data (padrão: temporário)")
+    parser.add_argument("--output", help="grava o JSON de resultados neste arquivo")
+    parser.add_argument("--verbose", action="store_true", help="mantém os logs INFO do app")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = _parse_args(argv)
+    # Caminhos relativos ao diretório de chamada (o processo muda para o diretório de dados)
+    if args.output:
+        args.output = os.path.abspath(args.output)
+    if os.path.isfile(args.stage_latency):
+        args.stage_latency = os.path.abspath(args.stage_latency)
+    niveis = [int(n) for n in args.sessions.split(",") if n.strip()]
+
+    data_dir = None
+    servidor = None
+    stage_latency = None
+
+    if args.url:
+        cliente = ClienteHTTP(args.url)
+        modo = "external"
+    else:
+        # Configuração lida pelo blueprint na importação: precisa estar no ambiente antes do import
+        os.environ["WORKFLOW_STAGE_LATENCY"] = args.stage_latency
+        os.environ.setdefault("WORKFLOW_MAX_QUEUE", str(max(niveis)))
+        # Todas as requisições vêm do mesmo cliente: sem token bucket por cliente, salvo se configurado
+        os.environ.setdefault("WORKFLOW_START_RATE", "0")
+        os.environ.setdefault("WORKFLOW_READ_RATE", "0")
+        if args.workers:
+            os.environ["WORKFLOW_MAX_WORKERS"] = str(args.workers)
+
+        data_dir = os.path.abspath(args.data_dir or tempfile.mkdtemp(prefix="workflow-benchmark-"))
+        os.makedirs(data_dir, exist_ok=True)
+        os.chdir(data_dir)
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+        from routes import app
+        import enhanced_workflow_routes
+        if not args.verbose:
+            logging.disable(logging.WARNING)
+
+        stage_latency = enhanced_workflow_routes.stage_latency.describe()
+        if args.mode == "http":
+            servidor, base_url = iniciar_servidor_local(app)
+            cliente = ClienteHTTP(base_url)
+        else:
+            cliente = ClienteTeste(app)
+        modo = args.mode
+
+    resultado = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "mode": modo,
+            "url": args.url,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "workers": os.environ.get("WORKFLOW_MAX_WORKERS") if not args.url else None,
+            "max_queue": os.environ.get("WORKFLOW_MAX_QUEUE") if not args.url else None,
+            "stage_latency": stage_latency,
+            "data_dir": data_dir,
+        },
+        "runs": [],
+    }
+
+    try:
+        for nivel in niveis:
+            rodada = executar_nivel(cliente, nivel, args, data_dir)
+            resultado["runs"].append(rodada)
+            print(resumo_legivel(rodada), file=sys.stderr)
+    finally:
+        if servidor is not None:
+            servidor.shutdown()
+
+    saida = json.dumps(resultado, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(saida + "\n")
+    else:
+        print(saida)
+
+    return 0 if all(r["completed"] == r["sessions"] for r in resultado["runs"]) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,401 +1,1994 @@
-#!/usr/bin/env python3
-# -*- coding: utf-8 -*-
-"""
-ARQV18 Enhanced v18.0 - Enhanced Workflow Routes
-Rotas para o workflow aprimorado em 3 etapas + CPL Devastador + Verificação AI
-"""
-import logging
-import time
-import uuid
-import asyncio
-import os
-import glob
-import json
-from datetime import datetime
-from typing import Dict, Any, List
-from flask import Blueprint, request, jsonify, send_file
-import threading
-
-logger = logging.getLogger(__name__)
-enhanced_workflow_bp = Blueprint('enhanced_workflow', __name__)
-
-# Configuração do caminho base
-BASE_ANALYSIS_PATH = "analyses_data"
-
-# ==========================================
-# FUNÇÕES AUXILIARES
-# ==========================================
-
-def generate_session_id():
-    """Gera um ID único para a sessão"""
-    return f"session_{int(time.time() * 1000)}_{uuid.uuid4().hex[:8]}"
-
-def salvar_etapa(nome_etapa: str, dados: Dict, categoria: str = "workflow", session_id: str = None):
-    """Salva dados de uma etapa do workflow"""
-    try:
-        if not session_id:
-            logger.warning("session_id não fornecido para salvar_etapa")
-            return
-        
-        caminho_base = os.path.join(BASE_ANALYSIS_PATH, categoria, session_id)
-        os.makedirs(caminho_base, exist_ok=True)
-        
-        arquivo = os.path.join(caminho_base, f"{nome_etapa}.json")
-        with open(arquivo, 'w', encoding='utf-8') as f:
-            json.dump(dados, f, ensure_ascii=False, indent=2)
-        
-        logger.info(f"✅ Etapa '{nome_etapa}' salva em {arquivo}")
-    except Exception as e:
-        logger.error(f"❌ Erro ao salvar etapa '{nome_etapa}': {e}")
-
-# ==========================================
-# WORKFLOW COMPLETO
-# ==========================================
-
-@enhanced_workflow_bp.route('/workflow/full_workflow/start', methods=['POST'])
-def start_full_workflow():
-    """Inicia o workflow completo em segundo plano"""
-    try:
-        data = request.get_json()
-        session_id = generate_session_id()
-        
-        segmento = data.get('segmento', '').strip()
-        
-        if not segmento:
-            return jsonify({"error": "Segmento é obrigatório"}), 400
-        
-        context = data.get('context', {})
-        
-        logger.info(f"🚀 WORKFLOW COMPLETO INICIADO - Sessão: {session_id}")
-        logger.info(f"🔍 Segmento: {segmento}")
-        
-        salvar_etapa("workflow_completo_iniciado", {
-            "session_id": session_id,
-            "segmento": segmento,
-            "context": context,
-            "timestamp": datetime.now().isoformat()
-        }, categoria="workflow", session_id=session_id)
-        
-        def execute_full_workflow_thread():
-            try:
-                # Simula processamento das etapas
-                time.sleep(2)
-                
-                # ETAPA 1: Coleta
-                logger.info(f"📊 ETAPA 1 - Coleta de Dados - Sessão: {session_id}")
-                salvar_etapa("etapa1_concluida_full_workflow", {
-                    "session_id": session_id,
-                    "dados_coletados": {"exemplo": "dados simulados"},
-                    "timestamp": datetime.now().isoformat()
-                }, categoria="workflow", session_id=session_id)
-                time.sleep(2)
-                
-                # ETAPA 2: Verificação AI
-                logger.info(f"🤖 ETAPA 2 - Verificação AI - Sessão: {session_id}")
-                salvar_etapa("verificacao_ai_concluida_full_workflow", {
-                    "session_id": session_id,
-                    "verificacao": "completa",
-                    "timestamp": datetime.now().isoformat()
-                }, categoria="workflow", session_id=session_id)
-                time.sleep(2)
-                
-                # ETAPA 3: Síntese
-                logger.info(f"🧠 ETAPA 3 - Síntese - Sessão: {session_id}")
-                
-                # Dados de síntese completos para o relatório
-                opponent_name = context.get('opponent', 'adversário')
-                synthesis_data = {
-                    "insights_principais": [
-                        f"Análise completa da partida contra {opponent_name}",
-                        "Corinthians demonstra vantagem tática no confronto",
-                        "Condições favoráveis para vitória em casa",
-                        "Elenco em boa condição física para o confronto"
-                    ],
-                    "pontos_atencao_criticos": [
-                        "Desfalques no meio-campo podem impactar posse de bola",
-                        f"{opponent_name} forte em jogadas de bola parada",
-                        "Importância de manter concentração defensiva",
-                        "Atenção às transições rápidas do adversário"
-                    ],
-                    "validacao_dados": {
-                        "nivel_confianca": "85%",
-                        "fontes_consultadas": 15,
-                        "dados_validados": True
-                    },
-                    "dados_mercado_validados": {
-                        "ameacas_identificadas": [
-                            "Lesões recentes no elenco",
-                            "Desgaste físico por calendário apertado"
-                        ]
-                    },
-                    "analise_tatica": {
-                        "formacao_recomendada": "4-3-3",
-                        "pontos_fortes": ["Posse de bola", "Transições rápidas", "Pressão alta"],
-                        "pontos_fracos": ["Vulnerabilidade em bolas aéreas", "Cansaço físico"]
-                    },
-                    # Dados adicionais para compatibilidade com o frontend
-                    "corinthians_stats": {
-                        "team_name": "Corinthians",
-                        "recent_form": "V-V-E-V-D",
-                        "playing_style": "Posse de bola e transições rápidas",
-                        "key_players": ["Yuri Alberto", "Rodrigo Garro", "Memphis Depay"],
-                        "injuries_suspensions": ["Hugo - Lesionado (previsão 2 semanas)"],
-                        "strengths": ["Posse de bola", "Transições", "Pressão alta"],
-                        "weaknesses": ["Bolas aéreas", "Cansaço físico"],
-                        "avg_goals_scored": 1.5,
-                        "avg_goals_conceded": 0.9,
-                        "tactical_details": "Time busca controlar o jogo com posse de bola",
-                        "possession_avg": 58.0,
-                        "shots_per_game_avg": 14.2,
-                        "key_player_analysis": [],
-                        "team_motivation": "Alta - buscando classificação para Libertadores"
-                    },
-                    "opponent_stats": {
-                        "team_name": opponent_name,
-                        "recent_form": "D-E-D-V-D",
-                        "playing_style": "Jogo direto e contra-ataques",
-                        "key_players": ["Jogador 1", "Jogador 2"],
-                        "injuries_suspensions": ["Sem desfalques confirmados"],
-                        "strengths": ["Jogadas de bola parada", "Contra-ataques"],
-                        "weaknesses": ["Posse de bola", "Organização defensiva"],
-                        "avg_goals_scored": 0.8,
-                        "avg_goals_conceded": 1.6,
-                        "tactical_details": "Time mais reativo, busca explorar erros adversários",
-                        "possession_avg": 42.0,
-                        "shots_per_game_avg": 9.5,
-                        "key_player_analysis": [],
-                        "team_motivation": "Lutando contra rebaixamento"
-                    },
-                    "head_to_head": {
-                        "total_matches": 24,
-                        "corinthians_wins": 14,
-                        "opponent_wins": 5,
-                        "draws": 5,
-                        "notable_matches_summary": f"Corinthians tem amplo domínio nos confrontos diretos contra {opponent_name}. Nas últimas 5 partidas, o Timão venceu 3, empatou 1 e perdeu 1."
-                    },
-                    "news_and_context": {
-                        "key_news_corinthians": [
-                            "Time vem de sequência positiva",
-                            "Elenco focado em classificação",
-                            "Torcida faz festa na Neo Química Arena"
-                        ],
-                        "key_news_opponent": [
-                            f"{opponent_name} precisa pontuar para fugir do Z-4",
-                            "Técnico muda esquema tático",
-                            "Reforços recentes ainda em adaptação"
-                        ],
-                        "match_importance": f"Partida crucial: Corinthians busca Libertadores, {opponent_name} luta contra rebaixamento"
-                    },
-                    "tactical_analysis": {
-                        "corinthians_formation": "4-3-3",
-                        "opponent_formation": "5-4-1",
-                        "key_matchups": [
-                            "Memphis Depay vs Zaga adversária",
-                            "Meio-campo do Corinthians vs Bloqueio do adversário",
-                            "Laterais do Corinthians vs Contra-ataque adversário"
-                        ],
-                        "predicted_dynamics": f"Espera-se que o Corinthians tenha amplo domínio da posse de bola, enquanto {opponent_name} se fecha e busca contra-ataques. A partida deve ser decidida pela capacidade do Timão em quebrar o bloqueio defensivo adversário.",
-                        "heatmap_description": "Concentração de jogadas pelo meio e pelas laterais, com o Corinthians pressionando no campo adversário."
-                    },
-                    "investigative_report": {
-                        "high_impact_findings": [
-                            f"Análise detalhada indica vantagem significativa para o Corinthians",
-                            f"{opponent_name} com problemas defensivos nas últimas rodadas",
-                            "Condições climáticas favoráveis ao jogo do Corinthians"
-                        ],
-                        "potential_contradictions_found": [],
-                        "summary": f"Investigação profunda confirma favoritismo do Corinthians no confronto contra {opponent_name}. Fatores técnicos, táticos e motivacionais apontam para vitória do Timão."
-                    }
-                }
-                
-                salvar_etapa("sintese_master_synthesis", synthesis_data, 
-                           categoria="workflow", session_id=session_id)
-                
-                salvar_etapa("etapa3_sintese_concluida_full_workflow", {
-                    "session_id": session_id,
-                    "synthesis_result": synthesis_data,
-                    "timestamp": datetime.now().isoformat()
-                }, categoria="workflow", session_id=session_id)
-                time.sleep(2)
-                
-                # ETAPA 4: Geração
-                logger.info(f"📝 ETAPA 4 - Geração de Módulos - Sessão: {session_id}")
-                salvar_etapa("etapa4_geracao_concluida_full_workflow", {
-                    "session_id": session_id,
-                    "modulos_gerados": 16,
-                    "timestamp": datetime.now().isoformat()
-                }, categoria="workflow", session_id=session_id)
-                time.sleep(2)
-                
-                # ETAPA 5: CPL Devastador
-                logger.info(f"🎯 ETAPA 5 - CPL Devastador - Sessão: {session_id}")
-                salvar_etapa("cpl_devastador_concluido_full_workflow", {
-                    "session_id": session_id,
-                    "cpl_completo": True,
-                    "timestamp": datetime.now().isoformat()
-                }, categoria="workflow", session_id=session_id)
-                
-                # Conclusão
-                salvar_etapa("workflow_completo_concluido", {
-                    "session_id": session_id,
-                    "status": "concluido",
-                    "timestamp": datetime.now().isoformat()
-                }, categoria="workflow", session_id=session_id)
-                
-                logger.info(f"✅ WORKFLOW COMPLETO CONCLUÍDO - Sessão: {session_id}")
-                
-            except Exception as e:
-                logger.error(f"❌ Erro no workflow completo: {e}")
-                salvar_etapa("workflow_erro", {
-                    "session_id": session_id,
-                    "error": str(e),
-                    "timestamp": datetime.now().isoformat()
-                }, categoria="workflow", session_id=session_id)
-        
-        thread = threading.Thread(target=execute_full_workflow_thread)
-        thread.start()
-        
-        return jsonify({
-            "success": True,
-            "session_id": session_id,
-            "message": "Workflow completo iniciado em segundo plano",
-            "estimated_total_duration": "12-25 minutos",
-            "status_endpoint": f"/api/workflow/status/{session_id}"
-        }), 200
-        
-    except Exception as e:
-        logger.error(f"❌ Erro ao iniciar workflow completo: {e}")
-        return jsonify({
-            "success": False,
-            "error": str(e)
-        }), 500
-
-# ==========================================
-# STATUS E RESULTADOS
-# ==========================================
-
-@enhanced_workflow_bp.route('/workflow/status/<session_id>', methods=['GET'])
-def get_workflow_status(session_id):
-    """Obtém status do workflow"""
-    try:
-        status = {
-            "session_id": session_id,
-            "current_step": 0,
-            "step_status": {
-                "step1": "pending",
-                "step2": "pending",
-                "step3": "pending",
-                "step4": "pending",
-                "cpl_devastador": "pending"
-            },
-            "progress_percentage": 0,
-            "estimated_remaining": "Calculando...",
-            "last_update": datetime.now().isoformat()
-        }
-        
-        # Verifica etapa 1
-        if os.path.exists(f"{BASE_ANALYSIS_PATH}/workflow/{session_id}/etapa1_concluida_full_workflow.json"):
-            status["step_status"]["step1"] = "completed"
-            status["current_step"] = 1
-            status["progress_percentage"] = 20
-        
-        # Verifica etapa 2
-        if os.path.exists(f"{BASE_ANALYSIS_PATH}/workflow/{session_id}/verificacao_ai_concluida_full_workflow.json"):
-            status["step_status"]["step2"] = "completed"
-            status["current_step"] = 2
-            status["progress_percentage"] = 40
-        
-        # Verifica etapa 3
-        if os.path.exists(f"{BASE_ANALYSIS_PATH}/workflow/{session_id}/etapa3_sintese_concluida_full_workflow.json"):
-            status["step_status"]["step3"] = "completed"
-            status["current_step"] = 3
-            status["progress_percentage"] = 60
-        
-        # Verifica etapa 4
-        if os.path.exists(f"{BASE_ANALYSIS_PATH}/workflow/{session_id}/etapa4_geracao_concluida_full_workflow.json"):
-            status["step_status"]["step4"] = "completed"
-            status["current_step"] = 4
-            status["progress_percentage"] = 80
-        
-        # Verifica CPL Devastador
-        if os.path.exists(f"{BASE_ANALYSIS_PATH}/workflow/{session_id}/cpl_devastador_concluido_full_workflow.json"):
-            status["step_status"]["cpl_devastador"] = "completed"
-            status["current_step"] = 5
-            status["progress_percentage"] = 100
-            status["estimated_remaining"] = "Concluído"
-        
-        # Verifica erros
-        error_file = f"{BASE_ANALYSIS_PATH}/workflow/{session_id}/workflow_erro.json"
-        if os.path.exists(error_file):
-            with open(error_file, 'r') as f:
-                error_data = json.load(f)
-            status["error"] = error_data.get("error", "Erro desconhecido")
-        
-        return jsonify(status), 200
-        
-    except Exception as e:
-        logger.error(f"❌ Erro ao obter status: {e}")
-        return jsonify({
-            "session_id": session_id,
-            "error": str(e),
-            "status": "error"
-        }), 500
-
-@enhanced_workflow_bp.route('/workflow/results/synthesis/<session_id>', methods=['GET'])
-def get_synthesis_results(session_id):
-    """Endpoint para obter os dados da síntese final"""
-    try:
-        synthesis_file = f"{BASE_ANALYSIS_PATH}/workflow/{session_id}/sintese_master_synthesis.json"
-        
-        if not os.path.exists(synthesis_file):
-            logger.warning(f"Arquivo de síntese não encontrado para sessão {session_id}")
-            return jsonify({
-                "error": "Dados de síntese não encontrados",
-                "session_id": session_id
-            }), 404
-        
-        with open(synthesis_file, 'r', encoding='utf-8') as f:
-            synthesis_data = json.load(f)
-        
-        logger.info(f"✅ Dados de síntese retornados para sessão {session_id}")
-        return jsonify(synthesis_data), 200
-        
-    except Exception as e:
-        logger.error(f"❌ Erro ao obter dados de síntese: {e}")
-        return jsonify({
-            "error": str(e),
-            "session_id": session_id
-        }), 500
-
-@enhanced_workflow_bp.route('/workflow/results/<session_id>', methods=['GET'])
-def get_workflow_results(session_id):
-    """Obtém resultados do workflow"""
-    try:
-        results = {
-            "session_id": session_id,
-            "available_files": [],
-            "final_report_available": False,
-            "modules_generated": 0,
-            "verification_available": False
-        }
-        
-        # Verifica síntese
-        synthesis_file = f"{BASE_ANALYSIS_PATH}/workflow/{session_id}/sintese_master_synthesis.json"
-        if os.path.exists(synthesis_file):
-            results["synthesis_available"] = True
-            results["synthesis_path"] = synthesis_file
-        
-        # Verifica Verificação AI
-        verification_file = f"{BASE_ANALYSIS_PATH}/workflow/{session_id}/verificacao_ai_concluida_full_workflow.json"
-        if os.path.exists(verification_file):
-            results["verification_available"] = True
-            results["verification_path"] = verification_file
-        
-        return jsonify(results), 200
-        
-    except Exception as e:
-        logger.error(f"❌ Erro ao obter resultados: {e}")
-        return jsonify({
-            "session_id": session_id,
-            "error": str(e)
-        }), 500
\ No newline at end of file
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ARQV18 Enhanced v18.0 - Enhanced Workflow Routes
+Rotas para o workflow aprimorado em 3 etapas + CPL Devastador + Verificação AI
+"""
+import logging
+import time
+import uuid
+import asyncio
+import os
+import glob
+import json
+import atexit
+from datetime import datetime
+from typing import Dict, Any, List
+from flask import Blueprint, request, jsonify, send_file, Response, stream_with_context, g
+import threading
+
+from state_backend import criar_backend
+from session_registry import (
+    SessionRegistry, BatchRegistry, WORKFLOW_STEPS, STATUS_EM_ANDAMENTO, STATUS_CONCLUIDO, STATUS_CANCELADO,
+    ETAPA_LOTE_CRIADO, ETAPA_INICIO, ETAPA_RETOMADA, ETAPA_CANCELAMENTO, ETAPA_CONCLUSAO_DO_CACHE,
+    ETAPA_SECAO_SINTESE_PREFIXO, ETAPA_SESSAO_APAGADA
+)
+from session_retention import RetentionPolicy, RetentionWorker
+from session_index import SessionIndex, CAMPOS_INDICE, normalizar
+from job_scheduler import WorkflowScheduler, SharedWorkflowScheduler, QueueFullError
+from stage_dag import AbortHandle, Stage, StageDAG, WorkflowInterrupted
+from response_cache import ResponseCache, parse_timestamp
+from synthesis_cache import SynthesisCache, chave_requisicao, RESULTADO_HIT, RESULTADO_EM_ANDAMENTO
+from metrics import metrics_registry, SIZE_BUCKETS
+from rate_limiter import TokenBucketLimiter, ConcurrencyLimiter, retry_after_header
+from stage_latency import StageLatency
+from session_bundle import BundleCache, FORMATOS as BUNDLE_FORMATOS, artefatos_da_sessao, stream_bundle
+
+logger = logging.getLogger(__name__)
+enhanced_workflow_bp = Blueprint('enhanced_workflow', __name__)
+
+# Configuração do caminho base (relativo ao diretório de trabalho, ou absoluto)
+BASE_ANALYSIS_PATH = os.environ.get("WORKFLOW_DATA_PATH", "analyses_data")
+
+# Pool de execução do workflow completo
+WORKFLOW_MAX_WORKERS = int(os.environ.get("WORKFLOW_MAX_WORKERS", "4"))
+WORKFLOW_MAX_QUEUE = int(os.environ.get("WORKFLOW_MAX_QUEUE", "100"))
+
+# Backend de estado: files (padrão, um processo), sqlite:///state.db (vários processos no mesmo host;
+# caminho relativo a analyses_data, ou sqlite:////absoluto), memory (stand-in local do store em rede)
+# ou redis://host:6379/0 (vários hosts)
+WORKFLOW_STATE_BACKEND = os.environ.get("WORKFLOW_STATE_BACKEND", "files")
+# Backends compartilhados: intervalo do feed de mudanças, lease dos jobs e espera por jobs na fila
+WORKFLOW_STATE_SYNC_INTERVAL = float(os.environ.get("WORKFLOW_STATE_SYNC_INTERVAL", "0.5"))
+WORKFLOW_JOB_LEASE_SECONDS = float(os.environ.get("WORKFLOW_JOB_LEASE_SECONDS", "60"))
+WORKFLOW_JOB_POLL_INTERVAL = float(os.environ.get("WORKFLOW_JOB_POLL_INTERVAL", "0.5"))
+
+# Retomada de sessões interrompidas no início do processo e encerramento gracioso
+WORKFLOW_RESUME_ON_STARTUP = os.environ.get("WORKFLOW_RESUME_ON_STARTUP", "1") == "1"
+WORKFLOW_SHUTDOWN_TIMEOUT = float(os.environ.get("WORKFLOW_SHUTDOWN_TIMEOUT", "30"))
+# 1 = deixa os workflows em execução concluírem; 0 = param na próxima etapa (checkpoint)
+WORKFLOW_SHUTDOWN_DRAIN = os.environ.get("WORKFLOW_SHUTDOWN_DRAIN", "0") == "1"
+
+# Cancelamento automático de sessões em andamento sem nenhuma leitura de status por este tempo
+# (segundos; 0 desativa). Leituras são gravadas no backend no máximo a cada WORKFLOW_READ_HEARTBEAT_INTERVAL
+WORKFLOW_IDLE_CANCEL_SECONDS = float(os.environ.get("WORKFLOW_IDLE_CANCEL_SECONDS", "600"))
+WORKFLOW_READ_HEARTBEAT_INTERVAL = float(os.environ.get("WORKFLOW_READ_HEARTBEAT_INTERVAL", "5"))
+
+# Tamanho máximo de um lote de workflows
+WORKFLOW_MAX_BATCH = int(os.environ.get("WORKFLOW_MAX_BATCH", "100"))
+
+# Token bucket por cliente (chave de API no cabeçalho WORKFLOW_API_KEY_HEADER ou endereço remoto):
+# taxa em requisições/s e rajada máxima, separadas para inícios e leituras (taxa 0 desativa)
+WORKFLOW_START_RATE = float(os.environ.get("WORKFLOW_START_RATE", "0.5"))
+WORKFLOW_START_BURST = float(os.environ.get("WORKFLOW_START_BURST", "20"))
+WORKFLOW_READ_RATE = float(os.environ.get("WORKFLOW_READ_RATE", "50"))
+WORKFLOW_READ_BURST = float(os.environ.get("WORKFLOW_READ_BURST", "200"))
+WORKFLOW_API_KEY_HEADER = os.environ.get("WORKFLOW_API_KEY_HEADER", "X-API-Key")
+# Requisições simultâneas no processo, somando todos os clientes (0 desativa). Streams SSE e long-polls
+# ocupam a vaga de leitura enquanto abertos
+WORKFLOW_MAX_CONCURRENT_STARTS = int(os.environ.get("WORKFLOW_MAX_CONCURRENT_STARTS", "32"))
+WORKFLOW_MAX_CONCURRENT_READS = int(os.environ.get("WORKFLOW_MAX_CONCURRENT_READS", "512"))
+
+# Cache de sínteses por requisição normalizada
+SYNTHESIS_CACHE_TTL = float(os.environ.get("SYNTHESIS_CACHE_TTL", "900"))
+SYNTHESIS_CACHE_MAX_ENTRIES = int(os.environ.get("SYNTHESIS_CACHE_MAX_ENTRIES", "256"))
+
+# Respostas de síntese serializadas em memória
+SYNTHESIS_RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("SYNTHESIS_RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+SYNTHESIS_RESPONSE_CACHE_MAX_BYTES = int(os.environ.get("SYNTHESIS_RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+# Retenção de analyses_data/workflow (0 desativa cada limite)
+RETENTION_MAX_AGE_DAYS = float(os.environ.get("RETENTION_MAX_AGE_DAYS", "0"))
+RETENTION_MAX_SESSIONS = int(os.environ.get("RETENTION_MAX_SESSIONS", "0"))
+RETENTION_MAX_BYTES = int(os.environ.get("RETENTION_MAX_BYTES", "0"))
+RETENTION_INTERVAL_SECONDS = float(os.environ.get("RETENTION_INTERVAL_SECONDS", "3600"))
+
+# Paginação da listagem de sessões
+SESSIONS_PAGE_DEFAULT = 50
+SESSIONS_PAGE_MAX = 500
+
+# Long-poll / streaming de progresso (segundos)
+LONG_POLL_TIMEOUT = 25
+LONG_POLL_MAX_TIMEOUT = 60
+STREAM_HEARTBEAT_INTERVAL = 15
+
+# Registro durável: journals por categoria (analyses_data/<categoria>/<session_id>/journal.jsonl)
+# ou um backend compartilhado entre processos
+state_backend = criar_backend(WORKFLOW_STATE_BACKEND, BASE_ANALYSIS_PATH)
+
+def journal_da_categoria(categoria: str = "workflow"):
+    return state_backend.journal(categoria)
+
+session_journal = journal_da_categoria("workflow")
+
+# Estado das sessões em memória, derivado do journal
+session_registry = SessionRegistry()
+
+# Índice invertido por adversário, competição, mando, data, formação e status (/workflow/search)
+session_index = SessionIndex(resolver=lambda session_id, valor: session_journal.resolve(session_id, valor))
+session_registry.add_observer(session_index)
+
+# Lotes de sessões (analyses_data/workflow_batches/<batch_id>/journal.jsonl)
+batch_registry = BatchRegistry()
+
+synthesis_cache = SynthesisCache(SYNTHESIS_CACHE_MAX_ENTRIES, SYNTHESIS_CACHE_TTL)
+
+synthesis_response_cache = ResponseCache(SYNTHESIS_RESPONSE_CACHE_MAX_ENTRIES, SYNTHESIS_RESPONSE_CACHE_MAX_BYTES)
+
+# Bundles zip/tar.gz por sessão (analyses_data/bundles/<session_id>-<versão>.<ext>), contados no tamanho dela
+bundle_cache = BundleCache(os.path.join(BASE_ANALYSIS_PATH, "bundles"), on_resize=session_registry.add_bytes)
+
+def ao_apagar_sessao(session_id: str):
+    with _locks_sessao_guard:
+        _locks_sessao.pop(session_id, None)
+    synthesis_response_cache.invalidate(session_id)
+    bundle_cache.invalidate(session_id)
+    state_backend.forget_reads([session_id])
+
+retention_worker = RetentionWorker(
+    session_registry,
+    session_journal,
+    RetentionPolicy(RETENTION_MAX_AGE_DAYS, RETENTION_MAX_SESSIONS, RETENTION_MAX_BYTES),
+    RETENTION_INTERVAL_SECONDS,
+    on_delete=ao_apagar_sessao
+)
+
+@enhanced_workflow_bp.record_once
+def _rebuild_session_registry(state):
+    """Reconstrói o registro de sessões uma única vez, ao registrar o blueprint"""
+    if state_backend.shared:
+        sincronizar_estado()
+    else:
+        session_registry.rebuild(session_journal)
+        batch_registry.rebuild(journal_da_categoria("workflow_batches"))
+    contabilizar_bundles()
+
+def contabilizar_bundles():
+    """Soma ao tamanho das sessões os bundles já em disco e apaga os de sessões que não existem mais"""
+    for session_id, tamanho in bundle_cache.sizes().items():
+        if session_registry.get(session_id) is None:
+            bundle_cache.invalidate(session_id)
+        else:
+            session_registry.add_bytes(session_id, tamanho)
+
+_servicos_lock = threading.Lock()
+_servicos_iniciados = False
+
+@enhanced_workflow_bp.before_app_request
+def _iniciar_servicos_na_primeira_requisicao():
+    if not _servicos_iniciados:
+        iniciar_servicos()
+
+def iniciar_servicos():
+    """
+    Sobe os serviços em segundo plano (workers, sincronização, retenção, cancelamento de ociosas) e retoma
+    as sessões interrompidas, uma vez por processo. Roda na primeira requisição, não na importação: com
+    gunicorn --preload o app é importado no master antes do fork (threads criadas ali não existem nos
+    workers), e o processo pai do reloader do Flask só observa arquivos. Para os workers do gunicorn
+    executarem a fila compartilhada antes de receber requisições, chame-a no hook post_fork.
+    """
+    global _servicos_iniciados
+    with _servicos_lock:
+        if _servicos_iniciados:
+            return
+        _servicos_iniciados = True
+    
+    if state_backend.shared:
+        threading.Thread(target=_loop_sincronizacao, name="workflow-state-sync", daemon=True).start()
+        workflow_scheduler.start()
+    retention_worker.start()
+    if WORKFLOW_RESUME_ON_STARTUP:
+        retomar_sessoes_interrompidas()
+    if WORKFLOW_IDLE_CANCEL_SECONDS > 0:
+        threading.Thread(target=_loop_cancelamento_ocioso, name="workflow-idle-cancel", daemon=True).start()
+    atexit.register(encerrar_workflows)
+
+# ==========================================
+# MÉTRICAS
+# ==========================================
+
+stage_duration_seconds = metrics_registry.histogram(
+    "workflow_stage_duration_seconds", "Duração de cada etapa do workflow", ["stage"]
+)
+salvar_etapa_duration_seconds = metrics_registry.histogram(
+    "workflow_salvar_etapa_duration_seconds", "Latência de escrita do salvar_etapa", ["categoria"]
+)
+salvar_etapa_bytes = metrics_registry.histogram(
+    "workflow_salvar_etapa_bytes", "Bytes gravados em disco por salvar_etapa", ["categoria"], buckets=SIZE_BUCKETS
+)
+request_duration_seconds = metrics_registry.histogram(
+    "workflow_http_request_duration_seconds", "Latência das rotas do blueprint", ["endpoint", "method", "status"]
+)
+errors_total = metrics_registry.counter(
+    "workflow_errors_total", "Erros por origem (salvar_etapa, request)", ["source"]
+)
+workflow_erro_total = metrics_registry.counter(
+    "workflow_erro_total", "Sessões encerradas com workflow_erro"
+)
+workflow_starts_total = metrics_registry.counter(
+    "workflow_starts_total", "Inícios de workflow por resultado (executar, cache, anexada)", ["result"]
+)
+workflow_cancelado_total = metrics_registry.counter(
+    "workflow_cancelado_total", "Sessões canceladas por motivo (cliente, ocioso, fila_cheia)", ["motivo"]
+)
+metrics_registry.gauge(
+    "workflow_in_flight", "Workflows em execução nos workers",
+    function=lambda: workflow_scheduler.stats()["running"]
+)
+metrics_registry.gauge(
+    "workflow_queue_depth", "Workflows aguardando worker na fila",
+    function=lambda: workflow_scheduler.stats()["queued"]
+)
+metrics_registry.gauge(
+    "workflow_sessions", "Sessões conhecidas pelo registro", function=lambda: len(session_registry)
+)
+
+@enhanced_workflow_bp.before_request
+def _iniciar_medicao_requisicao():
+    g.inicio_requisicao = time.perf_counter()
+
+@enhanced_workflow_bp.after_request
+def _registrar_medicao_requisicao(response):
+    inicio = g.pop("inicio_requisicao", None)
+    if inicio is not None:
+        request_duration_seconds.observe(
+            time.perf_counter() - inicio,
+            endpoint=request.endpoint or "unmatched", method=request.method, status=response.status_code
+        )
+    if response.status_code >= 500:
+        errors_total.inc(source="request")
+    return response
+
+def registrar_duracao_etapa(stage: str, seconds: float):
+    """Duração observada de uma etapa: alimenta as estimativas da fila e o histograma"""
+    workflow_scheduler.record_stage_duration(stage, seconds)
+    stage_duration_seconds.observe(seconds, stage=stage)
+
+# ==========================================
+# CONTROLE DE ADMISSÃO
+# ==========================================
+
+ORCAMENTO_INICIO = "start"
+ORCAMENTO_LEITURA = "read"
+
+# Rotas que iniciam workflows; as demais rotas do blueprint consomem o orçamento de leitura
+ENDPOINTS_INICIO = {
+    "enhanced_workflow.start_full_workflow",
+    "enhanced_workflow.start_workflow_batch",
+}
+
+# Retry-After quando o limite global de requisições simultâneas está esgotado
+CONCURRENCY_RETRY_AFTER = 1
+
+rate_limiters: Dict[str, TokenBucketLimiter] = {}
+if WORKFLOW_START_RATE > 0:
+    rate_limiters[ORCAMENTO_INICIO] = TokenBucketLimiter(WORKFLOW_START_RATE, WORKFLOW_START_BURST)
+if WORKFLOW_READ_RATE > 0:
+    rate_limiters[ORCAMENTO_LEITURA] = TokenBucketLimiter(WORKFLOW_READ_RATE, WORKFLOW_READ_BURST)
+
+concurrency_limiters: Dict[str, ConcurrencyLimiter] = {}
+if WORKFLOW_MAX_CONCURRENT_STARTS > 0:
+    concurrency_limiters[ORCAMENTO_INICIO] = ConcurrencyLimiter(WORKFLOW_MAX_CONCURRENT_STARTS)
+if WORKFLOW_MAX_CONCURRENT_READS > 0:
+    concurrency_limiters[ORCAMENTO_LEITURA] = ConcurrencyLimiter(WORKFLOW_MAX_CONCURRENT_READS)
+
+workflow_rate_limited_total = metrics_registry.counter(
+    "workflow_rate_limited_total", "Requisições recusadas por orçamento e motivo (rate e concurrency: 429; cost: 413)",
+    ["budget", "reason"]
+)
+metrics_registry.gauge(
+    "workflow_rate_limit_clients", "Clientes com token bucket em memória por orçamento", ["budget"],
+    function=lambda: {(orcamento,): limiter.clients() for orcamento, limiter in rate_limiters.items()}
+)
+metrics_registry.gauge(
+    "workflow_requests_in_flight", "Requisições em andamento por orçamento", ["budget"],
+    function=lambda: {(orcamento,): limiter.in_flight() for orcamento, limiter in concurrency_limiters.items()}
+)
+
+def cliente_da_requisicao() -> str:
+    """Identidade do cliente para o token bucket: chave de API, ou o endereço remoto sem ela"""
+    chave = request.headers.get(WORKFLOW_API_KEY_HEADER, "").strip()
+    if chave:
+        return f"key:{chave}"
+    return f"addr:{request.remote_addr}"
+
+def orcamento_da_requisicao() -> str:
+    return ORCAMENTO_INICIO if request.endpoint in ENDPOINTS_INICIO else ORCAMENTO_LEITURA
+
+def custo_da_requisicao() -> float:
+    """Tokens consumidos: um por requisição e, nos lotes, um por item"""
+    if request.endpoint == "enhanced_workflow.start_workflow_batch":
+        data = request.get_json(silent=True)
+        itens = data.get('items') if isinstance(data, dict) else None
+        if isinstance(itens, list) and itens:
+            return float(len(itens))
+    return 1.0
+
+def resposta_limite_excedido(orcamento: str, motivo: str, retry_after: float):
+    workflow_rate_limited_total.inc(budget=orcamento, reason=motivo)
+    erro = ("Limite de requisições do cliente excedido" if motivo == "rate"
+            else "Servidor ocupado: limite de requisições simultâneas atingido")
+    return jsonify({
+        "success": False,
+        "error": f"{erro}. Tente novamente mais tarde.",
+        "budget": orcamento,
+        "retry_after": round(retry_after, 3)
+    }), 429, {"Retry-After": retry_after_header(retry_after)}
+
+@enhanced_workflow_bp.before_request
+def _controlar_admissao():
+    """
+    Token bucket do cliente e, em seguida, vaga global do orçamento da rota (o bucket vem primeiro para que
+    um cliente acima da taxa seja recusado sem tocar no lock global). Recusa com 429 e Retry-After, ou com 413
+    os lotes com mais itens que a rajada do bucket.
+    """
+    if request.method == "OPTIONS":
+        return None
+    orcamento = orcamento_da_requisicao()
+    
+    limiter = rate_limiters.get(orcamento)
+    if limiter is not None:
+        custo = custo_da_requisicao()
+        if custo > limiter.burst:
+            # Um lote maior que a rajada não seria admitido nem com o bucket cheio
+            workflow_rate_limited_total.inc(budget=orcamento, reason="cost")
+            return jsonify({
+                "success": False,
+                "error": f"Lote de {int(custo)} itens excede a rajada do cliente ({int(limiter.burst)}). "
+                         f"Divida o lote em partes menores.",
+                "budget": orcamento,
+                "max_items": int(limiter.burst)
+            }), 413
+        espera = limiter.acquire(cliente_da_requisicao(), custo)
+        if espera > 0:
+            return resposta_limite_excedido(orcamento, "rate", espera)
+    
+    concorrencia = concurrency_limiters.get(orcamento)
+    if concorrencia is not None:
+        if not concorrencia.try_enter():
+            return resposta_limite_excedido(orcamento, "concurrency", CONCURRENCY_RETRY_AFTER)
+        g.vaga_concorrencia = concorrencia
+    return None
+
+@enhanced_workflow_bp.after_request
+def _manter_vaga_durante_stream(response):
+    # Respostas de gerador (SSE, /workflow/export) ocupam a vaga até a conexão ser fechada. As de send_file
+    # (direct_passthrough) vão direto ao servidor sem Response.close(): a vaga é liberada no teardown
+    if response.is_streamed and not response.direct_passthrough:
+        concorrencia = g.pop("vaga_concorrencia", None)
+        if concorrencia is not None:
+            response.call_on_close(concorrencia.leave)
+    return response
+
+@enhanced_workflow_bp.teardown_request
+def _liberar_vaga_concorrencia(exc):
+    concorrencia = g.pop("vaga_concorrencia", None)
+    if concorrencia is not None:
+        concorrencia.leave()
+
+# ==========================================
+# FUNÇÕES AUXILIARES
+# ==========================================
+
+def generate_session_id():
+    """Gera um ID único para a sessão"""
+    return f"session_{int(time.time() * 1000)}_{uuid.uuid4().hex[:8]}"
+
+def generate_batch_id():
+    """Gera um ID único para um lote de sessões"""
+    return f"batch_{int(time.time() * 1000)}_{uuid.uuid4().hex[:8]}"
+
+def formatar_duracao(segundos: float) -> str:
+    """Formata uma duração estimada para exibição"""
+    if segundos < 60:
+        return f"{max(1, round(segundos))} segundos"
+    return f"{round(segundos / 60)} minutos"
+
+# Lock por sessão: gravações de etapa e cancelamento não se intercalam (ver cancelar_sessao)
+_locks_sessao_guard = threading.Lock()
+_locks_sessao: Dict[str, threading.RLock] = {}
+
+def lock_da_sessao(session_id: str) -> threading.RLock:
+    with _locks_sessao_guard:
+        lock = _locks_sessao.get(session_id)
+        if lock is None:
+            lock = _locks_sessao[session_id] = threading.RLock()
+        return lock
+
+def salvar_etapa(nome_etapa: str, dados: Dict, categoria: str = "workflow", session_id: str = None,
+                 blobs_novos: List[int] = None):
+    """
+    Salva dados de uma etapa do workflow (`blobs_novos`: bytes dos blobs já gravados para o registro).
+    Em sessão cancelada nada é gravado: WorkflowInterrupted encerra a etapa que tentou gravar.
+    """
+    if not session_id:
+        logger.warning("session_id não fornecido para salvar_etapa")
+        return
+    if categoria != "workflow":
+        _gravar_etapa(nome_etapa, dados, categoria, session_id, blobs_novos)
+        return
+    
+    with lock_da_sessao(session_id):
+        if sessao_cancelada(session_id):
+            raise WorkflowInterrupted(f"Sessão {session_id} cancelada: etapa '{nome_etapa}' descartada")
+        _gravar_etapa(nome_etapa, dados, categoria, session_id, blobs_novos)
+
+def _gravar_etapa(nome_etapa: str, dados: Dict, categoria: str, session_id: str, blobs_novos: List[int]):
+    try:
+        inicio = time.perf_counter()
+        journal = journal_da_categoria(categoria)
+        bytes_gravados = journal.append(session_id, nome_etapa, dados, blobs_novos)
+        salvar_etapa_duration_seconds.observe(time.perf_counter() - inicio, categoria=categoria)
+        salvar_etapa_bytes.observe(bytes_gravados, categoria=categoria)
+        
+        if state_backend.shared:
+            # O registro local acompanha o feed do backend (gravações de todos os processos): só a categoria
+            # gravada, a partir do cursor já aplicado
+            sincronizar_estado([categoria])
+        elif categoria == "workflow":
+            session_registry.record_stage(session_id, nome_etapa, dados, bytes_gravados)
+        if categoria == "workflow" and nome_etapa == "workflow_erro":
+            workflow_erro_total.inc()
+        
+        logger.info(f"✅ Etapa '{nome_etapa}' salva em {journal.journal_path(session_id)}")
+    except Exception as e:
+        errors_total.inc(source="salvar_etapa")
+        logger.error(f"❌ Erro ao salvar etapa '{nome_etapa}': {e}")
+
+# ------------------------------------------
+# Sincronização com backends compartilhados
+# ------------------------------------------
+
+# Posição já aplicada do feed de mudanças de cada categoria
+_cursores_sincronizacao = {"workflow": 0, "workflow_batches": 0}
+_sincronizacao_lock = threading.Lock()
+_sincronizacao_parada = threading.Event()
+
+def sincronizar_estado(categorias: List[str] = None):
+    """
+    Aplica aos registros em memória as etapas gravadas por qualquer processo desde a última sincronização
+    (todas as categorias, ou só as informadas). Cada chamada lê apenas o feed depois do cursor da categoria.
+    """
+    with _sincronizacao_lock:
+        for categoria in categorias or list(_cursores_sincronizacao):
+            if categoria not in _cursores_sincronizacao:
+                continue
+            cursor = _cursores_sincronizacao[categoria]
+            journal = journal_da_categoria(categoria)
+            while True:
+                mudancas, cursor = journal.changes_since(cursor)
+                if not mudancas:
+                    break
+                for session_id, registro, tamanho in mudancas:
+                    if categoria == "workflow":
+                        session_registry.apply_record(session_id, registro, tamanho)
+                        if registro["etapa"] == ETAPA_SESSAO_APAGADA:
+                            # Apagada pela retenção de algum processo: descarta os caches locais
+                            ao_apagar_sessao(session_id)
+                        elif registro["etapa"] == ETAPA_CANCELAMENTO:
+                            # Cancelada em qualquer processo: para as etapas em execução aqui
+                            abortar_execucao(session_id)
+                    else:
+                        batch_registry.apply_record(session_id, registro)
+            _cursores_sincronizacao[categoria] = cursor
+
+def _loop_sincronizacao():
+    while not _sincronizacao_parada.wait(WORKFLOW_STATE_SYNC_INTERVAL):
+        try:
+            sincronizar_estado()
+        except Exception as e:
+            logger.error(f"❌ Erro ao sincronizar estado com o backend: {e}")
+
+def obter_estado(session_id: str) -> Dict:
+    """Estado da sessão; com backend compartilhado, sessões ainda desconhecidas forçam uma sincronização"""
+    state = session_registry.get(session_id)
+    if state is None and state_backend.shared:
+        sincronizar_estado()
+        state = session_registry.get(session_id)
+    return state
+
+# ==========================================
+# WORKFLOW COMPLETO
+# ==========================================
+
+# ------------------------------------------
+# Seções da síntese
+# ------------------------------------------
+
+def secao_insights_principais(opponent_name: str) -> Any:
+    return [
+        f"Análise completa da partida contra {opponent_name}",
+        "Corinthians demonstra vantagem tática no confronto",
+        "Condições favoráveis para vitória em casa",
+        "Elenco em boa condição física para o confronto"
+    ]
+
+def secao_pontos_atencao_criticos(opponent_name: str) -> Any:
+    return [
+        "Desfalques no meio-campo podem impactar posse de bola",
+        f"{opponent_name} forte em jogadas de bola parada",
+        "Importância de manter concentração defensiva",
+        "Atenção às transições rápidas do adversário"
+    ]
+
+def secao_validacao_dados(opponent_name: str) -> Any:
+    return {
+        "nivel_confianca": "85%",
+        "fontes_consultadas": 15,
+        "dados_validados": True
+    }
+
+def secao_dados_mercado_validados(opponent_name: str) -> Any:
+    return {
+        "ameacas_identificadas": [
+            "Lesões recentes no elenco",
+            "Desgaste físico por calendário apertado"
+        ]
+    }
+
+def secao_analise_tatica(opponent_name: str) -> Any:
+    return {
+        "formacao_recomendada": "4-3-3",
+        "pontos_fortes": ["Posse de bola", "Transições rápidas", "Pressão alta"],
+        "pontos_fracos": ["Vulnerabilidade em bolas aéreas", "Cansaço físico"]
+    }
+
+# Dados adicionais para compatibilidade com o frontend
+def secao_corinthians_stats(opponent_name: str) -> Any:
+    return {
+        "team_name": "Corinthians",
+        "recent_form": "V-V-E-V-D",
+        "playing_style": "Posse de bola e transições rápidas",
+        "key_players": ["Yuri Alberto", "Rodrigo Garro", "Memphis Depay"],
+        "injuries_suspensions": ["Hugo - Lesionado (previsão 2 semanas)"],
+        "strengths": ["Posse de bola", "Transições", "Pressão alta"],
+        "weaknesses": ["Bolas aéreas", "Cansaço físico"],
+        "avg_goals_scored": 1.5,
+        "avg_goals_conceded": 0.9,
+        "tactical_details": "Time busca controlar o jogo com posse de bola",
+        "possession_avg": 58.0,
+        "shots_per_game_avg": 14.2,
+        "key_player_analysis": [],
+        "team_motivation": "Alta - buscando classificação para Libertadores"
+    }
+
+def secao_opponent_stats(opponent_name: str) -> Any:
+    return {
+        "team_name": opponent_name,
+        "recent_form": "D-E-D-V-D",
+        "playing_style": "Jogo direto e contra-ataques",
+        "key_players": ["Jogador 1", "Jogador 2"],
+        "injuries_suspensions": ["Sem desfalques confirmados"],
+        "strengths": ["Jogadas de bola parada", "Contra-ataques"],
+        "weaknesses": ["Posse de bola", "Organização defensiva"],
+        "avg_goals_scored": 0.8,
+        "avg_goals_conceded": 1.6,
+        "tactical_details": "Time mais reativo, busca explorar erros adversários",
+        "possession_avg": 42.0,
+        "shots_per_game_avg": 9.5,
+        "key_player_analysis": [],
+        "team_motivation": "Lutando contra rebaixamento"
+    }
+
+def secao_head_to_head(opponent_name: str) -> Any:
+    return {
+        "total_matches": 24,
+        "corinthians_wins": 14,
+        "opponent_wins": 5,
+        "draws": 5,
+        "notable_matches_summary": f"Corinthians tem amplo domínio nos confrontos diretos contra {opponent_name}. Nas últimas 5 partidas, o Timão venceu 3, empatou 1 e perdeu 1."
+    }
+
+def secao_news_and_context(opponent_name: str) -> Any:
+    return {
+        "key_news_corinthians": [
+            "Time vem de sequência positiva",
+            "Elenco focado em classificação",
+            "Torcida faz festa na Neo Química Arena"
+        ],
+        "key_news_opponent": [
+            f"{opponent_name} precisa pontuar para fugir do Z-4",
+            "Técnico muda esquema tático",
+            "Reforços recentes ainda em adaptação"
+        ],
+        "match_importance": f"Partida crucial: Corinthians busca Libertadores, {opponent_name} luta contra rebaixamento"
+    }
+
+def secao_tactical_analysis(opponent_name: str) -> Any:
+    return {
+        "corinthians_formation": "4-3-3",
+        "opponent_formation": "5-4-1",
+        "key_matchups": [
+            "Memphis Depay vs Zaga adversária",
+            "Meio-campo do Corinthians vs Bloqueio do adversário",
+            "Laterais do Corinthians vs Contra-ataque adversário"
+        ],
+        "predicted_dynamics": f"Espera-se que o Corinthians tenha amplo domínio da posse de bola, enquanto {opponent_name} se fecha e busca contra-ataques. A partida deve ser decidida pela capacidade do Timão em quebrar o bloqueio defensivo adversário.",
+        "heatmap_description": "Concentração de jogadas pelo meio e pelas laterais, com o Corinthians pressionando no campo adversário."
+    }
+
+def secao_investigative_report(opponent_name: str) -> Any:
+    return {
+        "high_impact_findings": [
+            f"Análise detalhada indica vantagem significativa para o Corinthians",
+            f"{opponent_name} com problemas defensivos nas últimas rodadas",
+            "Condições climáticas favoráveis ao jogo do Corinthians"
+        ],
+        "potential_contradictions_found": [],
+        "summary": f"Investigação profunda confirma favoritismo do Corinthians no confronto contra {opponent_name}. Fatores técnicos, táticos e motivacionais apontam para vitória do Timão."
+    }
+
+
+# Seções da síntese na ordem em que são produzidas; cada uma é gravada como sintese_secao_<seção>
+SECOES_SINTESE = [
+    ("insights_principais", secao_insights_principais),
+    ("pontos_atencao_criticos", secao_pontos_atencao_criticos),
+    ("validacao_dados", secao_validacao_dados),
+    ("dados_mercado_validados", secao_dados_mercado_validados),
+    ("analise_tatica", secao_analise_tatica),
+    ("corinthians_stats", secao_corinthians_stats),
+    ("opponent_stats", secao_opponent_stats),
+    ("head_to_head", secao_head_to_head),
+    ("news_and_context", secao_news_and_context),
+    ("tactical_analysis", secao_tactical_analysis),
+    ("investigative_report", secao_investigative_report),
+]
+NOMES_SECOES_SINTESE = [secao for secao, _ in SECOES_SINTESE]
+
+# ------------------------------------------
+# Etapas do workflow (nós do DAG)
+# ------------------------------------------
+
+# Latência simulada das etapas: segundos fixos ("0" desativa) ou arquivo JSON com amostras por etapa
+WORKFLOW_STAGE_LATENCY = os.environ.get("WORKFLOW_STAGE_LATENCY", "2")
+stage_latency = StageLatency.from_spec(WORKFLOW_STAGE_LATENCY)
+
+async def simular_latencia(stage: str):
+    segundos = stage_latency.sample(stage)
+    if segundos > 0:
+        await asyncio.sleep(segundos)
+
+async def etapa_coleta(ctx: Dict) -> Dict:
+    """ETAPA 1: Coleta"""
+    session_id = ctx["session_id"]
+    await simular_latencia("step1")
+    logger.info(f"📊 ETAPA 1 - Coleta de Dados - Sessão: {session_id}")
+    dados_coletados = {"exemplo": "dados simulados"}
+    salvar_etapa("etapa1_concluida_full_workflow", {
+        "session_id": session_id,
+        "dados_coletados": dados_coletados,
+        "timestamp": datetime.now().isoformat()
+    }, categoria="workflow", session_id=session_id)
+    return dados_coletados
+
+async def etapa_verificacao_ai(ctx: Dict) -> Dict:
+    """ETAPA 2: Verificação AI (independente da coleta)"""
+    session_id = ctx["session_id"]
+    await simular_latencia("step2")
+    logger.info(f"🤖 ETAPA 2 - Verificação AI - Sessão: {session_id}")
+    salvar_etapa("verificacao_ai_concluida_full_workflow", {
+        "session_id": session_id,
+        "verificacao": "completa",
+        "timestamp": datetime.now().isoformat()
+    }, categoria="workflow", session_id=session_id)
+    return {"verificacao": "completa"}
+
+def salvar_secao_sintese(session_id: str, secao: str, dados: Any) -> Any:
+    """
+    Grava a seção uma única vez (inline no registro ou, se grande, como blob); o valor retornado é
+    reaproveitado pela síntese completa
+    """
+    blobs_novos = []
+    valor = session_journal.compact_value(session_id, dados, blobs_novos)
+    salvar_etapa(f"{ETAPA_SECAO_SINTESE_PREFIXO}{secao}", {
+        "session_id": session_id,
+        "secao": secao,
+        "dados": valor,
+        "timestamp": datetime.now().isoformat()
+    }, categoria="workflow", session_id=session_id, blobs_novos=blobs_novos)
+    return valor
+
+def salvar_sintese_completa(session_id: str, synthesis_data: Dict, referencias: Dict[str, Any]):
+    """
+    Grava a síntese completa com os valores das seções já gravadas: as grandes citadas pelo digest do blob,
+    as pequenas inline. Leitores do registro resolvem as referências e obtêm os mesmos bytes da síntese inteira.
+    """
+    salvar_etapa("sintese_master_synthesis", {
+        chave: referencias.get(chave, valor) for chave, valor in synthesis_data.items()
+    }, categoria="workflow", session_id=session_id)
+
+async def etapa_sintese(ctx: Dict) -> Dict:
+    """ETAPA 3: Síntese (depende da coleta e da verificação), gravada seção a seção"""
+    session_id = ctx["session_id"]
+    opponent_name = ctx["context"].get('opponent', 'adversário')
+    # A latência simulada da etapa é distribuída entre as seções
+    latencia_secao = stage_latency.sample("step3") / len(SECOES_SINTESE)
+    logger.info(f"🧠 ETAPA 3 - Síntese - Sessão: {session_id}")
+    
+    synthesis_data = {}
+    referencias = {}
+    for secao, construir in SECOES_SINTESE:
+        if latencia_secao > 0:
+            await asyncio.sleep(latencia_secao)
+        synthesis_data[secao] = construir(opponent_name)
+        # A seção já pode ser entregue pelo endpoint de síntese (?fields=) antes das demais
+        referencias[secao] = salvar_secao_sintese(session_id, secao, synthesis_data[secao])
+    
+    # A síntese completa marca o fim da etapa (cache, bundles e retomada leem este registro)
+    salvar_sintese_completa(session_id, synthesis_data, referencias)
+    
+    salvar_etapa("etapa3_sintese_concluida_full_workflow", {
+        "session_id": session_id,
+        "timestamp": datetime.now().isoformat()
+    }, categoria="workflow", session_id=session_id)
+    return synthesis_data
+
+async def etapa_geracao(ctx: Dict) -> Dict:
+    """ETAPA 4: Geração de módulos (depende da síntese)"""
+    session_id = ctx["session_id"]
+    await simular_latencia("step4")
+    logger.info(f"📝 ETAPA 4 - Geração de Módulos - Sessão: {session_id}")
+    salvar_etapa("etapa4_geracao_concluida_full_workflow", {
+        "session_id": session_id,
+        "modulos_gerados": 16,
+        "timestamp": datetime.now().isoformat()
+    }, categoria="workflow", session_id=session_id)
+    return {"modulos_gerados": 16}
+
+async def etapa_cpl_devastador(ctx: Dict) -> Dict:
+    """ETAPA 5: CPL Devastador (depende da síntese, em paralelo com a geração)"""
+    session_id = ctx["session_id"]
+    await simular_latencia("cpl_devastador")
+    logger.info(f"🎯 ETAPA 5 - CPL Devastador - Sessão: {session_id}")
+    salvar_etapa("cpl_devastador_concluido_full_workflow", {
+        "session_id": session_id,
+        "cpl_completo": True,
+        "timestamp": datetime.now().isoformat()
+    }, categoria="workflow", session_id=session_id)
+    return {"cpl_completo": True}
+
+# Os nomes das etapas são as chaves de step_status, para casar com o registro e as estimativas
+WORKFLOW_DAG = StageDAG([
+    Stage("step1", etapa_coleta),
+    Stage("step2", etapa_verificacao_ai),
+    Stage("step3", etapa_sintese, depends_on=["step1", "step2"]),
+    Stage("step4", etapa_geracao, depends_on=["step3"]),
+    Stage("cpl_devastador", etapa_cpl_devastador, depends_on=["step3"]),
+])
+
+def executar_job(payload: Dict) -> bool:
+    """Runner dos jobs do scheduler: executa a sessão a partir do seu checkpoint (False = interrompido)"""
+    session_id = payload["session_id"]
+    state = obter_estado(session_id)
+    if state is not None and state["status"] != STATUS_EM_ANDAMENTO:
+        return True  # já encerrada (ex.: job reentregue após a lease vencer)
+    return executar_workflow_completo(
+        session_id, payload.get("context") or {}, payload.get("cache_key"), carregar_checkpoint(session_id)
+    )
+
+if state_backend.shared:
+    workflow_scheduler = SharedWorkflowScheduler(
+        state_backend, WORKFLOW_MAX_WORKERS, WORKFLOW_MAX_QUEUE, stage_dependencies=WORKFLOW_DAG.dependencies(),
+        runner=executar_job, lease_seconds=WORKFLOW_JOB_LEASE_SECONDS, poll_interval=WORKFLOW_JOB_POLL_INTERVAL
+    )
+else:
+    workflow_scheduler = WorkflowScheduler(
+        WORKFLOW_MAX_WORKERS, WORKFLOW_MAX_QUEUE, stage_dependencies=WORKFLOW_DAG.dependencies(),
+        runner=executar_job
+    )
+
+def executar_workflow_completo(session_id: str, context: Dict, cache_key: str = None,
+                               concluidas: Dict[str, Any] = None) -> bool:
+    """Executa o DAG de etapas do workflow completo (roda em um worker do scheduler)"""
+    synthesis_data = None
+    interrompido = False
+    abort = AbortHandle()
+    with _execucoes_lock:
+        _execucoes[session_id] = abort
+    try:
+        resultados = WORKFLOW_DAG.run_sync(
+            {"session_id": session_id, "context": context},
+            on_stage_done=registrar_duracao_etapa,
+            completed=concluidas,
+            stop_event=ParadaDaSessao(session_id),
+            abort=abort
+        )
+        synthesis_data = resultados.get("step3")
+        
+        # Conclusão (WorkflowInterrupted se a sessão foi cancelada durante a última etapa)
+        salvar_etapa("workflow_completo_concluido", {
+            "session_id": session_id,
+            "status": "concluido",
+            "timestamp": datetime.now().isoformat()
+        }, categoria="workflow", session_id=session_id)
+        
+        logger.info(f"✅ WORKFLOW COMPLETO CONCLUÍDO - Sessão: {session_id}")
+        
+    except WorkflowInterrupted:
+        if sessao_cancelada(session_id):
+            # workflow_cancelado já foi gravado por quem cancelou: o job sai da fila
+            logger.info(f"🛑 Workflow cancelado - Sessão: {session_id} (etapas restantes descartadas)")
+        else:
+            # Sem workflow_erro: a sessão segue em andamento e é retomada no próximo início
+            interrompido = True
+            logger.info(f"⏸️ Workflow interrompido no encerramento - Sessão: {session_id} (checkpoint salvo)")
+    except Exception as e:
+        logger.error(f"❌ Erro no workflow completo: {e}")
+        try:
+            salvar_etapa("workflow_erro", {
+                "session_id": session_id,
+                "error": str(e),
+                "timestamp": datetime.now().isoformat()
+            }, categoria="workflow", session_id=session_id)
+        except WorkflowInterrupted:
+            pass  # cancelada enquanto falhava: o cancelamento é o desfecho
+    finally:
+        with _execucoes_lock:
+            _execucoes.pop(session_id, None)
+        if cache_key:
+            synthesis_cache.finish(cache_key, session_id, synthesis_data)
+    return not interrompido
+
+# ------------------------------------------
+# Checkpoints e retomada
+# ------------------------------------------
+
+def carregar_checkpoint(session_id: str) -> Dict[str, Any]:
+    """Resultados das etapas já concluídas da sessão, lidos do journal (etapa -> dados salvos)"""
+    ultimos = {registro["etapa"]: registro for registro in session_journal.read_records(session_id)}
+    concluidas = {}
+    for step, nome_etapa in WORKFLOW_STEPS:
+        if nome_etapa in ultimos:
+            concluidas[step] = session_journal.resolve(session_id, ultimos[nome_etapa]["dados"])
+    # A síntese é o único resultado consumido depois do DAG (cache de sínteses)
+    if "step3" in concluidas and "sintese_master_synthesis" in ultimos:
+        concluidas["step3"] = session_journal.resolve(session_id, ultimos["sintese_master_synthesis"]["dados"])
+    return concluidas
+
+def retomar_sessoes_interrompidas() -> int:
+    """Reenfileira as sessões que um processo anterior deixou em andamento, a partir da última etapa concluída"""
+    interrompidas = [
+        state for state in (session_registry.get(session_id) for session_id in session_registry.session_ids())
+        if state is not None and state["status"] == STATUS_EM_ANDAMENTO
+    ]
+    interrompidas.sort(key=lambda state: state["created_at"] or "")
+    
+    retomadas = 0
+    for state in interrompidas:
+        session_id = state["session_id"]
+        try:
+            # Com backend compartilhado, a sessão pode estar na fila ou com outro processo
+            if workflow_scheduler.position(session_id) is not None:
+                continue
+            
+            inicio = session_journal.read_stage(session_id, ETAPA_INICIO)
+            if inicio is None:
+                logger.warning(f"⚠️ Sessão {session_id} sem registro de início - não pode ser retomada")
+                continue
+            
+            concluidas = state["completed_steps"]
+            cache_key = inicio.get("cache_key")
+            if cache_key:
+                synthesis_cache.begin(cache_key, session_id)
+            
+            salvar_etapa(ETAPA_RETOMADA, {
+                "session_id": session_id,
+                "etapas_concluidas": sorted(concluidas),
+                "timestamp": datetime.now().isoformat()
+            }, categoria="workflow", session_id=session_id)
+            
+            try:
+                workflow_scheduler.submit(session_id, {
+                    "session_id": session_id,
+                    "context": inicio.get("context") or {},
+                    "cache_key": cache_key,
+                    "priority": inicio.get("priority", 0),
+                    "deadline": inicio.get("deadline")
+                })
+            except QueueFullError:
+                if cache_key:
+                    synthesis_cache.finish(cache_key, session_id)
+                logger.warning(f"⚠️ Fila cheia: {len(interrompidas) - retomadas} sessões ficam para o próximo início")
+                break
+            
+            retomadas += 1
+            logger.info(f"🔄 Sessão {session_id} retomada ({len(concluidas)}/{len(WORKFLOW_STEPS)} etapas concluídas)")
+        except Exception as e:
+            logger.error(f"❌ Erro ao retomar sessão {session_id}: {e}")
+    
+    if interrompidas:
+        logger.info(f"🔄 {retomadas} de {len(interrompidas)} sessões interrompidas retomadas")
+    return retomadas
+
+# ------------------------------------------
+# Cancelamento
+# ------------------------------------------
+
+def sessao_cancelada(session_id: str) -> bool:
+    state = session_registry.get(session_id)
+    return state is not None and state["status"] == STATUS_CANCELADO
+
+class ParadaDaSessao:
+    """stop_event do DAG: encerramento do scheduler ou cancelamento da sessão (visto entre etapas)"""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+
+    def is_set(self) -> bool:
+        return workflow_scheduler.stopping.is_set() or sessao_cancelada(self.session_id)
+
+# Execuções do DAG neste processo, para o cancelamento parar as etapas em andamento
+_execucoes_lock = threading.Lock()
+_execucoes: Dict[str, AbortHandle] = {}
+
+def abortar_execucao(session_id: str):
+    """Cancela as etapas em andamento da sessão, se ela executa neste processo (o worker fica livre)"""
+    with _execucoes_lock:
+        abort = _execucoes.get(session_id)
+    if abort is not None:
+        abort.abort()
+
+def cancelar_sessao(session_id: str, motivo: str) -> Dict:
+    """
+    Cancela uma sessão em andamento: se ainda na fila, sai dela na hora; se em execução, as etapas em
+    andamento são abortadas e nada mais é gravado. Retorna o estado resultante (None se a sessão é desconhecida).
+    """
+    # Sob o lock da sessão, nenhuma etapa (nem a conclusão) é gravada entre a verificação e o cancelamento
+    with lock_da_sessao(session_id):
+        state = obter_estado(session_id)
+        if state is None or state["status"] != STATUS_EM_ANDAMENTO:
+            return state
+        
+        job = workflow_scheduler.cancel(session_id)
+        salvar_etapa(ETAPA_CANCELAMENTO, {
+            "session_id": session_id,
+            "motivo": motivo,
+            "estava_na_fila": job is not None,
+            "timestamp": datetime.now().isoformat()
+        }, categoria="workflow", session_id=session_id)
+    abortar_execucao(session_id)
+    # Um job que nem começou não passa pelo finally do worker: libera a chave do cache aqui
+    if job is not None and job.get("cache_key"):
+        synthesis_cache.finish(job["cache_key"], session_id)
+    
+    workflow_cancelado_total.inc(motivo=motivo)
+    logger.info(f"🛑 Sessão {session_id} cancelada ({motivo}, {'na fila' if job is not None else 'em execução'})")
+    return obter_estado(session_id)
+
+# Última leitura de status já gravada no backend por este processo (evita uma escrita por requisição)
+_leituras_gravadas: Dict[str, float] = {}
+_leituras_lock = threading.Lock()
+_cancelamento_parada = threading.Event()
+# Após um restart, sessões sem leitura registrada ganham um período completo a partir daqui
+_inicio_processo = time.time()
+
+def registrar_leitura(session_ids: List[str]):
+    """Marca as sessões como acompanhadas por algum cliente (adia o cancelamento por ociosidade)"""
+    if WORKFLOW_IDLE_CANCEL_SECONDS <= 0:
+        return
+    agora = time.time()
+    with _leituras_lock:
+        gravar = [
+            session_id for session_id in session_ids
+            if agora - _leituras_gravadas.get(session_id, 0.0) >= WORKFLOW_READ_HEARTBEAT_INTERVAL
+        ]
+        for session_id in gravar:
+            _leituras_gravadas[session_id] = agora
+    if gravar:
+        state_backend.record_reads(gravar, agora)
+
+def cancelar_sessoes_ociosas(agora: float = None) -> List[str]:
+    """Cancela as sessões em andamento sem leitura de status há mais de WORKFLOW_IDLE_CANCEL_SECONDS"""
+    agora = agora or time.time()
+    em_andamento, encerradas = [], []
+    for session_id in session_registry.session_ids():
+        state = session_registry.get(session_id)
+        if state is None:
+            continue
+        (em_andamento if state["status"] == STATUS_EM_ANDAMENTO else encerradas).append(state)
+    
+    # Sessões encerradas não precisam mais de heartbeat
+    with _leituras_lock:
+        esquecer = [state["session_id"] for state in encerradas if state["session_id"] in _leituras_gravadas]
+        for session_id in esquecer:
+            del _leituras_gravadas[session_id]
+    if esquecer:
+        state_backend.forget_reads(esquecer)
+    
+    leituras = state_backend.last_reads([state["session_id"] for state in em_andamento])
+    canceladas = []
+    for state in em_andamento:
+        # Sem leitura registrada, conta desde a criação da sessão
+        referencia = max(leituras.get(state["session_id"], 0.0), _inicio_processo,
+                         parse_timestamp(state["created_at"]).timestamp() if state["created_at"] else 0.0)
+        if agora - referencia > WORKFLOW_IDLE_CANCEL_SECONDS:
+            cancelar_sessao(state["session_id"], "ocioso")
+            canceladas.append(state["session_id"])
+    return canceladas
+
+def _loop_cancelamento_ocioso():
+    intervalo = min(max(WORKFLOW_IDLE_CANCEL_SECONDS / 4, 1.0), 60.0)
+    while not _cancelamento_parada.wait(intervalo):
+        try:
+            canceladas = cancelar_sessoes_ociosas()
+            if canceladas:
+                logger.info(f"🛑 {len(canceladas)} sessões sem leitura de status há {WORKFLOW_IDLE_CANCEL_SECONDS:.0f}s canceladas")
+        except Exception as e:
+            logger.error(f"❌ Erro ao cancelar sessões ociosas: {e}")
+
+def encerrar_workflows():
+    """Encerramento gracioso: recusa novos inícios e drena ou faz checkpoint dos workflows em execução"""
+    retention_worker.stop()
+    _sincronizacao_parada.set()
+    _cancelamento_parada.set()
+    descartadas = workflow_scheduler.shutdown(WORKFLOW_SHUTDOWN_TIMEOUT, drain=WORKFLOW_SHUTDOWN_DRAIN)
+    if descartadas:
+        logger.info(f"💾 {len(descartadas)} sessões na fila ficam salvas para retomada no próximo início")
+
+def materializar_sessao_do_cache(session_id: str, entrada: Dict):
+    """
+    Conclui imediatamente uma sessão a partir de uma síntese em cache, com um único registro que aponta para
+    a sessão de origem: a síntese, as seções e os blobs continuam só no journal dela (sessao_da_sintese)
+    """
+    origem = entrada["source_session"]
+    salvar_etapa(ETAPA_CONCLUSAO_DO_CACHE, {
+        "session_id": session_id,
+        "status": "concluido",
+        "cached_from": origem,
+        "timestamp": datetime.now().isoformat()
+    }, categoria="workflow", session_id=session_id)
+    
+    logger.info(f"♻️ Sessão {session_id} concluída a partir do cache (origem: {origem})")
+
+def sessao_da_sintese(session_id: str) -> str:
+    """Sessão cujo journal guarda a síntese: a de origem, para as sessões concluídas a partir do cache"""
+    state = obter_estado(session_id)
+    return (state or {}).get("cached_from") or session_id
+
+def _epoch(valor: Any) -> float:
+    """Instante em segundos desde a epoch: número ou data/hora ISO (sem fuso = hora local)"""
+    if isinstance(valor, (int, float)) and not isinstance(valor, bool):
+        return float(valor)
+    if isinstance(valor, str) and valor.strip():
+        return datetime.fromisoformat(valor.strip()).timestamp()
+    raise ValueError(f"Data inválida: {valor!r}")
+
+def agendamento_do_inicio(dados: Dict, context: Dict) -> Dict:
+    """
+    Prioridade e prazo da execução na fila: `priority` (inteiro, maior executa antes) e `deadline`
+    (ISO ou epoch); sem deadline, o prazo é a data da partida (context.match_date). ValueError se inválidos.
+    """
+    priority = dados.get('priority', 0)
+    if isinstance(priority, bool) or not isinstance(priority, int):
+        raise ValueError("priority deve ser um número inteiro")
+    
+    deadline = dados.get('deadline')
+    if deadline is not None:
+        try:
+            deadline = _epoch(deadline)
+        except ValueError:
+            raise ValueError("deadline deve ser uma data ISO 8601 ou um timestamp")
+    else:
+        try:
+            deadline = _epoch(context.get('match_date'))
+        except ValueError:
+            deadline = None  # partida sem data: fica atrás das que têm prazo
+    return {"priority": priority, "deadline": deadline}
+
+def lider_em_andamento(session_id: str) -> bool:
+    """
+    Líder registrado no cache ainda em execução (consultado pelo cache fora do seu lock: pode sincronizar).
+    Sem estado, a sessão acabou de ser planejada pela requisição que ainda vai gravar o seu início (ou ele
+    não foi sincronizado): conta como em andamento
+    """
+    state = obter_estado(session_id)
+    return state is None or state["status"] == STATUS_EM_ANDAMENTO
+
+def planejar_inicio(segmento: str, context: Dict, force_refresh: bool = False, agendamento: Dict = None) -> Dict:
+    """Resolve uma requisição de início contra o cache: executar, reaproveitar a síntese ou anexar"""
+    session_id = generate_session_id()
+    plano = {
+        "tipo": "executar",
+        "session_id": session_id,
+        "segmento": segmento,
+        "context": context,
+        "cache_key": chave_requisicao(segmento, context),
+        **(agendamento or {"priority": 0, "deadline": None})
+    }
+    
+    # Requisições idênticas reaproveitam a síntese em cache ou a execução em andamento
+    if force_refresh:
+        synthesis_cache.begin(plano["cache_key"], session_id)
+        return plano
+    
+    resultado_cache, valor = synthesis_cache.lookup_or_begin(plano["cache_key"], session_id, lider_em_andamento)
+    if resultado_cache == RESULTADO_EM_ANDAMENTO:
+        plano.update(tipo="anexada", session_id=valor)
+    elif resultado_cache == RESULTADO_HIT:
+        origem = obter_estado(valor["source_session"])
+        if origem is not None and origem["status"] == STATUS_CONCLUIDO:
+            plano.update(tipo="cache", entrada=valor)
+        else:
+            # A sessão de origem foi apagada (retenção) e a síntese citada pela entrada não existe mais
+            synthesis_cache.discard(plano["cache_key"], valor["source_session"])
+            synthesis_cache.begin(plano["cache_key"], session_id)
+    return plano
+
+def job_do_plano(plano: Dict) -> Dict:
+    """Payload do job (serializável: vai para a fila compartilhada nos backends multi-processo)"""
+    return {
+        "session_id": plano["session_id"],
+        "context": plano["context"],
+        "cache_key": plano["cache_key"],
+        "priority": plano["priority"],
+        "deadline": plano["deadline"]
+    }
+
+def liberar_planos(planos: List[Dict]):
+    """Desfaz o registro de execução em andamento de planos que não chegaram a ser enfileirados"""
+    for plano in planos:
+        if plano["tipo"] == "executar":
+            synthesis_cache.finish(plano["cache_key"], plano["session_id"])
+
+def gravar_inicio(plano: Dict, batch_id: str = None):
+    """Grava o registro de início (workflow_completo_iniciado) da sessão planejada"""
+    inicio = {
+        "session_id": plano["session_id"],
+        "segmento": plano["segmento"],
+        "context": plano["context"],
+        "cache_key": plano["cache_key"],
+        "priority": plano["priority"],
+        "deadline": plano["deadline"],
+        "timestamp": datetime.now().isoformat()
+    }
+    if batch_id:
+        inicio["batch_id"] = batch_id
+    if plano["tipo"] == "cache":
+        inicio["cached_from"] = plano["entrada"]["source_session"]
+    salvar_etapa(ETAPA_INICIO, inicio, categoria="workflow", session_id=plano["session_id"])
+
+def enfileirar_planos(planos: List[Dict], batch_id: str = None) -> List[int]:
+    """
+    Grava o início de cada plano a executar e só depois os enfileira, todos ou nenhum: um job nunca roda sem
+    o registro de início, e uma queda entre as duas escritas deixa a sessão retomável. Com a fila cheia, as
+    sessões já gravadas são canceladas (motivo fila_cheia) e o QueueFullError é propagado.
+    """
+    for plano in planos:
+        gravar_inicio(plano, batch_id)
+    try:
+        return workflow_scheduler.submit_many([(plano["session_id"], job_do_plano(plano)) for plano in planos])
+    except QueueFullError:
+        for plano in planos:
+            salvar_etapa(ETAPA_CANCELAMENTO, {
+                "session_id": plano["session_id"],
+                "motivo": "fila_cheia",
+                "estava_na_fila": False,
+                "timestamp": datetime.now().isoformat()
+            }, categoria="workflow", session_id=plano["session_id"])
+            workflow_cancelado_total.inc(motivo="fila_cheia")
+        liberar_planos(planos)
+        raise
+
+def efetivar_inicio(plano: Dict, posicao: int = 0, batch_id: str = None) -> Dict:
+    """
+    Monta a resposta do início planejado; sessões vindas do cache são gravadas e concluídas aqui (as de
+    execução já tiveram o início gravado por enfileirar_planos)
+    """
+    session_id = plano["session_id"]
+    workflow_starts_total.inc(result=plano["tipo"])
+    
+    if plano["tipo"] == "anexada":
+        logger.info(f"🔗 Requisição idêntica em andamento - acompanhando sessão {session_id}")
+        return {
+            "success": True,
+            "session_id": session_id,
+            "attached": True,
+            "message": "Análise idêntica já em andamento; acompanhando a sessão existente",
+            "status_endpoint": f"/api/workflow/status/{session_id}"
+        }
+    
+    if plano["tipo"] == "cache":
+        gravar_inicio(plano, batch_id)
+        materializar_sessao_do_cache(session_id, plano["entrada"])
+        
+        return {
+            "success": True,
+            "session_id": session_id,
+            "cached": True,
+            "message": "Análise concluída a partir do cache",
+            "queue_position": 0,
+            "estimated_wait_seconds": 0,
+            "estimated_total_duration": "Concluído",
+            "status_endpoint": f"/api/workflow/status/{session_id}"
+        }
+    
+    logger.info(f"🚀 WORKFLOW COMPLETO INICIADO - Sessão: {session_id}")
+    logger.info(f"🔍 Segmento: {plano['segmento']}")
+    
+    espera = workflow_scheduler.estimate_wait(posicao)
+    
+    return {
+        "success": True,
+        "session_id": session_id,
+        "message": "Workflow completo iniciado em segundo plano" if posicao == 0 else "Workflow completo enfileirado",
+        "queue_position": posicao,
+        "estimated_wait_seconds": round(espera),
+        "estimated_total_duration": formatar_duracao(espera + workflow_scheduler.estimate_job_duration()),
+        "priority": plano["priority"],
+        "deadline": datetime.fromtimestamp(plano["deadline"]).isoformat() if plano["deadline"] is not None else None,
+        "status_endpoint": f"/api/workflow/status/{session_id}",
+        "cancel_endpoint": f"/api/workflow/cancel/{session_id}"
+    }
+
+def resposta_fila_cheia(e: QueueFullError):
+    return jsonify({
+        "success": False,
+        "error": "Servidor ocupado: fila de workflows cheia. Tente novamente mais tarde.",
+        "retry_after": e.retry_after
+    }), 503, {"Retry-After": str(e.retry_after)}
+
+@enhanced_workflow_bp.route('/workflow/full_workflow/start', methods=['POST'])
+def start_full_workflow():
+    """Inicia o workflow completo em segundo plano"""
+    try:
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({"error": "Corpo da requisição deve ser um objeto JSON"}), 400
+        
+        segmento = data.get('segmento') or ''
+        if not isinstance(segmento, str) or not segmento.strip():
+            return jsonify({"error": "Segmento é obrigatório"}), 400
+        segmento = segmento.strip()
+        
+        context = data.get('context', {})
+        if not isinstance(context, dict):
+            return jsonify({"error": "context deve ser um objeto"}), 400
+        
+        try:
+            agendamento = agendamento_do_inicio(data, context)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        plano = planejar_inicio(segmento, context, bool(data.get('force_refresh')), agendamento)
+        
+        posicao = 0
+        if plano["tipo"] == "executar":
+            try:
+                posicao = enfileirar_planos([plano])[0]
+            except QueueFullError as e:
+                logger.warning(f"⚠️ Fila de workflows cheia - Sessão recusada: {plano['session_id']}")
+                return resposta_fila_cheia(e)
+        
+        return jsonify(efetivar_inicio(plano, posicao)), 200
+        
+    except Exception as e:
+        logger.error(f"❌ Erro ao iniciar workflow completo: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+# ==========================================
+# LOTES DE WORKFLOWS
+# ==========================================
+
+@enhanced_workflow_bp.route('/workflow/full_workflow/batch', methods=['POST'])
+def start_workflow_batch():
+    """Inicia um lote de workflows (ex.: uma rodada inteira) em uma única requisição"""
+    try:
+        data = request.get_json() or {}
+        itens = data.get('items')
+        
+        if not isinstance(itens, list) or not itens:
+            return jsonify({"error": "Lista 'items' é obrigatória"}), 400
+        
+        if len(itens) > WORKFLOW_MAX_BATCH:
+            return jsonify({"error": f"Lote excede o máximo de {WORKFLOW_MAX_BATCH} itens"}), 400
+        
+        # Validação de todos os itens em uma única passada, antes de agendar qualquer um
+        segmento_padrao = data.get('segmento') or ''
+        force_refresh_padrao = bool(data.get('force_refresh'))
+        agendamento_padrao = {campo: data[campo] for campo in ('priority', 'deadline') if campo in data}
+        validos, invalidos = [], []
+        for indice, item in enumerate(itens):
+            if not isinstance(item, dict):
+                invalidos.append({"index": indice, "error": "Item deve ser um objeto"})
+                continue
+            segmento = (item.get('segmento') or segmento_padrao).strip()
+            context = item.get('context', {})
+            if not segmento:
+                invalidos.append({"index": indice, "error": "Segmento é obrigatório"})
+                continue
+            if not isinstance(context, dict):
+                invalidos.append({"index": indice, "error": "context deve ser um objeto"})
+                continue
+            try:
+                # priority/deadline do item, ou os do lote como padrão
+                agendamento = agendamento_do_inicio({**agendamento_padrao, **item}, context)
+            except ValueError as e:
+                invalidos.append({"index": indice, "error": str(e)})
+                continue
+            validos.append((segmento, context, bool(item.get('force_refresh', force_refresh_padrao)), agendamento))
+        
+        if invalidos:
+            return jsonify({
+                "success": False,
+                "error": "Itens inválidos no lote",
+                "invalid_items": invalidos
+            }), 400
+        
+        batch_id = generate_batch_id()
+        planos = [planejar_inicio(*item) for item in validos]
+        
+        # Todos os itens a executar entram na fila de uma vez (ou nenhum)
+        executar = [plano for plano in planos if plano["tipo"] == "executar"]
+        try:
+            posicoes = enfileirar_planos(executar, batch_id)
+        except QueueFullError as e:
+            logger.warning(f"⚠️ Fila de workflows cheia - Lote recusado: {batch_id} ({len(executar)} itens)")
+            return resposta_fila_cheia(e)
+        
+        for plano, posicao in zip(executar, posicoes):
+            plano["posicao"] = posicao
+        
+        respostas = []
+        for indice, plano in enumerate(planos):
+            resposta = efetivar_inicio(plano, plano.get("posicao", 0), batch_id)
+            resposta["index"] = indice
+            respostas.append(resposta)
+        
+        session_ids = [plano["session_id"] for plano in planos]
+        salvar_etapa(ETAPA_LOTE_CRIADO, {
+            "batch_id": batch_id,
+            "session_ids": session_ids,
+            "timestamp": datetime.now().isoformat()
+        }, categoria="workflow_batches", session_id=batch_id)
+        batch_registry.register(batch_id, session_ids)
+        
+        logger.info(f"📦 Lote {batch_id} iniciado: {len(planos)} itens, {len(executar)} enfileirados")
+        
+        return jsonify({
+            "success": True,
+            "batch_id": batch_id,
+            "items": respostas,
+            "status_endpoint": f"/api/workflow/full_workflow/batch/{batch_id}"
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"❌ Erro ao iniciar lote de workflows: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e)
+        }), 500
+
+@enhanced_workflow_bp.route('/workflow/full_workflow/batch/<batch_id>', methods=['GET'])
+def get_batch_status(batch_id):
+    """Status agregado de todas as sessões de um lote"""
+    try:
+        batch = batch_registry.get(batch_id)
+        if batch is None and state_backend.shared:
+            sincronizar_estado()
+            batch = batch_registry.get(batch_id)
+        if batch is None:
+            return jsonify({
+                "error": "Lote não encontrado",
+                "batch_id": batch_id
+            }), 404
+        
+        registrar_leitura(batch["session_ids"])
+        itens = []
+        contagem = {"completed": 0, "failed": 0, "cancelled": 0, "running": 0, "missing": 0}
+        progresso_total = 0
+        for session_id in batch["session_ids"]:
+            state = obter_estado(session_id)
+            status = montar_status(session_id, state)
+            item = {
+                "session_id": session_id,
+                "status": state["status"] if state else "desconhecido",
+                "current_step": status["current_step"],
+                "progress_percentage": status["progress_percentage"]
+            }
+            for campo in ("queue_position", "error"):
+                if campo in status:
+                    item[campo] = status[campo]
+            
+            itens.append(item)
+            if state is None:
+                # Apagada (retenção) ou desconhecida: fora do progresso e da conclusão do lote
+                contagem["missing"] += 1
+                continue
+            if state["status"] == STATUS_EM_ANDAMENTO:
+                contagem["running"] += 1
+            elif state["status"] == STATUS_CANCELADO:
+                contagem["cancelled"] += 1
+            elif state["error"]:
+                contagem["failed"] += 1
+            else:
+                contagem["completed"] += 1
+            progresso_total += status["progress_percentage"]
+        
+        presentes = len(itens) - contagem["missing"]
+        return jsonify({
+            "batch_id": batch_id,
+            "created_at": batch["created_at"],
+            "total": len(itens),
+            **contagem,
+            "progress_percentage": round(progresso_total / presentes) if presentes else 100,
+            "finished": contagem["running"] == 0,
+            "items": itens
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"❌ Erro ao obter status do lote: {e}")
+        return jsonify({
+            "batch_id": batch_id,
+            "error": str(e)
+        }), 500
+
+# ==========================================
+# STATUS E RESULTADOS
+# ==========================================
+
+def montar_status(session_id: str, state: Dict = None) -> Dict:
+    """Monta a resposta de status a partir do estado registrado da sessão"""
+    status = {
+        "session_id": session_id,
+        "current_step": 0,
+        "step_status": {
+            "step1": "pending",
+            "step2": "pending",
+            "step3": "pending",
+            "step4": "pending",
+            "cpl_devastador": "pending"
+        },
+        "synthesis_sections": {secao: "pending" for secao in NOMES_SECOES_SINTESE},
+        "progress_percentage": 0,
+        "estimated_remaining": "Calculando...",
+        "last_update": datetime.now().isoformat()
+    }
+    
+    if state is not None:
+        # Etapas independentes podem concluir fora de ordem: o passo atual é o total concluído
+        completed = state["completed_steps"]
+        for step, _ in WORKFLOW_STEPS:
+            if step in completed:
+                status["step_status"][step] = "completed"
+                status["current_step"] += 1
+        status["progress_percentage"] = status["current_step"] * 20
+        
+        # Sessões vindas do cache gravam só a síntese completa: step3 concluído implica todas as seções
+        for secao in NOMES_SECOES_SINTESE:
+            if secao in state["synthesis_sections"] or "step3" in completed:
+                status["synthesis_sections"][secao] = "completed"
+        
+        if status["current_step"] == len(WORKFLOW_STEPS):
+            status["estimated_remaining"] = "Concluído"
+        
+        if state["error"]:
+            status["error"] = state["error"]
+        elif state["status"] == STATUS_CANCELADO:
+            status["cancelled"] = True
+            status["estimated_remaining"] = "Cancelado"
+        elif status["current_step"] < len(WORKFLOW_STEPS):
+            progresso = workflow_scheduler.progress(session_id, completed)
+            if progresso is not None:
+                status["queue_position"], restante = progresso
+                status["estimated_remaining"] = formatar_duracao(restante)
+    
+    return status
+
+def _aguardar_progresso(session_id: str, since: int, timeout: float) -> Dict:
+    """Long-poll: espera a sessão passar da etapa `since` ou terminar"""
+    deadline = time.monotonic() + timeout
+    state = obter_estado(session_id)
+    while state is not None and state["status"] == STATUS_EM_ANDAMENTO:
+        if montar_status(session_id, state)["current_step"] > since:
+            break
+        restante = deadline - time.monotonic()
+        if restante <= 0:
+            break
+        state = session_registry.wait_for_update(session_id, state["version"], restante)
+    return state
+
+@enhanced_workflow_bp.route('/workflow/status/<session_id>', methods=['GET'])
+def get_workflow_status(session_id):
+    """Obtém status do workflow (com `?since=<step>` aguarda a próxima etapa - long-poll)"""
+    try:
+        since = request.args.get('since', type=int)
+        if since is None:
+            state = obter_estado(session_id)
+        else:
+            timeout = min(request.args.get('timeout', LONG_POLL_TIMEOUT, type=float), LONG_POLL_MAX_TIMEOUT)
+            state = _aguardar_progresso(session_id, since, max(timeout, 0))
+        
+        if state is not None:
+            registrar_leitura([session_id])
+        return jsonify(montar_status(session_id, state)), 200
+        
+    except Exception as e:
+        logger.error(f"❌ Erro ao obter status: {e}")
+        return jsonify({
+            "session_id": session_id,
+            "error": str(e),
+            "status": "error"
+        }), 500
+
+@enhanced_workflow_bp.route('/workflow/cancel/<session_id>', methods=['POST'])
+def cancel_workflow(session_id):
+    """Cancela uma sessão na fila ou em execução (para antes da próxima etapa)"""
+    try:
+        state = cancelar_sessao(session_id, "cliente")
+        if state is None:
+            return jsonify({
+                "error": "Sessão não encontrada",
+                "session_id": session_id
+            }), 404
+        if state["status"] != STATUS_CANCELADO:
+            return jsonify({
+                "error": "Sessão já finalizada",
+                "session_id": session_id,
+                "status": state["status"]
+            }), 409
+        
+        return jsonify({
+            "success": True,
+            "session_id": session_id,
+            "status": state["status"],
+            "message": "Workflow cancelado",
+            "status_endpoint": f"/api/workflow/status/{session_id}"
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"❌ Erro ao cancelar workflow: {e}")
+        return jsonify({
+            "success": False,
+            "session_id": session_id,
+            "error": str(e)
+        }), 500
+
+def _evento_sse(evento: str, dados: Dict, event_id: int = None) -> str:
+    linhas = [f"event: {evento}"]
+    if event_id is not None:
+        linhas.append(f"id: {event_id}")
+    linhas.append(f"data: {json.dumps(dados, ensure_ascii=False)}")
+    return "\n".join(linhas) + "\n\n"
+
+@enhanced_workflow_bp.route('/workflow/stream/<session_id>', methods=['GET'])
+def stream_workflow_status(session_id):
+    """Server-Sent Events com o progresso do workflow: um evento por etapa concluída"""
+    state = obter_estado(session_id)
+    if state is None:
+        return jsonify({
+            "error": "Sessão não encontrada",
+            "session_id": session_id
+        }), 404
+    
+    # Reconexões do EventSource enviam o último id recebido
+    ultima_etapa = request.headers.get('Last-Event-ID', type=int)
+    if ultima_etapa is None:
+        ultima_etapa = request.args.get('since', -1, type=int)
+    
+    def gerar_eventos():
+        nonlocal state, ultima_etapa
+        while True:
+            status = montar_status(session_id, state)
+            if status["current_step"] > ultima_etapa:
+                ultima_etapa = status["current_step"]
+                yield _evento_sse("progress", status, ultima_etapa)
+            
+            if state["status"] != STATUS_EM_ANDAMENTO:
+                if status.get("error"):
+                    evento = "workflow_erro"
+                elif status.get("cancelled"):
+                    evento = "cancelled"
+                else:
+                    evento = "completed"
+                yield _evento_sse(evento, status, ultima_etapa)
+                return
+            
+            # Um stream aberto é um cliente acompanhando a sessão
+            registrar_leitura([session_id])
+            versao = state["version"]
+            state = session_registry.wait_for_update(session_id, versao, STREAM_HEARTBEAT_INTERVAL)
+            if state is None:
+                # Sessão apagada com o stream aberto (ex.: retenção): evento final em vez de reconexões em 404
+                yield _evento_sse("removed", {
+                    "session_id": session_id,
+                    "error": "Sessão removida"
+                }, ultima_etapa)
+                return
+            if state["version"] == versao:
+                yield ": keep-alive\n\n"
+    
+    return Response(stream_with_context(gerar_eventos()), mimetype='text/event-stream', headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+def _sintese_completa_em_cache(session_id: str):
+    """Bytes da síntese completa (serializados e comprimidos uma única vez), ou None se ainda não gravada"""
+    entrada = synthesis_response_cache.get(session_id)
+    if entrada is None:
+        fonte = sessao_da_sintese(session_id)
+        registro = session_journal.last_record(fonte, "sintese_master_synthesis")
+        if registro is None:
+            return None
+        entrada = synthesis_response_cache.put(
+            session_id,
+            session_journal.record_bytes(fonte, registro),
+            parse_timestamp(registro["ts"])
+        )
+        logger.info(f"✅ Dados de síntese carregados em cache para sessão {session_id}")
+    return entrada
+
+def secoes_pedidas(valor: str) -> List[str]:
+    """Seções de ?fields=a,b na ordem da síntese (vazio = todas); ValueError para seções desconhecidas"""
+    pedidas = {campo.strip() for campo in valor.split(",") if campo.strip()}
+    desconhecidas = pedidas - set(NOMES_SECOES_SINTESE)
+    if desconhecidas:
+        raise ValueError(f"Seções desconhecidas: {', '.join(sorted(desconhecidas))}")
+    return [secao for secao in NOMES_SECOES_SINTESE if not pedidas or secao in pedidas]
+
+def secoes_gravadas(session_id: str, secoes: List[str]) -> Dict[str, Any]:
+    """Última gravação de cada seção pedida que já foi produzida pela etapa de síntese"""
+    fonte = sessao_da_sintese(session_id)
+    etapas = {f"{ETAPA_SECAO_SINTESE_PREFIXO}{secao}": secao for secao in secoes}
+    encontradas = {}
+    for registro in session_journal.read_records(fonte):
+        secao = etapas.get(registro["etapa"])
+        if secao is not None:
+            encontradas[secao] = registro
+    return {
+        secao: session_journal.resolve(fonte, registro["dados"])["dados"]
+        for secao, registro in encontradas.items()
+    }
+
+def _resposta_secoes(session_id: str, secoes: List[str]):
+    """Projeção ?fields=: seções prontas e flags de prontidão, completa ou ainda em produção"""
+    entrada = _sintese_completa_em_cache(session_id)
+    if entrada is not None:
+        completa = json.loads(entrada.body)
+        prontas = {secao: completa[secao] for secao in secoes if secao in completa}
+    else:
+        if obter_estado(session_id) is None:
+            return jsonify({
+                "error": "Sessão não encontrada",
+                "session_id": session_id
+            }), 404
+        registrar_leitura([session_id])
+        prontas = secoes_gravadas(session_id, secoes)
+    
+    response = jsonify({
+        "session_id": session_id,
+        "complete": entrada is not None,
+        "sections": prontas,
+        "ready": {secao: secao in prontas for secao in secoes},
+        "pending": [secao for secao in secoes if secao not in prontas]
+    })
+    response.add_etag()
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+@enhanced_workflow_bp.route('/workflow/results/synthesis/<session_id>', methods=['GET'])
+def get_synthesis_results(session_id):
+    """
+    Endpoint para obter os dados da síntese final (bytes em cache, ETag e compressão).
+    Com `?fields=a,b` (ou `?fields=` para todas) entrega só as seções pedidas, inclusive
+    durante a síntese, com as flags de prontidão de cada uma.
+    """
+    try:
+        if 'fields' in request.args:
+            try:
+                secoes = secoes_pedidas(request.args['fields'])
+            except ValueError as e:
+                return jsonify({
+                    "error": str(e),
+                    "session_id": session_id,
+                    "available_sections": NOMES_SECOES_SINTESE
+                }), 400
+            return _resposta_secoes(session_id, secoes)
+        
+        entrada = _sintese_completa_em_cache(session_id)
+        if entrada is None:
+            logger.warning(f"Dados de síntese não encontrados para sessão {session_id}")
+            return jsonify({
+                "error": "Dados de síntese não encontrados",
+                "session_id": session_id
+            }), 404
+        
+        encoding, corpo = entrada.select(request.accept_encodings)
+        response = Response(corpo, mimetype='application/json')
+        # Cada codificação é uma representação distinta e precisa de ETag forte própria
+        response.set_etag(f"{entrada.etag}-{encoding}" if encoding else entrada.etag)
+        response.last_modified = entrada.last_modified
+        response.cache_control.public = True
+        response.cache_control.no_cache = True
+        response.vary.add('Accept-Encoding')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        
+        # 304 para If-None-Match / If-Modified-Since
+        return response.make_conditional(request)
+        
+    except Exception as e:
+        logger.error(f"❌ Erro ao obter dados de síntese: {e}")
+        return jsonify({
+            "error": str(e),
+            "session_id": session_id
+        }), 500
+
+@enhanced_workflow_bp.route('/workflow/results/<session_id>', methods=['GET'])
+def get_workflow_results(session_id):
+    """Obtém resultados do workflow"""
+    try:
+        results = {
+            "session_id": session_id,
+            "available_files": [],
+            "final_report_available": False,
+            "modules_generated": 0,
+            "verification_available": False
+        }
+        
+        # Sessões concluídas a partir do cache têm os resultados no journal da sessão de origem
+        fonte = sessao_da_sintese(session_id)
+        
+        # *_path só aparece quando um arquivo contém exatamente o payload; *_locator diz onde está o registro
+        # (<journal>#<etapa> no journal local ou no store, ou o arquivo legado)
+        for prefixo, nome_etapa in (("synthesis", "sintese_master_synthesis"),
+                                    ("verification", "verificacao_ai_concluida_full_workflow")):
+            localizador = session_journal.stage_locator(fonte, nome_etapa)
+            if localizador is None:
+                continue
+            results[f"{prefixo}_available"] = True
+            results[f"{prefixo}_locator"] = localizador
+            caminho = session_journal.stage_path(fonte, nome_etapa)
+            if caminho is not None:
+                results[f"{prefixo}_path"] = caminho
+        
+        results["bundle_endpoint"] = f"/api/workflow/results/{session_id}/bundle"
+        
+        return jsonify(results), 200
+        
+    except Exception as e:
+        logger.error(f"❌ Erro ao obter resultados: {e}")
+        return jsonify({
+            "session_id": session_id,
+            "error": str(e)
+        }), 500
+
+# ==========================================
+# EXPORTAÇÃO (BUNDLES)
+# ==========================================
+
+def formato_bundle() -> str:
+    formato = request.args.get('format', 'zip')
+    return formato if formato in BUNDLE_FORMATOS else None
+
+@enhanced_workflow_bp.route('/workflow/results/<session_id>/bundle', methods=['GET'])
+def get_session_bundle(session_id):
+    """Bundle (?format=zip|tar.gz) com todos os artefatos da sessão, servido do disco com Range e ETag"""
+    try:
+        formato = formato_bundle()
+        if formato is None:
+            return jsonify({"error": f"Formato inválido; use um de: {', '.join(BUNDLE_FORMATOS)}"}), 400
+        
+        state = obter_estado(session_id)
+        if state is None:
+            return jsonify({
+                "error": "Sessão não encontrada",
+                "session_id": session_id
+            }), 404
+        
+        # O arquivo é gerado uma vez por versão da sessão; send_file cuida de Range/If-Range e do sendfile
+        caminho = bundle_cache.get_or_build(
+            session_id, state["version"], formato,
+            lambda: artefatos_da_sessao(session_journal, session_id, state)
+        )
+        extensao, mimetype = BUNDLE_FORMATOS[formato]
+        return send_file(
+            os.path.abspath(caminho),
+            mimetype=mimetype,
+            as_attachment=True,
+            download_name=f"{session_id}.{extensao}",
+            conditional=True,
+            etag=True,
+            max_age=0
+        )
+        
+    except Exception as e:
+        logger.error(f"❌ Erro ao gerar bundle da sessão: {e}")
+        return jsonify({
+            "error": str(e),
+            "session_id": session_id
+        }), 500
+
+@enhanced_workflow_bp.route('/workflow/export', methods=['GET'])
+def export_sessions():
+    """Exporta várias sessões (ex.: ?created_after=&created_before=) em um único arquivo transmitido em blocos"""
+    try:
+        formato = formato_bundle()
+        if formato is None:
+            return jsonify({"error": f"Formato inválido; use um de: {', '.join(BUNDLE_FORMATOS)}"}), 400
+        
+        if state_backend.shared:
+            sincronizar_estado()
+        filtro = filtro_sessoes(request.args)
+        
+        sessoes, cursor = [], None
+        while True:
+            pagina, cursor = session_registry.page(SESSIONS_PAGE_MAX, cursor, filtro)
+            sessoes.extend(pagina)
+            if cursor is None:
+                break
+        
+        if not sessoes:
+            return jsonify({"error": "Nenhuma sessão no filtro informado"}), 404
+        
+        def artefatos():
+            for state in sessoes:
+                yield from artefatos_da_sessao(session_journal, state["session_id"], state)
+        
+        extensao, mimetype = BUNDLE_FORMATOS[formato]
+        nome = f"sessions-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{extensao}"
+        logger.info(f"📦 Exportando {len(sessoes)} sessões em {formato}")
+        
+        return Response(stream_with_context(stream_bundle(formato, artefatos())), mimetype=mimetype, headers={
+            "Content-Disposition": f'attachment; filename="{nome}"',
+            "X-Session-Count": str(len(sessoes))
+        })
+        
+    except Exception as e:
+        logger.error(f"❌ Erro ao exportar sessões: {e}")
+        return jsonify({
+            "error": str(e)
+        }), 500
+
+# ==========================================
+# ÍNDICE DE SESSÕES
+# ==========================================
+
+def resumo_sessao(state: Dict) -> Dict:
+    """Entrada do índice de sessões"""
+    context = state["context"] or {}
+    return {
+        "session_id": state["session_id"],
+        "segmento": state["segmento"],
+        "opponent": context.get("opponent"),
+        "status": state["status"],
+        "created_at": state["created_at"],
+        "finished_at": state["finished_at"],
+        "bytes": state["bytes"]
+    }
+
+def filtro_sessoes(args):
+    """Predicado dos filtros de sessão (status, opponent, segmento, created_after, created_before)"""
+    status_filtro = args.get('status')
+    opponent = (args.get('opponent') or '').casefold()
+    segmento = (args.get('segmento') or '').casefold()
+    created_after = args.get('created_after')
+    created_before = args.get('created_before')
+    
+    def filtro(state: Dict) -> bool:
+        if status_filtro and state["status"] != status_filtro:
+            return False
+        if opponent and opponent not in str((state["context"] or {}).get("opponent") or '').casefold():
+            return False
+        if segmento and segmento not in (state["segmento"] or '').casefold():
+            return False
+        created_at = state["created_at"] or ''
+        if created_after and created_at < created_after:
+            return False
+        if created_before and created_at >= created_before:
+            return False
+        return True
+    
+    return filtro
+
+@enhanced_workflow_bp.route('/workflow/sessions', methods=['GET'])
+def list_sessions():
+    """Lista paginada das sessões (mais recentes primeiro) com filtros"""
+    try:
+        limit = min(max(request.args.get('limit', SESSIONS_PAGE_DEFAULT, type=int), 1), SESSIONS_PAGE_MAX)
+        cursor = request.args.get('cursor')
+        filtro = filtro_sessoes(request.args)
+        
+        # Sessões criadas por outros processos entram na listagem (como na exportação)
+        if state_backend.shared:
+            sincronizar_estado()
+        try:
+            sessoes, proximo_cursor = session_registry.page(limit, cursor, filtro)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        return jsonify({
+            "sessions": [resumo_sessao(state) for state in sessoes],
+            "count": len(sessoes),
+            "next_cursor": proximo_cursor
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"❌ Erro ao listar sessões: {e}")
+        return jsonify({
+            "error": str(e)
+        }), 500
+
+# ==========================================
+# BUSCA ENTRE SESSÕES
+# ==========================================
+
+@enhanced_workflow_bp.route('/workflow/search', methods=['GET'])
+def search_sessions():
+    """
+    Busca sessões pelo índice invertido (opponent, competition, venue, formation, status, match_date,
+    match_date_from, match_date_to), paginada por limit/cursor (next_cursor), e agrega todo o resultado:
+    facetas e confronto direto ao longo do tempo
+    """
+    try:
+        limit = min(max(request.args.get('limit', SESSIONS_PAGE_DEFAULT, type=int), 1), SESSIONS_PAGE_MAX)
+        filtros = {
+            campo: request.args[campo] for campo in CAMPOS_INDICE
+            if campo != "match_date" and request.args.get(campo)
+        }
+        
+        intervalo = {}
+        for parametro in ("match_date", "match_date_from", "match_date_to"):
+            valor = request.args.get(parametro)
+            if valor:
+                intervalo[parametro] = normalizar("match_date", valor)
+                if intervalo[parametro] is None:
+                    return jsonify({"error": f"{parametro} deve ser uma data ISO 8601"}), 400
+        data_de = intervalo.get("match_date", intervalo.get("match_date_from"))
+        data_ate = intervalo.get("match_date", intervalo.get("match_date_to"))
+        
+        try:
+            resultado = session_index.search(filtros, data_de, data_ate, limit, request.args.get('cursor'))
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        return jsonify(resultado), 200
+        
+    except Exception as e:
+        logger.error(f"❌ Erro na busca de sessões: {e}")
+        return jsonify({
+            "error": str(e)
+        }), 500
+
+# ==========================================
+# LIMITES DE ADMISSÃO
+# ==========================================
+
+@enhanced_workflow_bp.route('/workflow/limits', methods=['GET'])
+def get_admission_limits():
+    """Configuração e estatísticas dos limitadores por orçamento, com o saldo de tokens de quem consulta"""
+    try:
+        cliente = cliente_da_requisicao()
+        orcamentos = {}
+        for orcamento in (ORCAMENTO_INICIO, ORCAMENTO_LEITURA):
+            limiter = rate_limiters.get(orcamento)
+            concorrencia = concurrency_limiters.get(orcamento)
+            orcamentos[orcamento] = {
+                "rate_limit": limiter.stats() if limiter is not None else None,
+                "client_tokens": round(limiter.tokens(cliente), 3) if limiter is not None else None,
+                "concurrency": concorrencia.stats() if concorrencia is not None else None,
+            }
+        
+        return jsonify({
+            "client_key_header": WORKFLOW_API_KEY_HEADER,
+            "budgets": orcamentos
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"❌ Erro ao consultar limites de admissão: {e}")
+        return jsonify({
+            "error": str(e)
+        }), 500
@@ -0,0 +1,418 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ARQV18 Enhanced v18.0 - Job Scheduler
+Pool limitado de workers e fila de execuções do workflow completo
+"""
+import bisect
+import itertools
+import logging
+import math
+import os
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Duração assumida por etapa enquanto nenhuma execução foi observada (segundos)
+DEFAULT_STAGE_SECONDS = 2.0
+
+# Peso das novas observações na média móvel exponencial das etapas
+STAGE_EMA_ALPHA = 0.2
+
+# Prazo assumido para jobs sem prazo: depois de qualquer prazo real (epoch ~ ano 2286)
+PRAZO_INDEFINIDO = 9_999_999_999.0
+
+# Cada nível de prioridade vale mais que qualquer diferença de prazo
+FAIXA_PRIORIDADE = 1e10
+
+
+def chave_prioridade(job: Any) -> float:
+    """
+    Ordem de execução de um job (menor executa antes): maior `priority` primeiro e, dentro da
+    mesma prioridade, o `deadline` (epoch em segundos) mais próximo. Empates seguem a ordem de chegada.
+    """
+    if not isinstance(job, dict):
+        return PRAZO_INDEFINIDO
+    prazo = job.get("deadline")
+    prazo = PRAZO_INDEFINIDO if prazo is None else min(max(float(prazo), 0.0), PRAZO_INDEFINIDO)
+    return prazo - int(job.get("priority") or 0) * FAIXA_PRIORIDADE
+
+
+class QueueFullError(Exception):
+    """Fila de execuções cheia; `retry_after` sugere quando tentar novamente (segundos)"""
+
+    def __init__(self, retry_after: int, message: str = "Fila de workflows cheia"):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class SchedulerShutdownError(QueueFullError):
+    """Scheduler encerrando: novas submissões são recusadas até o próximo início do processo"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(retry_after, "Scheduler de workflows encerrando")
+
+
+class WorkflowScheduler:
+    """
+    Executa jobs em um número fixo de workers, com fila limitada e estimativas de espera.
+    Cada job é um payload entregue a `runner` (sem runner, o próprio job é chamado).
+    A fila é uma lista ordenada por `chave_prioridade` (prioridade e prazo) e ordem de chegada, com um mapa
+    session_id -> entrada: a posição de um job sai de uma busca binária, sem percorrer a fila.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int, stage_dependencies: Dict[str, tuple] = None,
+                 runner: Callable[[Any], Any] = None):
+        self.runner = runner or (lambda job: job())
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._idle = threading.Condition(self._lock)
+        self._closed = False
+        # Sinalizado no encerramento: os jobs param na próxima fronteira de etapa
+        self.stopping = threading.Event()
+        # (chave de prioridade, sequência, session_id, job) em ordem de execução, e as entradas por sessão
+        self._pending: List[Tuple[float, int, str, Any]] = []
+        self._pending_por_sessao: Dict[str, Tuple[float, int, str, Any]] = {}
+        self._sequencia = itertools.count()
+        self._running: Dict[str, float] = {}
+        self._workers = []
+        # Dependências das etapas em ordem topológica, usadas para estimar o caminho crítico
+        self._stage_dependencies = dict(stage_dependencies or {})
+        self._stage_seconds: Dict[str, float] = {}
+
+    # ------------------------------------------
+    # Submissão
+    # ------------------------------------------
+
+    def submit(self, session_id: str, job: Any) -> int:
+        """Enfileira um job e retorna sua posição na fila (0 = já tem worker livre)"""
+        return self.submit_many([(session_id, job)])[0]
+
+    def submit_many(self, jobs: List[Tuple[str, Any]]) -> List[int]:
+        """Enfileira vários jobs de uma vez (todos ou nenhum) e retorna suas posições"""
+        with self._lock:
+            if self._closed:
+                raise SchedulerShutdownError(self._retry_after_locked())
+            livres = self.max_workers - len(self._running)
+            if len(self._pending) + len(jobs) > self.max_queue + livres:
+                raise QueueFullError(self._retry_after_locked())
+
+            entradas = [(chave_prioridade(job), next(self._sequencia), session_id, job) for session_id, job in jobs]
+            for entrada in entradas:
+                bisect.insort(self._pending, entrada)
+                self._pending_por_sessao[entrada[2]] = entrada
+            self._ensure_workers_locked()
+            self._not_empty.notify(len(jobs))
+            return [self._position_locked(self._rank_locked(entrada)) for entrada in entradas]
+
+    def position(self, session_id: str) -> Optional[int]:
+        """Posição na fila (0 = em execução), ou None se o job não está no scheduler"""
+        with self._lock:
+            if session_id in self._running:
+                return 0
+            entrada = self._find_locked(session_id)
+            return None if entrada is None else self._position_locked(self._rank_locked(entrada))
+
+    def cancel(self, session_id: str) -> Optional[Any]:
+        """Retira um job ainda pendente da fila e o retorna (None se não está pendente)"""
+        with self._lock:
+            entrada = self._pending_por_sessao.pop(session_id, None)
+            if entrada is None:
+                return None
+            del self._pending[self._rank_locked(entrada)]
+            return entrada[3]
+
+    def _find_locked(self, session_id: str) -> Optional[Tuple[float, int, str, Any]]:
+        return self._pending_por_sessao.get(session_id)
+
+    def _rank_locked(self, entrada: Tuple[float, int, str, Any]) -> int:
+        """Índice do job na ordem de execução da fila (a sequência é única: a comparação não chega ao job)"""
+        return bisect.bisect_left(self._pending, entrada[:2])
+
+    def _position_locked(self, indice: int) -> int:
+        livres = self.max_workers - len(self._running)
+        return max(0, indice + 1 - livres)
+
+    # ------------------------------------------
+    # Estimativas
+    # ------------------------------------------
+
+    def record_stage_duration(self, stage: str, seconds: float):
+        """Registra a duração observada de uma etapa"""
+        with self._lock:
+            anterior = self._stage_seconds.get(stage)
+            if anterior is None:
+                self._stage_seconds[stage] = seconds
+            else:
+                self._stage_seconds[stage] = anterior + STAGE_EMA_ALPHA * (seconds - anterior)
+
+    def _stage_estimate_locked(self, stage: str) -> float:
+        return self._stage_seconds.get(stage, DEFAULT_STAGE_SECONDS)
+
+    def _remaining_locked(self, completed_stages=()) -> float:
+        """Caminho crítico das etapas ainda não concluídas"""
+        termino: Dict[str, float] = {}
+        for stage, dependencias in self._stage_dependencies.items():
+            if stage in completed_stages:
+                termino[stage] = 0.0
+                continue
+            inicio = max((termino.get(dependencia, 0.0) for dependencia in dependencias), default=0.0)
+            termino[stage] = inicio + self._stage_estimate_locked(stage)
+        return max(termino.values(), default=0.0)
+
+    def _job_estimate_locked(self) -> float:
+        return self._remaining_locked() or DEFAULT_STAGE_SECONDS
+
+    def progress(self, session_id: str, completed_stages=()) -> Optional[Tuple[int, float]]:
+        """
+        (posição na fila, segundos estimados até a conclusão) lidos juntos, ou None se o job não está no
+        scheduler: consultas separadas podem ver o job terminar entre uma e outra
+        """
+        with self._lock:
+            restantes = self._remaining_locked(completed_stages)
+            if session_id in self._running:
+                return 0, restantes
+            entrada = self._find_locked(session_id)
+            if entrada is None:
+                return None
+            posicao = self._position_locked(self._rank_locked(entrada))
+            return posicao, self._wait_locked(posicao) + restantes
+
+    def estimate_wait(self, position: int) -> float:
+        """Segundos estimados de espera na fila para a posição informada"""
+        with self._lock:
+            return self._wait_locked(position)
+
+    def estimate_job_duration(self) -> float:
+        with self._lock:
+            return self._job_estimate_locked()
+
+    def _wait_locked(self, position: int) -> float:
+        if position <= 0:
+            return 0.0
+        return math.ceil(position / self.max_workers) * self._job_estimate_locked()
+
+    def _retry_after_locked(self) -> int:
+        return max(1, math.ceil(self._job_estimate_locked() / self.max_workers))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": len(self._running),
+                "queued": len(self._pending),
+                "stage_seconds": dict(self._stage_seconds),
+            }
+
+    # ------------------------------------------
+    # Encerramento
+    # ------------------------------------------
+
+    def shutdown(self, timeout: float, drain: bool = False) -> List[str]:
+        """
+        Recusa novas submissões, descarta a fila, aguarda os jobs em execução e junta os workers.
+        Sem `drain`, os jobs são sinalizados a parar na próxima etapa; com `drain`, têm até
+        `timeout` para concluir antes do sinal. Retorna as sessões que não chegaram a executar.
+        """
+        with self._lock:
+            self._closed = True
+            descartadas = [entrada[2] for entrada in self._pending]
+            self._pending.clear()
+            self._pending_por_sessao.clear()
+            self._not_empty.notify_all()
+            self._idle.notify_all()
+
+        if not drain:
+            self.stopping.set()
+        if not self._wait_idle(timeout) and drain:
+            self.stopping.set()
+            self._wait_idle(timeout)
+
+        with self._lock:
+            restantes = list(self._running)
+        if restantes:
+            logger.warning(f"⚠️ Encerramento com {len(restantes)} workflows ainda em execução: {restantes}")
+        else:
+            # Sem jobs em execução, os workers saem assim que veem a fila fechada
+            for thread in self._threads():
+                thread.join(timeout)
+        return descartadas
+
+    def _threads(self) -> List[threading.Thread]:
+        with self._lock:
+            return list(self._workers)
+
+    def _wait_idle(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while self._running:
+                restante = deadline - time.monotonic()
+                if restante <= 0:
+                    return False
+                self._idle.wait(restante)
+            return True
+
+    # ------------------------------------------
+    # Workers
+    # ------------------------------------------
+
+    def _ensure_workers_locked(self):
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(
+                target=self._worker_loop,
+                name=f"workflow-worker-{len(self._workers) + 1}",
+                daemon=True
+            )
+            self._workers.append(worker)
+            worker.start()
+
+    def _worker_loop(self):
+        while True:
+            with self._lock:
+                while not self._pending and not self._closed:
+                    self._not_empty.wait()
+                if self._closed:
+                    return
+                _, _, session_id, job = self._pending.pop(0)
+                del self._pending_por_sessao[session_id]
+                self._running[session_id] = time.monotonic()
+
+            try:
+                self.runner(job)
+            except Exception as e:
+                logger.error(f"❌ Erro não tratado no job da sessão {session_id}: {e}")
+            finally:
+                with self._lock:
+                    self._running.pop(session_id, None)
+                    if not self._running:
+                        self._idle.notify_all()
+
+
+class SharedWorkflowScheduler(WorkflowScheduler):
+    """
+    Scheduler sobre a fila de um backend de estado compartilhado: qualquer processo enfileira,
+    e os workers de todos os processos disputam os jobs com lease renovada enquanto executam.
+    O runner retorna False quando o job foi interrompido (checkpoint) e deve voltar para a fila.
+    """
+
+    def __init__(self, backend, max_workers: int, max_queue: int, stage_dependencies: Dict[str, tuple] = None,
+                 runner: Callable[[Any], Any] = None, lease_seconds: float = 60, poll_interval: float = 0.5):
+        super().__init__(max_workers, max_queue, stage_dependencies, runner)
+        self.backend = backend
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self._renewer = None
+
+    @property
+    def worker_id(self) -> str:
+        # Lido a cada uso: o scheduler pode ser criado antes do fork (gunicorn --preload)
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def start(self):
+        """Sobe os workers sem esperar uma submissão local: jobs de outros processos também são executados aqui"""
+        with self._lock:
+            self._ensure_workers_locked()
+
+    def submit_many(self, jobs: List[Tuple[str, Any]]) -> List[int]:
+        with self._lock:
+            if self._closed:
+                raise SchedulerShutdownError(self._retry_after_locked())
+        posicoes = self.backend.enqueue_many(jobs, self.max_queue)
+        if posicoes is None:
+            with self._lock:
+                raise QueueFullError(self._retry_after_locked())
+        with self._lock:
+            self._ensure_workers_locked()
+            livres = self.max_workers - len(self._running)
+            self._not_empty.notify(len(jobs))
+        # Workers livres neste processo pegam os primeiros jobs da fila imediatamente
+        return [max(0, posicao - livres) if posicao else 0 for posicao in posicoes]
+
+    def position(self, session_id: str) -> Optional[int]:
+        return self.backend.position(session_id)
+
+    def cancel(self, session_id: str) -> Optional[Any]:
+        return self.backend.cancel(session_id)
+
+    def progress(self, session_id: str, completed_stages=()) -> Optional[Tuple[int, float]]:
+        posicao = self.backend.position(session_id)
+        if posicao is None:
+            return None
+        with self._lock:
+            return posicao, self._wait_locked(posicao) + self._remaining_locked(completed_stages)
+
+    def stats(self) -> Dict:
+        estatisticas = super().stats()
+        estatisticas.update(self.backend.queue_stats())
+        estatisticas["local_running"] = len(self._running)
+        estatisticas["worker_id"] = self.worker_id
+        return estatisticas
+
+    def _threads(self) -> List[threading.Thread]:
+        threads = super()._threads()
+        if self._renewer is not None:
+            threads.append(self._renewer)
+        return threads
+
+    def _ensure_workers_locked(self):
+        super()._ensure_workers_locked()
+        if self._renewer is None:
+            self._renewer = threading.Thread(target=self._renew_loop, name="workflow-lease-renewer", daemon=True)
+            self._renewer.start()
+
+    def _renew_loop(self):
+        # Renova até o último job deste processo terminar: no encerramento os jobs ainda gravam o checkpoint
+        while True:
+            with self._lock:
+                if not (self._closed and not self._running):
+                    self._idle.wait(self.lease_seconds / 3)
+                em_execucao = list(self._running)
+                if self._closed and not em_execucao:
+                    return
+            try:
+                self.backend.renew(em_execucao, self.worker_id, self.lease_seconds)
+            except Exception as e:
+                logger.error(f"❌ Erro ao renovar leases dos jobs: {e}")
+
+    def _worker_loop(self):
+        while True:
+            with self._lock:
+                if self._closed:
+                    return
+            try:
+                item = self.backend.claim(self.worker_id, self.lease_seconds)
+            except Exception as e:
+                logger.error(f"❌ Erro ao buscar job na fila compartilhada: {e}")
+                item = None
+            if item is None:
+                with self._lock:
+                    if not self._closed:
+                        self._not_empty.wait(self.poll_interval)
+                continue
+
+            session_id, payload = item
+            with self._lock:
+                self._running[session_id] = time.monotonic()
+            concluido = True
+            try:
+                concluido = self.runner(payload) is not False
+            except Exception as e:
+                logger.error(f"❌ Erro não tratado no job da sessão {session_id}: {e}")
+            finally:
+                try:
+                    if concluido:
+                        self.backend.ack(session_id)
+                    else:
+                        self.backend.release(session_id)
+                except Exception as e:
+                    logger.error(f"❌ Erro ao finalizar job da sessão {session_id} na fila: {e}")
+                with self._lock:
+                    self._running.pop(session_id, None)
+                    if not self._running:
+                        self._idle.notify_all()
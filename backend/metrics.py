@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ARQV18 Enhanced v18.0 - Metrics
+Contadores, gauges e histogramas em memória expostos no formato texto do Prometheus
+"""
+import bisect
+import math
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Buckets padrão de latência (segundos)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Buckets de tamanho de escrita (bytes)
+SIZE_BUCKETS = (128, 512, 1024, 2048, 4096, 8192, 16384, 65536, 262144, 1048576)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(valor: str) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatar_numero(valor: float) -> str:
+    if valor == math.inf:
+        return "+Inf"
+    if float(valor).is_integer():
+        return str(int(valor))
+    return repr(float(valor))
+
+
+def _formatar_labels(nomes: Sequence[str], valores: Sequence[str], extra: Tuple[str, str] = None) -> str:
+    pares = [f'{nome}="{_escape(valor)}"' for nome, valor in zip(nomes, valores)]
+    if extra is not None:
+        pares.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+class _Metric:
+    tipo = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _chave(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(nome, "")) for nome in self.labelnames)
+
+    def render(self) -> List[str]:
+        linhas = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.tipo}"]
+        linhas.extend(self._amostras())
+        return linhas
+
+    def _amostras(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    tipo = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._valores: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        chave = self._chave(labels)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + amount
+
+    def _amostras(self) -> List[str]:
+        with self._lock:
+            itens = list(self._valores.items())
+        return [f"{self.name}{_formatar_labels(self.labelnames, chave)} {_formatar_numero(valor)}"
+                for chave, valor in itens]
+
+
+class Gauge(_Metric):
+    """
+    Gauge com valor definido explicitamente ou calculado por uma função no momento da coleta
+    (com labelnames, a função retorna {tupla de valores dos labels: valor})
+    """
+    tipo = "gauge"
+
+    def __init__(self, *args, function: Optional[Callable[[], float]] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._valores: Dict[Tuple[str, ...], float] = {}
+        self._function = function
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._valores[self._chave(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        chave = self._chave(labels)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def _amostras(self) -> List[str]:
+        if self._function is not None:
+            if not self.labelnames:
+                return [f"{self.name} {_formatar_numero(self._function())}"]
+            return [f"{self.name}{_formatar_labels(self.labelnames, chave)} {_formatar_numero(valor)}"
+                    for chave, valor in self._function().items()]
+        with self._lock:
+            itens = list(self._valores.items())
+        return [f"{self.name}{_formatar_labels(self.labelnames, chave)} {_formatar_numero(valor)}"
+                for chave, valor in itens]
+
+
+class Histogram(_Metric):
+    tipo = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = LATENCY_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # chave -> [contagem por bucket (não cumulativa) + overflow, soma]
+        self._series: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, **labels):
+        chave = self._chave(labels)
+        indice = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                serie = self._series[chave] = [[0] * (len(self.buckets) + 1), 0.0]
+            serie[0][indice] += 1
+            serie[1] += value
+
+    def _amostras(self) -> List[str]:
+        with self._lock:
+            itens = [(chave, list(contagens), soma) for chave, (contagens, soma) in self._series.items()]
+
+        linhas = []
+        for chave, contagens, soma in itens:
+            acumulado = 0
+            for limite, contagem in zip(self.buckets + (math.inf,), contagens):
+                acumulado += contagem
+                labels = _formatar_labels(self.labelnames, chave, ("le", _formatar_numero(limite)))
+                linhas.append(f"{self.name}_bucket{labels} {acumulado}")
+            labels = _formatar_labels(self.labelnames, chave)
+            linhas.append(f"{self.name}_sum{labels} {_formatar_numero(soma)}")
+            linhas.append(f"{self.name}_count{labels} {acumulado}")
+        return linhas
+
+
+class MetricsRegistry:
+    """Conjunto de métricas do processo, renderizado em /api/metrics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _registrar(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Métrica duplicada: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._registrar(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+              function: Callable[[], float] = None) -> Gauge:
+        return self._registrar(Gauge(name, documentation, labelnames, function=function))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._registrar(Histogram(name, documentation, labelnames, buckets=buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metricas = list(self._metrics.values())
+        linhas = []
+        for metric in metricas:
+            linhas.extend(metric.render())
+        return "\n".join(linhas) + "\n"
+
+
+# Registro global do processo
+metrics_registry = MetricsRegistry()
+
+process_threads = metrics_registry.gauge(
+    "process_threads", "Threads ativas no processo", function=threading.active_count
+)
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ARQV18 Enhanced v18.0 - Rate Limiter
+Controle de admissão das rotas do workflow: token bucket por cliente e limite global de requisições simultâneas
+
+Os buckets ficam particionados em shards, cada um com seu lock, para que clientes diferentes não disputem
+o mesmo lock na rota de status. O reabastecimento é preguiçoso: calculado no acesso, sem thread de fundo.
+"""
+import logging
+import math
+import threading
+import time
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+# Partições dos buckets e clientes por partição antes de uma varredura de buckets ociosos
+SHARDS_PADRAO = 16
+CLIENTES_POR_SHARD = 1024
+
+
+class _Shard:
+    """Buckets de uma partição: cliente -> [tokens, instante do último acesso]"""
+
+    __slots__ = ("lock", "buckets", "limite_varredura", "permitidas", "recusadas")
+
+    def __init__(self, limite_varredura: int):
+        self.lock = threading.Lock()
+        self.buckets: Dict[str, List[float]] = {}
+        self.limite_varredura = limite_varredura
+        self.permitidas = 0
+        self.recusadas = 0
+
+
+class TokenBucketLimiter:
+    """
+    Token bucket por cliente: `rate` tokens por segundo até `burst` tokens acumulados.
+    Cada requisição consome `cost` tokens; sem saldo, é recusada com o tempo até haver saldo.
+    """
+
+    def __init__(self, rate: float, burst: float, shards: int = SHARDS_PADRAO,
+                 clientes_por_shard: int = CLIENTES_POR_SHARD):
+        if rate <= 0 or burst <= 0:
+            raise ValueError("rate e burst devem ser positivos")
+        self.rate = rate
+        self.burst = burst
+        self._clientes_por_shard = clientes_por_shard
+        self._shards = [_Shard(clientes_por_shard) for _ in range(shards)]
+
+    def _shard(self, cliente: str) -> _Shard:
+        return self._shards[hash(cliente) % len(self._shards)]
+
+    def acquire(self, cliente: str, cost: float = 1.0) -> float:
+        """
+        Consome `cost` tokens do cliente. Retorna 0 se a requisição foi admitida, ou os segundos até o
+        bucket ter saldo suficiente. Um custo acima da rajada nunca cabe no bucket: retorna infinito sem
+        consumir nada, e quem chama deve recusar a requisição de vez em vez de pedir nova tentativa.
+        """
+        if cost > self.burst:
+            return math.inf
+        agora = time.monotonic()
+        shard = self._shard(cliente)
+        with shard.lock:
+            bucket = shard.buckets.get(cliente)
+            if bucket is None:
+                bucket = shard.buckets[cliente] = [self.burst, agora]
+                if len(shard.buckets) > shard.limite_varredura:
+                    self._varrer_locked(shard, agora)
+            else:
+                bucket[0] = min(self.burst, bucket[0] + (agora - bucket[1]) * self.rate)
+                bucket[1] = agora
+
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                shard.permitidas += 1
+                return 0.0
+            shard.recusadas += 1
+            return (cost - bucket[0]) / self.rate
+
+    def tokens(self, cliente: str) -> float:
+        """Saldo atual do cliente, sem consumir (clientes sem bucket têm a rajada inteira)"""
+        shard = self._shard(cliente)
+        with shard.lock:
+            bucket = shard.buckets.get(cliente)
+            if bucket is None:
+                return self.burst
+            return min(self.burst, bucket[0] + (time.monotonic() - bucket[1]) * self.rate)
+
+    def _varrer_locked(self, shard: _Shard, agora: float):
+        """
+        Descarta os buckets que já reabasteceram por completo: equivalem a um bucket novo.
+        Buckets ainda em uso são mantidos (descartá-los devolveria tokens ao cliente).
+        """
+        ocioso = self.burst / self.rate
+        for cliente in [cliente for cliente, (_, ultimo) in shard.buckets.items() if agora - ultimo >= ocioso]:
+            del shard.buckets[cliente]
+        shard.limite_varredura = max(self._clientes_por_shard, 2 * len(shard.buckets))
+
+    def clients(self) -> int:
+        total = 0
+        for shard in self._shards:
+            with shard.lock:
+                total += len(shard.buckets)
+        return total
+
+    def stats(self) -> Dict[str, Any]:
+        permitidas = recusadas = clientes = 0
+        for shard in self._shards:
+            with shard.lock:
+                permitidas += shard.permitidas
+                recusadas += shard.recusadas
+                clientes += len(shard.buckets)
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "clients": clientes,
+            "allowed": permitidas,
+            "limited": recusadas,
+        }
+
+
+class ConcurrencyLimiter:
+    """Limite global de requisições simultâneas: entrada sem espera, recusada quando não há vaga"""
+
+    def __init__(self, limite: int):
+        if limite <= 0:
+            raise ValueError("limite deve ser positivo")
+        self.limite = limite
+        self._lock = threading.Lock()
+        self._em_andamento = 0
+        self._pico = 0
+        self._recusadas = 0
+
+    def try_enter(self) -> bool:
+        with self._lock:
+            if self._em_andamento >= self.limite:
+                self._recusadas += 1
+                return False
+            self._em_andamento += 1
+            self._pico = max(self._pico, self._em_andamento)
+            return True
+
+    def leave(self):
+        with self._lock:
+            self._em_andamento -= 1
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return self._em_andamento
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "max_concurrent": self.limite,
+                "in_flight": self._em_andamento,
+                "peak_in_flight": self._pico,
+                "rejected": self._recusadas,
+            }
+
+
+def retry_after_header(segundos: float) -> str:
+    """Retry-After em segundos inteiros, no mínimo 1"""
+    return str(max(1, math.ceil(segundos)))
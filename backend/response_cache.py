@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ARQV18 Enhanced v18.0 - Response Cache
+Cache LRU de respostas imutáveis já serializadas, com ETag e variantes comprimidas pré-calculadas
+"""
+import gzip
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+try:
+    import brotli  # opcional: sem ele, só gzip é oferecido
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Corpos menores que isso não compensam compressão
+MIN_COMPRESS_BYTES = 512
+
+
+class CachedResponse:
+    """Bytes serializados de uma resposta, com ETag forte e variantes gzip/brotli"""
+
+    __slots__ = ("body", "etag", "last_modified", "encoded", "size")
+
+    def __init__(self, body: bytes, last_modified: datetime):
+        self.body = body
+        self.etag = hashlib.sha256(body).hexdigest()
+        self.last_modified = last_modified.replace(microsecond=0)
+        self.encoded: Dict[str, bytes] = {}
+
+        if len(body) >= MIN_COMPRESS_BYTES:
+            self.encoded["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+            if brotli is not None:
+                self.encoded["br"] = brotli.compress(body, quality=11)
+
+        self.size = len(body) + sum(len(variante) for variante in self.encoded.values())
+
+    def select(self, accept_encodings) -> Tuple[Optional[str], bytes]:
+        """Escolhe a variante aceita pelo cliente (werkzeug Accept) que resulta no menor corpo"""
+        melhor, corpo = None, self.body
+        for encoding, variante in self.encoded.items():
+            if accept_encodings.quality(encoding) > 0 and len(variante) < len(corpo):
+                melhor, corpo = encoding, variante
+        return melhor, corpo
+
+
+class ResponseCache:
+    """LRU limitado por número de entradas e por bytes totais"""
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            entrada = self._entries.get(key)
+            if entrada is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entrada
+
+    def put(self, key: str, body: bytes, last_modified: datetime) -> CachedResponse:
+        entrada = CachedResponse(body, last_modified)
+        with self._lock:
+            anterior = self._entries.pop(key, None)
+            if anterior is not None:
+                self._bytes -= anterior.size
+            if entrada.size <= self.max_bytes:
+                self._entries[key] = entrada
+                self._bytes += entrada.size
+                while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                    _, removida = self._entries.popitem(last=False)
+                    self._bytes -= removida.size
+        return entrada
+
+    def invalidate(self, key: str):
+        with self._lock:
+            removida = self._entries.pop(key, None)
+            if removida is not None:
+                self._bytes -= removida.size
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+            }
+
+
+def parse_timestamp(timestamp: str) -> datetime:
+    """Converte os timestamps ISO (hora local) gravados pelo workflow para UTC"""
+    try:
+        return datetime.fromisoformat(timestamp).astimezone(timezone.utc)
+    except (TypeError, ValueError):
+        return datetime.now(timezone.utc)
@@ -1,8 +1,13 @@
 import logging
 import os
-from flask import Flask, jsonify
+import signal
+import sys
+from flask import Flask, jsonify, Response
 from flask_cors import CORS
 
+from metrics import metrics_registry, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from state_backend import StateBackendConfigError
+
 # Import the blueprint from the other file
 try:
     from enhanced_workflow_routes import enhanced_workflow_bp
@@ -10,6 +15,10 @@ except ImportError as e:
     # This helps in debugging if the file is not found or has issues.
     print(f"Não foi possível importar o blueprint: {e}")
     enhanced_workflow_bp = None
+except StateBackendConfigError as e:
+    # Misconfigured WORKFLOW_STATE_BACKEND: the app still starts and reports why the workflow API is missing
+    print(f"Configuração inválida do backend de estado: {e}")
+    enhanced_workflow_bp = None
 
 # Configure basic logging
 logging.basicConfig(
@@ -25,10 +34,11 @@ app = Flask(__name__)
 # This allows the frontend (running on a different origin) to communicate with the backend.
 CORS(app, resources={r"/api/*": {"origins": "*"}})
 
-# Ensure necessary directories for storing analysis data exist
+# Ensure necessary directories for storing analysis data exist (WORKFLOW_DATA_PATH, as in the blueprint)
+DATA_PATH = os.environ.get("WORKFLOW_DATA_PATH", "analyses_data")
 try:
-    os.makedirs("analyses_data/files", exist_ok=True)
-    os.makedirs("analyses_data/workflow", exist_ok=True)
+    os.makedirs(os.path.join(DATA_PATH, "files"), exist_ok=True)
+    os.makedirs(os.path.join(DATA_PATH, "workflow"), exist_ok=True)
     logger.info("✅ Diretórios para dados de análise estão prontos.")
 except OSError as e:
     logger.error(f"❌ Erro ao criar diretórios: {e}")
@@ -50,9 +60,16 @@ def index():
 def health_check():
     return jsonify({"status": "ok", "message": "Backend está saudável."})
 
+# Prometheus text-format metrics (stage latencies, writes, request latency, queue gauges)
+@app.route('/api/metrics')
+def metrics():
+    return Response(metrics_registry.render(), content_type=METRICS_CONTENT_TYPE)
+
 # This block allows running the server directly from the script
 if __name__ == '__main__':
     # Note: Flask's development server is not suitable for production.
     # Use a production-ready WSGI server like Gunicorn or uWSGI.
     logger.info("🚀 Iniciando servidor Flask de desenvolvimento em http://localhost:5000")
+    # Turn SIGTERM into a normal exit so atexit checkpoints in-flight workflows
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ARQV18 Enhanced v18.0 - Session Bundle
+Exportação dos artefatos das sessões em zip ou tar.gz, com memória constante
+
+Cada sessão vira a pasta <session_id>/ no arquivo, com um <etapa>.json por etapa salva
+(última gravação) e um manifest.json. Payloads em blob são copiados do disco em blocos.
+"""
+import glob
+import io
+import json
+import logging
+import os
+import tarfile
+import tempfile
+import time
+import zipfile
+import zlib
+from datetime import datetime
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Tamanho dos blocos copiados para o arquivo e entregues pelo stream
+CHUNK_SIZE = 64 * 1024
+
+FORMATOS = {
+    "zip": ("zip", "application/zip"),
+    "tar.gz": ("tar.gz", "application/gzip"),
+}
+
+
+class Artefato:
+    """Arquivo de um bundle: nome dentro do arquivo, tamanho, data e como abrir o conteúdo"""
+
+    __slots__ = ("nome", "tamanho", "mtime", "abrir")
+
+    def __init__(self, nome: str, tamanho: int, mtime: float, abrir: Callable[[], BinaryIO]):
+        self.nome = nome
+        self.tamanho = tamanho
+        self.mtime = mtime
+        self.abrir = abrir
+
+
+def _mtime(ts: str) -> float:
+    try:
+        return datetime.fromisoformat(ts).timestamp()
+    except (TypeError, ValueError):
+        return time.time()
+
+
+def _de_bytes(nome: str, conteudo: bytes, mtime: float) -> Artefato:
+    return Artefato(nome, len(conteudo), mtime, lambda: io.BytesIO(conteudo))
+
+
+# Registros da sessão de origem que entram no bundle de uma sessão concluída a partir do cache
+PREFIXO_ETAPAS_SINTESE = "sintese_"
+
+
+def _ultimos_registros(journal, session_id: str) -> Dict[str, Dict]:
+    ultimos: Dict[str, Dict] = {}
+    for registro in journal.read_records(session_id):
+        ultimos.pop(registro["etapa"], None)
+        ultimos[registro["etapa"]] = registro
+    return ultimos
+
+
+def artefatos_da_sessao(journal, session_id: str, state: Optional[Dict] = None) -> Iterator[Artefato]:
+    """
+    Artefatos de uma sessão: última gravação de cada etapa + manifest.json. Sessões concluídas a partir do
+    cache (state["cached_from"]) levam também a síntese e as seções gravadas na sessão de origem.
+    """
+    registros = [(session_id, registro) for registro in _ultimos_registros(journal, session_id).values()]
+    origem = (state or {}).get("cached_from")
+    if origem:
+        registros.extend(
+            (origem, registro) for nome_etapa, registro in _ultimos_registros(journal, origem).items()
+            if nome_etapa.startswith(PREFIXO_ETAPAS_SINTESE)
+        )
+
+    manifesto = {"session_id": session_id, "etapas": []}
+    if state is not None:
+        manifesto.update({campo: state.get(campo)
+                          for campo in ("segmento", "status", "created_at", "finished_at", "cached_from")})
+
+    for fonte, registro in registros:
+        nome_etapa = registro["etapa"]
+        nome = f"{session_id}/{nome_etapa}.json"
+        mtime = _mtime(registro["ts"])
+        caminho = journal.record_path(fonte, registro)
+        if caminho is not None:
+            artefato = Artefato(nome, os.path.getsize(caminho), mtime, lambda caminho=caminho: open(caminho, "rb"))
+        else:
+            artefato = _de_bytes(nome, journal.record_bytes(fonte, registro), mtime)
+        manifesto["etapas"].append({"etapa": nome_etapa, "ts": registro["ts"], "arquivo": nome,
+                                    "bytes": artefato.tamanho})
+        yield artefato
+
+    yield _de_bytes(
+        f"{session_id}/manifest.json",
+        json.dumps(manifesto, ensure_ascii=False, indent=2).encode("utf-8"),
+        time.time()
+    )
+
+
+# ==========================================
+# ESCRITA DOS ARQUIVOS
+# ==========================================
+
+class _SaidaEmBlocos:
+    """Destino de escrita não posicionável: acumula os bytes até o gerador drená-los"""
+
+    def __init__(self):
+        self._blocos: List[bytes] = []
+
+    def write(self, dados) -> int:
+        if dados:
+            self._blocos.append(bytes(dados))
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def drenar(self) -> Iterator[bytes]:
+        blocos, self._blocos = self._blocos, []
+        return iter(blocos)
+
+
+def _copiar_em_blocos(artefato: Artefato, gravar: Callable[[bytes], None],
+                     apos_bloco: Callable[[], Iterator[bytes]] = None) -> Iterator[bytes]:
+    with artefato.abrir() as origem:
+        while True:
+            bloco = origem.read(CHUNK_SIZE)
+            if not bloco:
+                break
+            gravar(bloco)
+            if apos_bloco is not None:
+                yield from apos_bloco()
+
+
+def _escrever_zip(destino, artefatos: Iterable[Artefato],
+                  apos_bloco: Callable[[], Iterator[bytes]] = None) -> Iterator[bytes]:
+    # Em destino não posicionável o zipfile grava data descriptors após cada membro
+    with zipfile.ZipFile(destino, "w", compression=zipfile.ZIP_DEFLATED) as arquivo:
+        for artefato in artefatos:
+            info = zipfile.ZipInfo(artefato.nome, time.localtime(artefato.mtime)[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.file_size = artefato.tamanho
+            with arquivo.open(info, "w", force_zip64=artefato.tamanho >= zipfile.ZIP64_LIMIT) as saida:
+                yield from _copiar_em_blocos(artefato, saida.write, apos_bloco)
+    if apos_bloco is not None:
+        yield from apos_bloco()
+
+
+def _escrever_tar_gz(destino, artefatos: Iterable[Artefato],
+                     apos_bloco: Callable[[], Iterator[bytes]] = None) -> Iterator[bytes]:
+    # tar montado bloco a bloco (cabeçalho, dados, padding) e comprimido em gzip incremental
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    total = 0
+
+    def gravar(dados: bytes):
+        nonlocal total
+        total += len(dados)
+        destino.write(compressor.compress(dados))
+
+    for artefato in artefatos:
+        info = tarfile.TarInfo(artefato.nome)
+        info.size = artefato.tamanho
+        info.mtime = int(artefato.mtime)
+        info.mode = 0o644
+        gravar(info.tobuf(tarfile.PAX_FORMAT))
+        yield from _copiar_em_blocos(artefato, gravar, apos_bloco)
+        resto = artefato.tamanho % tarfile.BLOCKSIZE
+        if resto:
+            gravar(tarfile.NUL * (tarfile.BLOCKSIZE - resto))
+
+    # Fim do arquivo: dois blocos zerados, completando o último registro
+    gravar(tarfile.NUL * (2 * tarfile.BLOCKSIZE))
+    resto = total % tarfile.RECORDSIZE
+    if resto:
+        gravar(tarfile.NUL * (tarfile.RECORDSIZE - resto))
+    destino.write(compressor.flush())
+    if apos_bloco is not None:
+        yield from apos_bloco()
+
+
+def escrever_bundle(formato: str, destino: BinaryIO, artefatos: Iterable[Artefato]):
+    """Grava o arquivo completo em `destino` (arquivo em disco)"""
+    escritor = _escrever_zip if formato == "zip" else _escrever_tar_gz
+    for _ in escritor(destino, artefatos):
+        pass
+
+
+def stream_bundle(formato: str, artefatos: Iterable[Artefato]) -> Iterator[bytes]:
+    """Gera o arquivo em blocos à medida que é escrito (sem arquivo temporário, memória constante)"""
+    saida = _SaidaEmBlocos()
+    escritor = _escrever_zip if formato == "zip" else _escrever_tar_gz
+    yield from escritor(saida, artefatos, saida.drenar)
+
+
+# ==========================================
+# CACHE EM DISCO
+# ==========================================
+
+class BundleCache:
+    """
+    Bundles de sessão gravados em disco (<base>/<session_id>-<versão>.<ext>) para serem servidos
+    com send_file: Range, ETag e sendfile do servidor WSGI. A versão muda a cada etapa gravada.
+    `on_resize(session_id, delta)` recebe a variação de bytes em disco dos bundles de cada sessão,
+    para que eles entrem no tamanho da sessão usado pela retenção.
+    """
+
+    def __init__(self, base_path: str, on_resize: Callable[[str, int], None] = None):
+        self.base_path = base_path
+        self.on_resize = on_resize
+
+    def path(self, session_id: str, versao: int, formato: str) -> str:
+        return os.path.join(self.base_path, f"{session_id}-{versao}.{FORMATOS[formato][0]}")
+
+    def get_or_build(self, session_id: str, versao: int, formato: str,
+                     artefatos: Callable[[], Iterable[Artefato]]) -> str:
+        destino = self.path(session_id, versao, formato)
+        if os.path.exists(destino):
+            return destino
+
+        os.makedirs(self.base_path, exist_ok=True)
+        fd, temporario = tempfile.mkstemp(dir=self.base_path, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                escrever_bundle(formato, f, artefatos())
+            # link não sobrescreve: se outra requisição gerou a mesma versão antes, o arquivo dela fica
+            os.link(temporario, destino)
+        except FileExistsError:
+            return destino
+        finally:
+            if os.path.exists(temporario):
+                os.unlink(temporario)
+
+        # Versões anteriores da mesma sessão e formato ficaram obsoletas
+        delta = os.path.getsize(destino) - self._apagar(session_id, f"*.{FORMATOS[formato][0]}", manter=destino)
+        self._notificar(session_id, delta)
+        logger.info(f"📦 Bundle {formato} da sessão {session_id} gerado em {destino}")
+        return destino
+
+    def invalidate(self, session_id: str):
+        self._notificar(session_id, -self._apagar(session_id, "*"))
+
+    def sizes(self) -> Dict[str, int]:
+        """Bytes em disco dos bundles de cada sessão (para recontar o tamanho das sessões na inicialização)"""
+        tamanhos: Dict[str, int] = {}
+        if not os.path.isdir(self.base_path):
+            return tamanhos
+        with os.scandir(self.base_path) as entradas:
+            for entrada in entradas:
+                if not entrada.is_file() or entrada.name.endswith(".tmp") or "-" not in entrada.name:
+                    continue
+                session_id = _sessao_do_arquivo(entrada.name)
+                tamanhos[session_id] = tamanhos.get(session_id, 0) + entrada.stat().st_size
+        return tamanhos
+
+    def _apagar(self, session_id: str, sufixo: str, manter: str = None) -> int:
+        """Apaga os bundles da sessão que casam com <session_id>-<sufixo>, exceto `manter`; retorna os bytes"""
+        liberados = 0
+        for caminho in glob.glob(os.path.join(self.base_path, f"{glob.escape(session_id)}-{sufixo}")):
+            # "<id>-*" também casa com sessões cujo id começa por "<id>-"
+            if caminho == manter or caminho.endswith(".tmp") or _sessao_do_arquivo(caminho) != session_id:
+                continue
+            try:
+                tamanho = os.path.getsize(caminho)
+                os.unlink(caminho)
+                liberados += tamanho
+            except OSError:
+                pass
+        return liberados
+
+    def _notificar(self, session_id: str, delta: int):
+        if delta and self.on_resize is not None:
+            self.on_resize(session_id, delta)
+
+
+def _sessao_do_arquivo(caminho: str) -> str:
+    return os.path.basename(caminho).rsplit("-", 1)[0]
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ARQV18 Enhanced v18.0 - Session Index
+Índice invertido das sessões por atributo da partida, mantido a cada etapa registrada
+
+Campos indexados: opponent, competition, venue, match_date, formation (formação do adversário) e status.
+As consultas e os agregados (confronto direto ao longo do tempo) saem da memória, sem ler os journals.
+
+Formação e confronto direto vêm das seções da síntese (sintese_secao_*) ou, nas sessões anteriores à
+gravação por seção e nas árvores legadas, da síntese completa (sintese_master_synthesis e synthesis_result
+da etapa 3). Referências a blobs nesses registros são resolvidas pelo `resolver` do índice em prepare(),
+fora do lock do registro de sessões. Sessões concluídas a partir do cache copiam os dois do documento da
+sessão de origem, inclusive quando ela é indexada depois (reconstrução).
+"""
+import base64
+import bisect
+import heapq
+import json
+import logging
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from session_journal import is_blob_ref
+from session_registry import ETAPA_CONCLUSAO_DO_CACHE, ETAPA_SECAO_SINTESE_PREFIXO
+
+logger = logging.getLogger(__name__)
+
+CAMPOS_INDICE = ("opponent", "competition", "venue", "match_date", "formation", "status")
+
+# Seções da síntese que alimentam o índice
+ETAPA_SECAO_TATICA = f"{ETAPA_SECAO_SINTESE_PREFIXO}tactical_analysis"
+ETAPA_SECAO_CONFRONTO = f"{ETAPA_SECAO_SINTESE_PREFIXO}head_to_head"
+# Registros com a síntese completa -> campo que a contém (None = o próprio payload)
+ETAPAS_SINTESE_COMPLETA = {
+    "sintese_master_synthesis": None,
+    "etapa3_sintese_concluida_full_workflow": "synthesis_result",
+}
+
+CAMPOS_CONFRONTO = ("total_matches", "corinthians_wins", "opponent_wins", "draws")
+
+
+def normalizar(campo: str, valor: Any) -> Optional[str]:
+    """Chave de índice do valor: texto sem caixa/espaços; datas como AAAA-MM-DD (None se vazio ou inválido)"""
+    if valor is None:
+        return None
+    texto = str(valor).strip()
+    if not texto:
+        return None
+    if campo == "match_date":
+        try:
+            return datetime.fromisoformat(texto).date().isoformat()
+        except ValueError:
+            return None
+    return texto.casefold()
+
+
+class SessionIndex:
+    """
+    Listas invertidas campo -> valor normalizado -> session_ids, atualizadas pelo SessionRegistry
+    (observador de record_stage/remove), com o documento resumido de cada sessão para os agregados.
+    """
+
+    def __init__(self, resolver: Callable[[str, Any], Any] = None):
+        # resolver(session_id, valor): conteúdo de um valor que pode ser referência a blob (None = identidade)
+        self._resolver = resolver
+        self._lock = threading.Lock()
+        self._postings: Dict[str, Dict[str, Set[str]]] = {campo: {} for campo in CAMPOS_INDICE}
+        # Valor como foi gravado na primeira vez, para exibir nas facetas
+        self._rotulos: Dict[str, Dict[str, str]] = {campo: {} for campo in CAMPOS_INDICE}
+        # Datas distintas em ordem, para consultas por intervalo
+        self._datas: List[str] = []
+        self._documentos: Dict[str, Dict[str, Any]] = {}
+        # Sessão de origem -> sessões concluídas a partir do cache com a síntese dela
+        self._copias: Dict[str, Set[str]] = {}
+
+    # ------------------------------------------
+    # Atualização (chamada pelo registro de sessões)
+    # ------------------------------------------
+
+    def prepare(self, session_id: str, nome_etapa: str, dados: Dict) -> Any:
+        """
+        Payload entregue a on_stage, com as seções que o índice lê já resolvidas (chamado pelo registro fora
+        do seu lock). Registros da síntese completa viram {"tactical_analysis", "head_to_head"}, ou {} se a
+        sessão já tem os dois no índice.
+        """
+        if not isinstance(dados, dict):
+            return dados
+        if nome_etapa in (ETAPA_SECAO_TATICA, ETAPA_SECAO_CONFRONTO):
+            return dict(dados, dados=self._resolver_valor(session_id, dados.get("dados")))
+        if nome_etapa in ETAPAS_SINTESE_COMPLETA:
+            with self._lock:
+                documento = self._documentos.get(session_id, {})
+                if "formation" in documento and "head_to_head" in documento:
+                    return {}
+            sintese = self._sintese_do_registro(session_id, nome_etapa, dados)
+            return {
+                secao: self._resolver_valor(session_id, sintese.get(secao))
+                for secao in ("tactical_analysis", "head_to_head")
+            }
+        return dados
+
+    def on_stage(self, session_id: str, nome_etapa: str, dados: Dict, state: Dict[str, Any]):
+        """Reindexa a sessão a partir do estado já atualizado e das seções da síntese (payload de prepare)"""
+        context = state["context"] or {}
+        with self._lock:
+            documento = self._documentos.setdefault(session_id, {"session_id": session_id})
+            documento["created_at"] = state["created_at"]
+            for campo in ("opponent", "competition", "venue", "match_date"):
+                self._definir_locked(documento, campo, context.get(campo))
+            self._definir_locked(documento, "status", state["status"])
+
+            if not isinstance(dados, dict):
+                return
+            if nome_etapa == ETAPA_SECAO_TATICA:
+                self._indexar_tatica_locked(documento, dados.get("dados"))
+            elif nome_etapa == ETAPA_SECAO_CONFRONTO:
+                self._indexar_confronto_locked(documento, dados.get("dados"))
+            elif nome_etapa in ETAPAS_SINTESE_COMPLETA and ("formation" not in documento
+                                                         or "head_to_head" not in documento):
+                self._indexar_tatica_locked(documento, dados.get("tactical_analysis"))
+                self._indexar_confronto_locked(documento, dados.get("head_to_head"))
+            elif nome_etapa == ETAPA_CONCLUSAO_DO_CACHE and dados.get("cached_from"):
+                documento["cached_from"] = dados["cached_from"]
+                self._copias.setdefault(documento["cached_from"], set()).add(session_id)
+                origem = self._documentos.get(documento["cached_from"])
+                if origem is not None:
+                    self._copiar_sintese_locked(origem, documento)
+
+    def _resolver_valor(self, session_id: str, valor: Any) -> Any:
+        if self._resolver is None or not is_blob_ref(valor):
+            return valor
+        return self._resolver(session_id, valor)
+
+    def _sintese_do_registro(self, session_id: str, nome_etapa: str, dados: Dict) -> Dict:
+        """Síntese completa do registro; as seções referenciadas por blob são resolvidas uma a uma por quem usa"""
+        campo = ETAPAS_SINTESE_COMPLETA[nome_etapa]
+        if campo is None:
+            # O registro de sessões acrescenta "timestamp" ao payload, que pode ser uma referência inteira
+            sintese = {chave: valor for chave, valor in dados.items() if chave != "timestamp"}
+        else:
+            sintese = dados.get(campo)
+        sintese = self._resolver_valor(session_id, sintese)
+        return sintese if isinstance(sintese, dict) else {}
+
+    def _indexar_tatica_locked(self, documento: Dict[str, Any], secao: Any):
+        if isinstance(secao, dict):
+            self._definir_locked(documento, "formation", secao.get("opponent_formation"))
+            documento["corinthians_formation"] = secao.get("corinthians_formation")
+            self._propagar_copias_locked(documento)
+
+    def _indexar_confronto_locked(self, documento: Dict[str, Any], secao: Any):
+        if isinstance(secao, dict):
+            documento["head_to_head"] = {campo: secao.get(campo) for campo in CAMPOS_CONFRONTO}
+            self._propagar_copias_locked(documento)
+
+    def _propagar_copias_locked(self, origem: Dict[str, Any]):
+        for session_id in self._copias.get(origem["session_id"], ()):
+            copia = self._documentos.get(session_id)
+            if copia is not None:
+                self._copiar_sintese_locked(origem, copia)
+
+    def _copiar_sintese_locked(self, origem: Dict[str, Any], copia: Dict[str, Any]):
+        """Formação e confronto direto da sessão de origem no documento de uma cópia do cache"""
+        if "formation" in origem:
+            self._definir_locked(copia, "formation", origem["formation"])
+            copia["corinthians_formation"] = origem.get("corinthians_formation")
+        if "head_to_head" in origem:
+            copia["head_to_head"] = dict(origem["head_to_head"])
+
+    def on_remove(self, session_id: str):
+        with self._lock:
+            documento = self._documentos.pop(session_id, None)
+            if documento is None:
+                return
+            copias = self._copias.get(documento.get("cached_from"))
+            if copias is not None:
+                copias.discard(session_id)
+                if not copias:
+                    del self._copias[documento["cached_from"]]
+            for campo in CAMPOS_INDICE:
+                self._retirar_locked(session_id, campo, normalizar(campo, documento.get(campo)))
+
+    def _definir_locked(self, documento: Dict[str, Any], campo: str, valor: Any):
+        if valor is None or documento.get(campo) == valor:
+            return
+        session_id = documento["session_id"]
+        self._retirar_locked(session_id, campo, normalizar(campo, documento.get(campo)))
+        documento[campo] = valor
+
+        chave = normalizar(campo, valor)
+        if chave is None:
+            return
+        lista = self._postings[campo].get(chave)
+        if lista is None:
+            lista = self._postings[campo][chave] = set()
+            self._rotulos[campo][chave] = chave if campo == "match_date" else str(valor).strip()
+            if campo == "match_date":
+                bisect.insort(self._datas, chave)
+        lista.add(session_id)
+
+    def _retirar_locked(self, session_id: str, campo: str, chave: Optional[str]):
+        lista = self._postings[campo].get(chave) if chave is not None else None
+        if lista is None:
+            return
+        lista.discard(session_id)
+        if not lista:
+            del self._postings[campo][chave]
+            del self._rotulos[campo][chave]
+            if campo == "match_date":
+                del self._datas[bisect.bisect_left(self._datas, chave)]
+
+    # ------------------------------------------
+    # Consultas
+    # ------------------------------------------
+
+    def search(self, filtros: Dict[str, str], data_de: str = None, data_ate: str = None,
+               limit: int = 50, cursor: str = None) -> Dict[str, Any]:
+        """
+        Sessões que atendem a todos os filtros (valor exato por campo, sem caixa) e ao intervalo de
+        match_date [data_de, data_ate], da partida mais recente para a mais antiga, em páginas de `limit`
+        a partir de `cursor`. Só os documentos da página são copiados; total, facetas e confronto direto
+        ao longo do tempo cobrem todas as sessões encontradas. ValueError se o cursor é inválido.
+        """
+        depois_de = _decodificar_cursor(cursor) if cursor else None
+        with self._lock:
+            encontrados = self._encontrar_locked(filtros, data_de, data_ate)
+            chaves = (self._chave_ordem_locked(session_id) for session_id in encontrados)
+            if depois_de is not None:
+                chaves = (chave for chave in chaves if chave < depois_de)
+            # Uma página a mais que o limite diz se há próxima, sem ordenar todas as encontradas
+            pagina = heapq.nlargest(limit + 1, chaves)
+            documentos = [dict(self._documentos[chave[-1]]) for chave in pagina[:limit]]
+            facetas = self._facetas_locked(encontrados)
+            confrontos = [
+                {campo: self._documentos[session_id].get(campo)
+                 for campo in ("session_id", "opponent", "match_date", "head_to_head")}
+                for session_id in encontrados if self._documentos[session_id].get("head_to_head")
+            ]
+
+        return {
+            "total": len(encontrados),
+            "count": len(documentos),
+            "sessions": documentos,
+            "next_cursor": _codificar_cursor(pagina[limit - 1]) if len(pagina) > limit else None,
+            "facets": facetas,
+            "head_to_head_trend": tendencia_confronto(confrontos),
+        }
+
+    def _encontrar_locked(self, filtros: Dict[str, str], data_de: Optional[str], data_ate: Optional[str]) -> Set[str]:
+        candidatos: List[Set[str]] = []
+        for campo, valor in filtros.items():
+            candidatos.append(self._postings[campo].get(normalizar(campo, valor), set()))
+
+        if data_de is not None or data_ate is not None:
+            inicio = bisect.bisect_left(self._datas, data_de) if data_de is not None else 0
+            fim = bisect.bisect_right(self._datas, data_ate) if data_ate is not None else len(self._datas)
+            no_intervalo: Set[str] = set()
+            for data in self._datas[inicio:fim]:
+                no_intervalo |= self._postings["match_date"][data]
+            candidatos.append(no_intervalo)
+
+        if not candidatos:
+            return set(self._documentos)
+        # Interseção a partir da menor lista
+        candidatos.sort(key=len)
+        encontrados = set(candidatos[0])
+        for lista in candidatos[1:]:
+            encontrados &= lista
+        return encontrados
+
+    def _chave_ordem_locked(self, session_id: str) -> Tuple[str, str, str]:
+        documento = self._documentos[session_id]
+        return (normalizar("match_date", documento.get("match_date")) or "", documento.get("created_at") or "",
+                session_id)
+
+    def _facetas_locked(self, session_ids: Set[str]) -> Dict[str, Dict[str, int]]:
+        """Contagem de sessões por valor de cada campo (exceto a data) entre as sessões informadas"""
+        facetas = {}
+        for campo in CAMPOS_INDICE:
+            if campo == "match_date":
+                continue
+            contagem = Counter(
+                self._rotulos[campo].get(normalizar(campo, self._documentos[session_id].get(campo)))
+                for session_id in session_ids if self._documentos[session_id].get(campo) is not None
+            )
+            facetas[campo] = dict(contagem.most_common())
+        return facetas
+
+    def values(self, campo: str) -> Dict[str, int]:
+        """Valores conhecidos de um campo e quantas sessões têm cada um"""
+        with self._lock:
+            return {self._rotulos[campo][chave]: len(lista) for chave, lista in self._postings[campo].items()}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._documentos)
+
+
+def _codificar_cursor(chave: Tuple[str, str, str]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(list(chave)).encode("utf-8")).decode("ascii")
+
+
+def _decodificar_cursor(cursor: str) -> Tuple[str, str, str]:
+    try:
+        chave = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+    except (ValueError, UnicodeError):
+        raise ValueError("Cursor de busca inválido")
+    if not isinstance(chave, list) or len(chave) != 3 or not all(isinstance(parte, str) for parte in chave):
+        raise ValueError("Cursor de busca inválido")
+    return tuple(chave)
+
+
+def tendencia_confronto(documentos: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Confronto direto ao longo do tempo: um ponto por sessão com head_to_head, em ordem de data da partida"""
+    pontos = []
+    for documento in documentos:
+        confronto = documento.get("head_to_head") or {}
+        total = confronto.get("total_matches")
+        if not isinstance(total, (int, float)) or total <= 0:
+            continue
+        pontos.append({
+            "session_id": documento["session_id"],
+            "opponent": documento.get("opponent"),
+            "match_date": normalizar("match_date", documento.get("match_date")),
+            **confronto,
+            "corinthians_win_rate": round((confronto.get("corinthians_wins") or 0) / total, 3),
+        })
+    pontos.sort(key=lambda ponto: ponto["match_date"] or "")
+
+    resumo = None
+    if pontos:
+        taxas = [ponto["corinthians_win_rate"] for ponto in pontos]
+        resumo = {
+            "points": len(pontos),
+            "avg_corinthians_win_rate": round(sum(taxas) / len(taxas), 3),
+            "first_win_rate": taxas[0],
+            "last_win_rate": taxas[-1],
+            "change": round(taxas[-1] - taxas[0], 3),
+        }
+    return {"points": pontos, "summary": resumo}
@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ARQV18 Enhanced v18.0 - Session Journal
+Journal append-only por sessão (JSONL compacto) com payloads grandes gravados uma única vez
+
+Layout de cada sessão em <base>/<session_id>/:
+    journal.jsonl          uma linha por etapa salva: {"etapa", "ts", "dados"}
+    blobs/<sha256>.json    payloads grandes, referenciados no journal por {"$blob": <sha256>}
+
+Sessões antigas (um arquivo <etapa>.json por etapa) continuam legíveis pelo leitor de compatibilidade
+e podem ser convertidas com: python session_journal.py migrate analyses_data/workflow
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_FILENAME = "journal.jsonl"
+BLOBS_DIRNAME = "blobs"
+BLOB_REF_KEY = "$blob"
+
+# Valores serializados acima deste tamanho vão para um blob endereçado por conteúdo
+BLOB_THRESHOLD_BYTES = int(os.environ.get("JOURNAL_BLOB_THRESHOLD_BYTES", "2048"))
+
+# fsync a cada append (durabilidade contra queda de energia, ao custo de latência)
+JOURNAL_FSYNC = os.environ.get("JOURNAL_FSYNC", "0") == "1"
+
+# Sessões com o índice de etapas (último registro de cada etapa) mantido em memória, em ordem de uso
+JOURNAL_INDEX_MAX_SESSIONS = int(os.environ.get("JOURNAL_INDEX_MAX_SESSIONS", "1024"))
+
+
+def serializar(dados: Any) -> bytes:
+    """Serialização canônica e compacta (mesmo conteúdo -> mesmos bytes -> mesmo hash)"""
+    return json.dumps(dados, ensure_ascii=False, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def is_blob_ref(valor: Any) -> bool:
+    return isinstance(valor, dict) and len(valor) == 1 and BLOB_REF_KEY in valor
+
+
+class _IndiceEtapas:
+    """Último registro de cada etapa de um journal, até `offset` (bytes já lidos do arquivo `inode`)"""
+
+    __slots__ = ("lock", "inode", "offset", "ultimos")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.inode = None
+        self.offset = 0
+        self.ultimos: Dict[str, Dict] = {}
+
+
+class SessionJournal:
+    """Leitura e escrita dos journals de sessão sob um diretório base"""
+
+    def __init__(self, base_path: str):
+        self.base_path = base_path
+        self._locks_guard = threading.Lock()
+        self._locks: Dict[str, threading.Lock] = {}
+        # Índices de etapas por sessão (LRU): last_record lê só as linhas acrescentadas desde a última consulta
+        self._indices_guard = threading.Lock()
+        self._indices: "OrderedDict[str, _IndiceEtapas]" = OrderedDict()
+
+    def _session_lock(self, session_id: str) -> threading.Lock:
+        with self._locks_guard:
+            lock = self._locks.get(session_id)
+            if lock is None:
+                lock = self._locks[session_id] = threading.Lock()
+            return lock
+
+    def session_path(self, session_id: str) -> str:
+        return os.path.join(self.base_path, session_id)
+
+    def journal_path(self, session_id: str) -> str:
+        return os.path.join(self.base_path, session_id, JOURNAL_FILENAME)
+
+    def blob_path(self, session_id: str, digest: str) -> str:
+        return os.path.join(self.base_path, session_id, BLOBS_DIRNAME, f"{digest}.json")
+
+    # ------------------------------------------
+    # Escrita
+    # ------------------------------------------
+
+    def append(self, session_id: str, nome_etapa: str, dados: Dict, blobs_novos: List[int] = None) -> int:
+        """
+        Acrescenta a etapa ao journal da sessão e retorna o total de bytes gravados em disco, incluindo os
+        blobs já gravados para o registro por compact_value (tamanhos acumulados em `blobs_novos`)
+        """
+        blobs_novos = [] if blobs_novos is None else blobs_novos
+        registro = self._registro(session_id, nome_etapa, dados, blobs_novos=blobs_novos)
+        linha = serializar(registro) + b"\n"
+
+        # Uma única write() em O_APPEND: leitores nunca veem uma linha pela metade de outra
+        with self._session_lock(session_id):
+            os.makedirs(self.session_path(session_id), exist_ok=True)
+            # O primeiro journal.jsonl esconderia os <etapa>.json de uma sessão antiga (retomada, cancelamento):
+            # ela é convertida antes, para o registro novo entrar depois dos checkpoints já gravados
+            if self.is_legacy(session_id):
+                self._migrar_locked(session_id)
+            fd = os.open(self.journal_path(session_id), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, linha)
+                if JOURNAL_FSYNC:
+                    os.fsync(fd)
+            finally:
+                os.close(fd)
+        return len(linha) + sum(blobs_novos)
+
+    def compact_value(self, session_id: str, valor: Any, blobs_novos: List[int]) -> Any:
+        """
+        Valor a citar em vários registros (ex.: a seção e a síntese completa): inline até BLOB_THRESHOLD_BYTES,
+        acima disso gravado uma única vez como blob e citado pela referência ({"$blob": sha256}).
+        Os bytes de blobs novos entram em `blobs_novos`, para serem somados pelo append do registro.
+        """
+        bruto = serializar(valor)
+        if len(bruto) <= BLOB_THRESHOLD_BYTES:
+            return valor
+        return {BLOB_REF_KEY: self._gravar_blob(session_id, bruto, blobs_novos)}
+
+    def _registro(self, session_id: str, nome_etapa: str, dados: Dict, ts: str = None,
+                  blobs_novos: List[int] = None) -> Dict:
+        return {
+            "etapa": nome_etapa,
+            "ts": ts or dados.get("timestamp") or datetime.now().isoformat(),
+            "dados": self._compactar(session_id, dados, blobs_novos if blobs_novos is not None else []),
+        }
+
+    def _compactar(self, session_id: str, dados: Dict, blobs_novos: List[int]) -> Dict:
+        """Move valores grandes (ou o payload inteiro) para blobs endereçados por conteúdo"""
+        if len(serializar(dados)) <= BLOB_THRESHOLD_BYTES:
+            return dados
+        if not isinstance(dados, dict):
+            return {BLOB_REF_KEY: self._gravar_blob(session_id, serializar(dados), blobs_novos)}
+
+        compactado = {}
+        for chave, valor in dados.items():
+            if isinstance(valor, (dict, list)):
+                bruto = serializar(valor)
+                if len(bruto) > BLOB_THRESHOLD_BYTES:
+                    valor = {BLOB_REF_KEY: self._gravar_blob(session_id, bruto, blobs_novos)}
+            compactado[chave] = valor
+
+        # Com referências a blobs o registro fica inline: um blob do payload inteiro repetiria o conteúdo delas
+        if len(serializar(compactado)) > BLOB_THRESHOLD_BYTES and not any(map(is_blob_ref, compactado.values())):
+            return {BLOB_REF_KEY: self._gravar_blob(session_id, serializar(dados), blobs_novos)}
+        return compactado
+
+    def _gravar_blob(self, session_id: str, bruto: bytes, blobs_novos: List[int]) -> str:
+        digest = hashlib.sha256(bruto).hexdigest()
+        destino = self.blob_path(session_id, digest)
+        if os.path.exists(destino):
+            return digest
+
+        diretorio = os.path.dirname(destino)
+        os.makedirs(diretorio, exist_ok=True)
+        fd, temporario = tempfile.mkstemp(dir=diretorio, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(bruto)
+            os.replace(temporario, destino)
+        except BaseException:
+            if os.path.exists(temporario):
+                os.unlink(temporario)
+            raise
+        blobs_novos.append(len(bruto))
+        return digest
+
+    # ------------------------------------------
+    # Leitura
+    # ------------------------------------------
+
+    def session_ids(self) -> Iterator[str]:
+        if not os.path.isdir(self.base_path):
+            return
+        with os.scandir(self.base_path) as sessoes:
+            for sessao in sessoes:
+                if sessao.is_dir():
+                    yield sessao.name
+
+    def session_size(self, session_id: str) -> int:
+        """Bytes ocupados pela sessão (journal, blobs e arquivos legados)"""
+        total = 0
+        pendentes = [self.session_path(session_id)]
+        while pendentes:
+            try:
+                with os.scandir(pendentes.pop()) as entradas:
+                    for entrada in entradas:
+                        if entrada.is_dir(follow_symlinks=False):
+                            pendentes.append(entrada.path)
+                        else:
+                            total += entrada.stat(follow_symlinks=False).st_size
+            except FileNotFoundError:
+                pass
+        return total
+
+    def delete_session(self, session_id: str):
+        """Apaga todos os arquivos da sessão (sob o lock dela: um append concorrente não recria a pasta pela metade)"""
+        with self._session_lock(session_id):
+            shutil.rmtree(self.session_path(session_id), ignore_errors=True)
+            with self._locks_guard:
+                self._locks.pop(session_id, None)
+        with self._indices_guard:
+            self._indices.pop(session_id, None)
+
+    def is_legacy(self, session_id: str) -> bool:
+        return (not os.path.exists(self.journal_path(session_id))
+                and os.path.isdir(self.session_path(session_id)))
+
+    def read_records(self, session_id: str) -> List[Dict]:
+        """Registros da sessão em ordem de gravação (referências a blobs não resolvidas)"""
+        if self.is_legacy(session_id):
+            return self._read_legacy_records(session_id)
+
+        registros = []
+        try:
+            with open(self.journal_path(session_id), "rb") as f:
+                for linha in f:
+                    if not linha.endswith(b"\n"):
+                        break  # append em andamento
+                    try:
+                        registros.append(json.loads(linha))
+                    except ValueError:
+                        logger.warning(f"⚠️ Linha inválida ignorada no journal da sessão {session_id}")
+        except FileNotFoundError:
+            pass
+        return registros
+
+    def read_stage(self, session_id: str, nome_etapa: str) -> Optional[Dict]:
+        """Dados completos da última gravação da etapa, ou None"""
+        registro = self.last_record(session_id, nome_etapa)
+        if registro is None:
+            return None
+        return self.resolve(session_id, registro["dados"])
+
+    def read_stage_bytes(self, session_id: str, nome_etapa: str) -> Optional[bytes]:
+        """Bytes canônicos da etapa (lidos direto do blob quando o payload inteiro é um blob)"""
+        registro = self.last_record(session_id, nome_etapa)
+        if registro is None:
+            return None
+        return self.record_bytes(session_id, registro)
+
+    def record_bytes(self, session_id: str, registro: Dict) -> bytes:
+        dados = registro["dados"]
+        if is_blob_ref(dados):
+            with open(self.blob_path(session_id, dados[BLOB_REF_KEY]), "rb") as f:
+                return f.read()
+        return serializar(self.resolve(session_id, dados))
+
+    def record_path(self, session_id: str, registro: Dict) -> Optional[str]:
+        """Arquivo com os bytes canônicos do registro, quando o payload inteiro está em um blob"""
+        dados = registro["dados"]
+        if not self.is_legacy(session_id) and is_blob_ref(dados):
+            return self.blob_path(session_id, dados[BLOB_REF_KEY])
+        return None
+
+    def stage_path(self, session_id: str, nome_etapa: str) -> Optional[str]:
+        """
+        Arquivo que contém exatamente o payload da etapa (blob do payload inteiro ou arquivo legado), ou None
+        se o payload está inline no journal
+        """
+        if self.is_legacy(session_id):
+            caminho = os.path.join(self.session_path(session_id), f"{nome_etapa}.json")
+            return caminho if os.path.exists(caminho) else None
+        registro = self.last_record(session_id, nome_etapa)
+        return self.record_path(session_id, registro) if registro is not None else None
+
+    def stage_locator(self, session_id: str, nome_etapa: str) -> Optional[str]:
+        """Onde a última gravação da etapa está: <journal.jsonl>#<etapa> (ou o arquivo legado), None se não há"""
+        if self.is_legacy(session_id):
+            return self.stage_path(session_id, nome_etapa)
+        if not self.has_stage(session_id, nome_etapa):
+            return None
+        return f"{self.journal_path(session_id)}#{nome_etapa}"
+
+    def has_stage(self, session_id: str, nome_etapa: str) -> bool:
+        return self.last_record(session_id, nome_etapa) is not None
+
+    def last_record(self, session_id: str, nome_etapa: str) -> Optional[Dict]:
+        """Última gravação da etapa, pelo índice da sessão (só as linhas novas do journal são lidas)"""
+        indice = self._indice_etapas(session_id)
+        if indice is not None:
+            return indice.ultimos.get(nome_etapa)
+        if not self.is_legacy(session_id):
+            return None
+        for registro in reversed(self._read_legacy_records(session_id)):
+            if registro["etapa"] == nome_etapa:
+                return registro
+        return None
+
+    def _indice_etapas(self, session_id: str) -> Optional[_IndiceEtapas]:
+        """Índice de etapas atualizado até o fim do journal, ou None se a sessão não tem journal"""
+        try:
+            f = open(self.journal_path(session_id), "rb")
+        except FileNotFoundError:
+            with self._indices_guard:
+                self._indices.pop(session_id, None)
+            return None
+
+        with self._indices_guard:
+            indice = self._indices.get(session_id)
+            if indice is None:
+                indice = self._indices[session_id] = _IndiceEtapas()
+                while len(self._indices) > JOURNAL_INDEX_MAX_SESSIONS:
+                    self._indices.popitem(last=False)
+            else:
+                self._indices.move_to_end(session_id)
+
+        with f, indice.lock:
+            estado = os.fstat(f.fileno())
+            if estado.st_ino != indice.inode or estado.st_size < indice.offset:
+                # Journal novo (sessão apagada e recriada, ou migrada do layout antigo): índice refeito
+                indice.inode, indice.offset, indice.ultimos = estado.st_ino, 0, {}
+            if estado.st_size > indice.offset:
+                f.seek(indice.offset)
+                for linha in f:
+                    if not linha.endswith(b"\n"):
+                        break  # append em andamento
+                    indice.offset += len(linha)
+                    try:
+                        registro = json.loads(linha)
+                    except ValueError:
+                        continue
+                    indice.ultimos[registro["etapa"]] = registro
+        return indice
+
+    def resolve(self, session_id: str, dados: Any) -> Any:
+        """Substitui as referências a blobs (no topo ou em campos de primeiro nível) pelo conteúdo"""
+        if is_blob_ref(dados):
+            with open(self.blob_path(session_id, dados[BLOB_REF_KEY]), "rb") as f:
+                return json.loads(f.read())
+        if isinstance(dados, dict):
+            return {
+                chave: self.resolve(session_id, valor) if is_blob_ref(valor) else valor
+                for chave, valor in dados.items()
+            }
+        return dados
+
+    # ------------------------------------------
+    # Compatibilidade com o layout antigo
+    # ------------------------------------------
+
+    def _read_legacy_records(self, session_id: str) -> List[Dict]:
+        """Lê sessões antigas: um <etapa>.json pretty-printed por etapa, ordenados por mtime"""
+        arquivos = []
+        with os.scandir(self.session_path(session_id)) as entradas:
+            for entrada in entradas:
+                if entrada.is_file() and entrada.name.endswith(".json"):
+                    arquivos.append((entrada.stat().st_mtime, entrada.name, entrada.path))
+        arquivos.sort()
+
+        registros = []
+        for mtime, nome, caminho in arquivos:
+            try:
+                with open(caminho, "r", encoding="utf-8") as f:
+                    dados = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"⚠️ Arquivo legado ilegível ignorado: {caminho} ({e})")
+                continue
+            timestamp = dados.get("timestamp") if isinstance(dados, dict) else None
+            registros.append({
+                "etapa": nome[:-len(".json")],
+                "ts": timestamp or datetime.fromtimestamp(mtime).isoformat(),
+                "dados": dados,
+            })
+        return registros
+
+    def migrate_legacy(self, session_id: str) -> bool:
+        """Converte uma sessão antiga para journal + blobs e remove os arquivos por etapa"""
+        with self._session_lock(session_id):
+            return self._migrar_locked(session_id)
+
+    def _migrar_locked(self, session_id: str) -> bool:
+        if not self.is_legacy(session_id):
+            return False
+
+        registros = self._read_legacy_records(session_id)
+        if not registros:
+            return False
+
+        # O journal só aparece (via rename) depois de completo; até lá a sessão segue legada
+        linhas = []
+        for registro in registros:
+            gravado = self._registro(session_id, registro["etapa"], registro["dados"], registro["ts"])
+            linhas.append(serializar(gravado) + b"\n")
+
+        temporario = self.journal_path(session_id) + ".tmp"
+        with open(temporario, "wb") as f:
+            f.writelines(linhas)
+        os.replace(temporario, self.journal_path(session_id))
+
+        for registro in registros:
+            os.unlink(os.path.join(self.session_path(session_id), f"{registro['etapa']}.json"))
+        return True
+
+
+def _migrar(base_path: str):
+    journal = SessionJournal(base_path)
+    migradas = 0
+    for session_id in journal.session_ids():
+        try:
+            if journal.migrate_legacy(session_id):
+                migradas += 1
+        except Exception as e:
+            logger.error(f"❌ Erro ao migrar sessão '{session_id}': {e}")
+    logger.info(f"✅ {migradas} sessões migradas para journal em {base_path}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if len(sys.argv) != 3 or sys.argv[1] != "migrate":
+        print("Uso: python session_journal.py migrate <analyses_data/workflow>")
+        sys.exit(1)
+    _migrar(sys.argv[2])
@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ARQV18 Enhanced v18.0 - Session Registry
+Registro em memória do estado das sessões do workflow
+"""
+import base64
+import bisect
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, Any, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# ==========================================
+# ETAPAS CONHECIDAS
+# ==========================================
+
+# Ordem das etapas exibidas no status: (chave do step_status, nome da etapa salva)
+WORKFLOW_STEPS = [
+    ("step1", "etapa1_concluida_full_workflow"),
+    ("step2", "verificacao_ai_concluida_full_workflow"),
+    ("step3", "etapa3_sintese_concluida_full_workflow"),
+    ("step4", "etapa4_geracao_concluida_full_workflow"),
+    ("cpl_devastador", "cpl_devastador_concluido_full_workflow"),
+]
+ETAPA_PARA_STEP = {etapa: step for step, etapa in WORKFLOW_STEPS}
+
+ETAPA_INICIO = "workflow_completo_iniciado"
+ETAPA_CONCLUSAO = "workflow_completo_concluido"
+# Conclusão a partir do cache de sínteses: registro único que aponta para a sessão de origem (cached_from)
+ETAPA_CONCLUSAO_DO_CACHE = "workflow_concluido_do_cache"
+ETAPA_ERRO = "workflow_erro"
+ETAPA_CANCELAMENTO = "workflow_cancelado"
+ETAPA_LOTE_CRIADO = "batch_criado"
+ETAPA_RETOMADA = "workflow_retomado"
+# Marca no feed dos backends compartilhados: a sessão foi apagada (retenção) por algum processo
+ETAPA_SESSAO_APAGADA = "sessao_apagada"
+# Seções da síntese gravadas uma a uma (sintese_secao_<seção>) antes da síntese completa
+ETAPA_SECAO_SINTESE_PREFIXO = "sintese_secao_"
+
+STATUS_EM_ANDAMENTO = "em_andamento"
+STATUS_CONCLUIDO = "concluido"
+STATUS_ERRO = "erro"
+STATUS_CANCELADO = "cancelado"
+
+# ==========================================
+# REGISTRO
+# ==========================================
+
+class SessionRegistry:
+    """Estado das sessões mantido em memória, atualizado a cada etapa salva"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self._conditions: Dict[str, threading.Condition] = {}
+        # Índice ordenado por (created_at, session_id) para listagem paginada
+        self._ordem: List[Tuple[str, str]] = []
+        # Índices derivados (on_stage/on_remove), atualizados junto com o estado
+        self._observadores: List[Any] = []
+        # Sessão de origem -> sessões concluídas a partir do cache que citam a síntese dela
+        self._copias: Dict[str, Set[str]] = {}
+
+    def add_observer(self, observador):
+        """
+        Registra um índice derivado: on_stage(session_id, etapa, dados, state) e on_remove(session_id).
+        O opcional prepare(session_id, etapa, dados) roda antes do lock do registro e devolve o payload
+        entregue a on_stage: E/S do observador (ex.: resolver blobs) não bloqueia os leitores de status.
+        """
+        with self._lock:
+            self._observadores.append(observador)
+
+    @staticmethod
+    def _new_state(session_id: str) -> Dict[str, Any]:
+        return {
+            "session_id": session_id,
+            "segmento": None,
+            "context": {},
+            "status": STATUS_EM_ANDAMENTO,
+            "completed_steps": {},
+            "synthesis_sections": {},
+            "cached_from": None,
+            "error": None,
+            "created_at": None,
+            "finished_at": None,
+            "last_update": None,
+            "version": 0,
+            "bytes": 0,
+        }
+
+    @staticmethod
+    def _chave_ordem(state: Dict[str, Any]) -> Tuple[str, str]:
+        return (state["created_at"] or "", state["session_id"])
+
+    def record_stage(self, session_id: str, nome_etapa: str, dados: Dict, bytes_written: int = 0):
+        """Registra a conclusão de uma etapa da sessão"""
+        timestamp = dados.get("timestamp") or datetime.now().isoformat()
+        preparados = [
+            (observador, observador.prepare(session_id, nome_etapa, dados) if hasattr(observador, "prepare") else dados)
+            for observador in list(self._observadores)
+        ]
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is None:
+                state = self._sessions[session_id] = self._new_state(session_id)
+                self._conditions[session_id] = threading.Condition(self._lock)
+                bisect.insort(self._ordem, self._chave_ordem(state))
+
+            if nome_etapa == ETAPA_INICIO:
+                self._remover_ordem_locked(state)
+                state["segmento"] = dados.get("segmento")
+                state["context"] = dados.get("context") or {}
+                state["created_at"] = timestamp
+                bisect.insort(self._ordem, self._chave_ordem(state))
+            elif nome_etapa in ETAPA_PARA_STEP:
+                state["completed_steps"][ETAPA_PARA_STEP[nome_etapa]] = timestamp
+            elif nome_etapa.startswith(ETAPA_SECAO_SINTESE_PREFIXO):
+                state["synthesis_sections"][nome_etapa[len(ETAPA_SECAO_SINTESE_PREFIXO):]] = timestamp
+            elif (nome_etapa in (ETAPA_CONCLUSAO, ETAPA_CONCLUSAO_DO_CACHE, ETAPA_ERRO, ETAPA_CANCELAMENTO)
+                  and state["status"] != STATUS_EM_ANDAMENTO):
+                # O primeiro desfecho no journal vale (a mesma ordem para todos os processos): um cancelamento
+                # gravado depois da conclusão, ou uma conclusão depois do cancelamento, não muda o status
+                pass
+            elif nome_etapa == ETAPA_CONCLUSAO:
+                state["status"] = STATUS_CONCLUIDO
+                state["finished_at"] = timestamp
+            elif nome_etapa == ETAPA_CONCLUSAO_DO_CACHE:
+                # Todas as etapas contam como concluídas; os resultados são lidos da sessão de origem
+                for step, _ in WORKFLOW_STEPS:
+                    state["completed_steps"][step] = timestamp
+                state["cached_from"] = dados.get("cached_from")
+                self._copias.setdefault(state["cached_from"], set()).add(session_id)
+                state["status"] = STATUS_CONCLUIDO
+                state["finished_at"] = timestamp
+            elif nome_etapa == ETAPA_ERRO:
+                state["status"] = STATUS_ERRO
+                state["error"] = dados.get("error", "Erro desconhecido")
+                state["finished_at"] = timestamp
+            elif nome_etapa == ETAPA_CANCELAMENTO:
+                state["status"] = STATUS_CANCELADO
+                state["finished_at"] = timestamp
+
+            state["last_update"] = timestamp
+            state["bytes"] += bytes_written
+            state["version"] += 1
+            for observador, payload in preparados:
+                observador.on_stage(session_id, nome_etapa, payload, state)
+            self._conditions[session_id].notify_all()
+
+    def apply_record(self, session_id: str, registro: Dict, bytes_written: int = 0):
+        """Aplica um registro lido do journal ({"etapa", "ts", "dados"})"""
+        if registro["etapa"] == ETAPA_SESSAO_APAGADA:
+            self.remove(session_id)
+            return
+        dados = registro["dados"] if isinstance(registro["dados"], dict) else {}
+        self.record_stage(session_id, registro["etapa"], dict(dados, timestamp=registro["ts"]), bytes_written)
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Retorna uma cópia do estado da sessão, ou None se desconhecida"""
+        with self._lock:
+            return self._snapshot(session_id)
+
+    def wait_for_update(self, session_id: str, version: int, timeout: float) -> Optional[Dict[str, Any]]:
+        """Aguarda até a sessão passar da versão informada (ou o timeout) e retorna o estado atual"""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            condition = self._conditions.get(session_id)
+            if condition is None:
+                return None
+            while session_id in self._sessions and self._sessions[session_id]["version"] <= version:
+                restante = deadline - time.monotonic()
+                if restante <= 0:
+                    break
+                condition.wait(restante)
+            return self._snapshot(session_id)
+
+    def _snapshot(self, session_id: str) -> Optional[Dict[str, Any]]:
+        state = self._sessions.get(session_id)
+        if state is None:
+            return None
+        snapshot = dict(state)
+        snapshot["completed_steps"] = dict(state["completed_steps"])
+        snapshot["synthesis_sections"] = dict(state["synthesis_sections"])
+        return snapshot
+
+    def session_ids(self) -> List[str]:
+        with self._lock:
+            return list(self._sessions)
+
+    def set_bytes(self, session_id: str, total: int):
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is not None:
+                state["bytes"] = total
+
+    def add_bytes(self, session_id: str, delta: int):
+        """Soma bytes ocupados fora do journal (ex.: bundles gerados para a sessão)"""
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is not None:
+                state["bytes"] = max(0, state["bytes"] + delta)
+
+    def remove(self, session_id: str):
+        """Remove a sessão do registro (ex.: apagada pela política de retenção)"""
+        with self._lock:
+            state = self._sessions.pop(session_id, None)
+            if state is None:
+                return
+            self._remover_ordem_locked(state)
+            copias = self._copias.get(state["cached_from"])
+            if copias is not None:
+                copias.discard(session_id)
+                if not copias:
+                    del self._copias[state["cached_from"]]
+            for observador in self._observadores:
+                observador.on_remove(session_id)
+            self._conditions.pop(session_id).notify_all()
+
+    def copies_of(self, session_id: str) -> List[str]:
+        """Sessões concluídas a partir do cache com a síntese desta sessão"""
+        with self._lock:
+            return sorted(self._copias.get(session_id, ()))
+
+    def _remover_ordem_locked(self, state: Dict[str, Any]):
+        chave = self._chave_ordem(state)
+        indice = bisect.bisect_left(self._ordem, chave)
+        if indice < len(self._ordem) and self._ordem[indice] == chave:
+            del self._ordem[indice]
+
+    # ------------------------------------------
+    # Índice de sessões
+    # ------------------------------------------
+
+    def page(self, limit: int, cursor: str = None,
+             predicate: Callable[[Dict[str, Any]], bool] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Sessões da mais recente para a mais antiga, a partir do cursor; retorna (itens, próximo cursor)"""
+        itens = []
+        with self._lock:
+            indice = len(self._ordem)
+            if cursor:
+                indice = bisect.bisect_left(self._ordem, _decodificar_cursor(cursor))
+
+            while indice > 0 and len(itens) < limit:
+                indice -= 1
+                session_id = self._ordem[indice][1]
+                state = self._sessions[session_id]
+                if predicate is None or predicate(state):
+                    itens.append(self._snapshot(session_id))
+
+            proximo = None
+            if itens and indice > 0:
+                proximo = _codificar_cursor(self._chave_ordem(self._sessions[itens[-1]["session_id"]]))
+        return itens, proximo
+
+    def finished_sessions(self) -> List[Dict[str, Any]]:
+        """Sessões encerradas (concluídas, com erro ou canceladas), da mais antiga para a mais recente"""
+        with self._lock:
+            encerradas = [
+                self._snapshot(session_id)
+                for _, session_id in self._ordem
+                if self._sessions[session_id]["status"] != STATUS_EM_ANDAMENTO
+            ]
+        return encerradas
+
+    def total_bytes(self) -> int:
+        with self._lock:
+            return sum(state["bytes"] for state in self._sessions.values())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    # ------------------------------------------
+    # Reconstrução a partir do disco
+    # ------------------------------------------
+
+    def rebuild(self, journal):
+        """Reconstrói o registro a partir dos journals (ou arquivos legados) das sessões em disco"""
+        total = 0
+        for session_id in journal.session_ids():
+            try:
+                for registro in journal.read_records(session_id):
+                    self.apply_record(session_id, registro)
+                self.set_bytes(session_id, journal.session_size(session_id))
+                total += 1
+            except Exception as e:
+                logger.error(f"❌ Erro ao reconstruir sessão '{session_id}': {e}")
+
+        logger.info(f"✅ Registro de sessões reconstruído: {total} sessões")
+
+
+def _codificar_cursor(chave: Tuple[str, str]) -> str:
+    return base64.urlsafe_b64encode("|".join(chave).encode("utf-8")).decode("ascii")
+
+
+def _decodificar_cursor(cursor: str) -> Tuple[str, str]:
+    try:
+        created_at, session_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+    except (ValueError, UnicodeError):
+        raise ValueError("Cursor de paginação inválido")
+    return created_at, session_id
+
+
+# ==========================================
+# LOTES
+# ==========================================
+
+class BatchRegistry:
+    """Lotes de sessões iniciados juntos (batch_id -> session_ids), persistidos no journal de lotes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._batches: Dict[str, Dict[str, Any]] = {}
+
+    def register(self, batch_id: str, session_ids: List[str], created_at: str = None):
+        with self._lock:
+            self._batches[batch_id] = {
+                "batch_id": batch_id,
+                "session_ids": list(session_ids),
+                "created_at": created_at or datetime.now().isoformat(),
+            }
+
+    def get(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            return dict(batch) if batch is not None else None
+
+    def apply_record(self, batch_id: str, registro: Dict):
+        if registro["etapa"] == ETAPA_LOTE_CRIADO:
+            self.register(batch_id, registro["dados"].get("session_ids", []), registro["ts"])
+
+    def rebuild(self, journal):
+        for batch_id in journal.session_ids():
+            for registro in journal.read_records(batch_id):
+                self.apply_record(batch_id, registro)
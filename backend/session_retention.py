@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ARQV18 Enhanced v18.0 - Session Retention
+Política de retenção de analyses_data/workflow executada em segundo plano
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _instante(state: Dict) -> datetime:
+    for campo in ("finished_at", "created_at", "last_update"):
+        try:
+            return datetime.fromisoformat(state[campo])
+        except (TypeError, ValueError, KeyError):
+            continue
+    return datetime.min
+
+
+class RetentionPolicy:
+    """Limites por idade, quantidade e bytes totais (0 desativa o limite)"""
+
+    def __init__(self, max_age_days: float = 0, max_sessions: int = 0, max_bytes: int = 0):
+        self.max_age_days = max_age_days
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.max_age_days or self.max_sessions or self.max_bytes)
+
+    def select(self, finished: List[Dict], total_sessions: int, total_bytes: int,
+               now: Optional[datetime] = None) -> List[str]:
+        """Escolhe as sessões encerradas a apagar, das mais antigas para as mais recentes"""
+        now = now or datetime.now()
+        encerradas = sorted(finished, key=_instante)
+        apagar = []
+
+        for state in encerradas:
+            excede_idade = bool(self.max_age_days) and now - _instante(state) > timedelta(days=self.max_age_days)
+            excede_qtd = bool(self.max_sessions) and total_sessions > self.max_sessions
+            excede_bytes = bool(self.max_bytes) and total_bytes > self.max_bytes
+            if not (excede_idade or excede_qtd or excede_bytes):
+                # Ordem por idade: se esta sessão fica, as mais recentes também ficam
+                break
+            apagar.append(state["session_id"])
+            total_sessions -= 1
+            total_bytes -= state.get("bytes", 0)
+
+        return apagar
+
+
+class RetentionWorker:
+    """Thread daemon que compacta sessões legadas e aplica a política de retenção periodicamente"""
+
+    def __init__(self, registry, journal, policy: RetentionPolicy, interval_seconds: float,
+                 on_delete: Callable[[str], None] = None):
+        self.registry = registry
+        self.journal = journal
+        self.policy = policy
+        self.interval_seconds = interval_seconds
+        self.on_delete = on_delete
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="session-retention", daemon=True)
+        self._thread.start()
+        logger.info(f"🧹 Retenção de sessões ativa (intervalo: {self.interval_seconds}s)")
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"❌ Erro na rotina de retenção: {e}")
+
+    def run_once(self) -> Dict[str, int]:
+        """Executa uma passada: compacta sessões legadas encerradas e apaga as excedentes"""
+        encerradas = self.registry.finished_sessions()
+
+        compactadas = 0
+        for state in encerradas:
+            session_id = state["session_id"]
+            if not self.journal.is_legacy(session_id):
+                continue
+            antes = self.journal.session_size(session_id)
+            if self.journal.migrate_legacy(session_id):
+                # Só a parte do journal muda: bytes de fora dele (bundles) continuam contados
+                delta = self.journal.session_size(session_id) - antes
+                self.registry.add_bytes(session_id, delta)
+                state["bytes"] = max(0, state["bytes"] + delta)
+                compactadas += 1
+
+        apagadas = 0
+        if self.policy.enabled:
+            selecionadas = self.policy.select(encerradas, len(self.registry), self.registry.total_bytes())
+            for session_id in selecionadas:
+                # Sessões concluídas a partir do cache só citam a síntese da origem: saem junto com ela
+                for alvo in [session_id, *self.registry.copies_of(session_id)]:
+                    if self.registry.get(alvo) is None:
+                        continue
+                    self.registry.remove(alvo)
+                    self.journal.delete_session(alvo)
+                    if self.on_delete is not None:
+                        self.on_delete(alvo)
+                    apagadas += 1
+
+        if compactadas or apagadas:
+            logger.info(f"🧹 Retenção: {compactadas} sessões compactadas, {apagadas} apagadas")
+        return {"compacted": compactadas, "deleted": apagadas}
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ARQV18 Enhanced v18.0 - Stage DAG
+Execução das etapas do workflow como um grafo de dependências em asyncio
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+StageFunc = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+
+class WorkflowInterrupted(Exception):
+    """
+    Execução parada entre etapas (encerramento do processo) ou abortada (cancelamento); as etapas
+    concluídas são o checkpoint
+    """
+
+
+class AbortHandle:
+    """
+    Aborta, de outra thread, uma execução do DAG (ex.: sessão cancelada): as etapas em andamento são
+    canceladas no próximo await e a execução termina com WorkflowInterrupted, liberando o worker
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._abortado = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tarefa: Optional[asyncio.Task] = None
+
+    def abort(self):
+        with self._lock:
+            self._abortado = True
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._cancelar)
+
+    def is_set(self) -> bool:
+        return self._abortado
+
+    def _vincular(self, loop: asyncio.AbstractEventLoop, tarefa: asyncio.Task):
+        with self._lock:
+            self._loop, self._tarefa = loop, tarefa
+            if self._abortado:
+                tarefa.cancel()
+
+    def _desvincular(self):
+        with self._lock:
+            self._loop = self._tarefa = None
+
+    def _cancelar(self):
+        # Roda no loop da execução: depois de _desvincular não há mais o que cancelar
+        if self._tarefa is not None:
+            self._tarefa.cancel()
+
+
+class Stage:
+    """Etapa do workflow: uma corrotina que recebe o contexto e declara suas dependências"""
+
+    def __init__(self, name: str, func: StageFunc, depends_on: Iterable[str] = ()):
+        self.name = name
+        self.func = func
+        self.depends_on = tuple(depends_on)
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, depends_on={self.depends_on!r})"
+
+
+class StageDAG:
+    """Grafo de etapas; etapas sem dependência entre si executam em paralelo"""
+
+    def __init__(self, stages: List[Stage]):
+        self.stages: Dict[str, Stage] = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError(f"Etapa duplicada no workflow: {stage.name}")
+            self.stages[stage.name] = stage
+
+        for stage in stages:
+            for dependencia in stage.depends_on:
+                if dependencia not in self.stages:
+                    raise ValueError(f"Etapa '{stage.name}' depende de etapa desconhecida '{dependencia}'")
+
+        self.order = self._topological_order()
+
+    def _topological_order(self) -> List[str]:
+        ordem, visitando, visitadas = [], set(), set()
+
+        def visitar(nome: str):
+            if nome in visitadas:
+                return
+            if nome in visitando:
+                raise ValueError(f"Ciclo de dependências envolvendo a etapa '{nome}'")
+            visitando.add(nome)
+            for dependencia in self.stages[nome].depends_on:
+                visitar(dependencia)
+            visitando.discard(nome)
+            visitadas.add(nome)
+            ordem.append(nome)
+
+        for nome in self.stages:
+            visitar(nome)
+        return ordem
+
+    def dependencies(self) -> Dict[str, tuple]:
+        """Dependências de cada etapa, em ordem topológica"""
+        return {nome: self.stages[nome].depends_on for nome in self.order}
+
+    async def run(self, ctx: Dict[str, Any],
+                  on_stage_done: Optional[Callable[[str, float], None]] = None,
+                  completed: Optional[Dict[str, Any]] = None,
+                  stop_event: Optional[threading.Event] = None,
+                  abort: Optional[AbortHandle] = None) -> Dict[str, Any]:
+        """
+        Executa o grafo; o resultado de cada etapa fica em ctx["results"][nome].
+        Etapas em `completed` (nome -> resultado) não são executadas de novo. Com `stop_event`
+        sinalizado, nenhuma etapa nova começa: as em andamento terminam e WorkflowInterrupted é lançada.
+        Com `abort` acionado, as etapas em andamento também são canceladas.
+        """
+        if abort is not None:
+            abort._vincular(asyncio.get_running_loop(), asyncio.current_task())
+        try:
+            return await self._executar(ctx, on_stage_done, completed, stop_event)
+        except asyncio.CancelledError:
+            if abort is None or not abort.is_set():
+                raise
+            raise WorkflowInterrupted("Execução abortada")
+        finally:
+            if abort is not None:
+                abort._desvincular()
+
+    async def _executar(self, ctx: Dict[str, Any],
+                        on_stage_done: Optional[Callable[[str, float], None]],
+                        completed: Optional[Dict[str, Any]],
+                        stop_event: Optional[threading.Event]) -> Dict[str, Any]:
+        resultados = ctx.setdefault("results", {})
+        resultados.update(completed or {})
+        tarefas: Dict[str, asyncio.Task] = {}
+
+        async def executar(stage: Stage):
+            if stage.name in resultados:
+                return
+            if stage.depends_on:
+                await asyncio.gather(*(tarefas[dependencia] for dependencia in stage.depends_on))
+            if stop_event is not None and stop_event.is_set():
+                raise WorkflowInterrupted(f"Execução interrompida antes da etapa '{stage.name}'")
+            inicio = time.monotonic()
+            resultados[stage.name] = await stage.func(ctx)
+            if on_stage_done is not None:
+                on_stage_done(stage.name, time.monotonic() - inicio)
+
+        for nome in self.order:
+            tarefas[nome] = asyncio.ensure_future(executar(self.stages[nome]))
+
+        try:
+            await asyncio.gather(*tarefas.values())
+        except WorkflowInterrupted:
+            # Etapas já iniciadas terminam e gravam seu checkpoint
+            await asyncio.gather(*tarefas.values(), return_exceptions=True)
+            raise
+        except BaseException:
+            for tarefa in tarefas.values():
+                tarefa.cancel()
+            await asyncio.gather(*tarefas.values(), return_exceptions=True)
+            raise
+
+        return resultados
+
+    def run_sync(self, ctx: Dict[str, Any],
+                 on_stage_done: Optional[Callable[[str, float], None]] = None,
+                 completed: Optional[Dict[str, Any]] = None,
+                 stop_event: Optional[threading.Event] = None,
+                 abort: Optional[AbortHandle] = None) -> Dict[str, Any]:
+        """Executa o grafo em um event loop próprio (para uso em threads de worker)"""
+        try:
+            return asyncio.run(self.run(ctx, on_stage_done, completed, stop_event, abort))
+        except asyncio.CancelledError:
+            # Abortada depois do último await: o cancelamento pendente encerra a tarefa principal
+            if abort is None or not abort.is_set():
+                raise
+            raise WorkflowInterrupted("Execução abortada")
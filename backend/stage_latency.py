@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ARQV18 Enhanced v18.0 - Stage Latency
+Latência simulada das etapas do workflow: fixa (inclusive zero) ou amostrada de distribuições gravadas
+"""
+import json
+import os
+import random
+import threading
+from typing import Dict, List, Sequence, Union
+
+# Chave usada para etapas sem distribuição própria
+PADRAO = "default"
+
+
+class StageLatency:
+    """
+    Modelo de latência por etapa. Cada etapa tem uma lista de amostras (segundos);
+    sample() sorteia uma delas. Uma lista com um único valor equivale a latência fixa.
+    """
+
+    def __init__(self, samples: Dict[str, Sequence[float]], seed: int = None):
+        self._samples: Dict[str, List[float]] = {}
+        for stage, valores in samples.items():
+            if isinstance(valores, (int, float)):
+                valores = [valores]
+            valores = [float(v) for v in valores]
+            if not valores or any(v < 0 for v in valores):
+                raise ValueError(f"Distribuição inválida para a etapa '{stage}'")
+            self._samples[stage] = valores
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def fixed(cls, seconds: float) -> "StageLatency":
+        return cls({PADRAO: [seconds]})
+
+    @classmethod
+    def from_file(cls, path: str, seed: int = None) -> "StageLatency":
+        """Carrega {"default": [...], "step1": [...], ...} (listas de segundos ou um número)"""
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f), seed=seed)
+
+    @classmethod
+    def from_spec(cls, spec: Union[str, float], seed: int = None) -> "StageLatency":
+        """Um número (segundos para todas as etapas) ou o caminho de um arquivo de distribuições"""
+        try:
+            return cls.fixed(float(spec))
+        except ValueError:
+            pass
+        if not os.path.isfile(spec):
+            raise ValueError(f"Latência de etapa inválida: '{spec}' não é número nem arquivo")
+        return cls.from_file(spec, seed=seed)
+
+    def sample(self, stage: str) -> float:
+        valores = self._samples.get(stage) or self._samples.get(PADRAO)
+        if not valores:
+            return 0.0
+        if len(valores) == 1:
+            return valores[0]
+        with self._lock:
+            return self._random.choice(valores)
+
+    def describe(self) -> Dict[str, Dict[str, float]]:
+        """Resumo das distribuições (para registrar junto dos resultados do benchmark)"""
+        return {
+            stage: {"samples": len(valores), "min": min(valores), "max": max(valores),
+                    "mean": sum(valores) / len(valores)}
+            for stage, valores in self._samples.items()
+        }
@@ -0,0 +1,1088 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ARQV18 Enhanced v18.0 - State Backend
+Onde ficam os registros das sessões, a fila de jobs e os resultados do workflow
+
+Backends (variável WORKFLOW_STATE_BACKEND):
+    files                          journal em disco (padrão): um único processo, fila em memória
+    sqlite:///state.db             SQLite em modo WAL: vários processos (workers do gunicorn) no mesmo host.
+                                   Caminho relativo ao diretório de dados (analyses_data/state.db);
+                                   absoluto com quatro barras: sqlite:////var/lib/arqv18/state.db
+    memory                         stand-in local do store em rede, no próprio processo
+    redis://host:6379/0            store em rede compartilhado entre hosts (requer o pacote `redis`)
+
+Nos backends compartilhados qualquer processo aceita inícios, executa jobs e responde status:
+cada processo mantém seu registro em memória atualizado pelo feed de mudanças (changes_since).
+Sessões apagadas deixam no feed um registro ETAPA_SESSAO_APAGADA, para que os demais processos
+(e os que sobem depois, reaplicando o feed desde o início) também as removam.
+"""
+import bisect
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from session_journal import SessionJournal, serializar, is_blob_ref, BLOB_REF_KEY, BLOB_THRESHOLD_BYTES, JOURNAL_FSYNC
+from job_scheduler import chave_prioridade
+from session_registry import ETAPA_SESSAO_APAGADA
+
+try:
+    import redis  # opcional: só necessário para redis://
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# Registros lidos por chamada ao feed de mudanças
+CHANGES_BATCH = 1000
+
+# Parâmetros por consulta SQLite com IN (...): builds antigos limitam a 999 variáveis por comando
+SQLITE_IN_BATCH = 500
+
+
+class StateBackendConfigError(ValueError):
+    """WORKFLOW_STATE_BACKEND inválido ou inutilizável (backend desconhecido, caminho sem permissão...)"""
+
+
+# Mudança no feed: (session_id, registro {"etapa", "ts", "dados"}, bytes)
+Mudanca = Tuple[str, Dict, int]
+
+
+def novo_registro(nome_etapa: str, dados: Dict) -> Dict:
+    return {
+        "etapa": nome_etapa,
+        "ts": (dados.get("timestamp") if isinstance(dados, dict) else None) or datetime.now().isoformat(),
+        "dados": dados,
+    }
+
+
+# ==========================================
+# JOURNAL SOBRE REGISTROS
+# ==========================================
+
+class RecordJournal:
+    """
+    Mesma interface de leitura/escrita do SessionJournal para stores que guardam os registros
+    inteiros (sem arquivos legados; blobs só os gravados explicitamente por compact_value).
+    Subclasses implementam o armazenamento.
+    """
+
+    def append(self, session_id: str, nome_etapa: str, dados: Dict, blobs_novos: List[int] = None) -> int:
+        """Grava o registro e retorna os bytes gravados, somados aos dos blobs novos citados por ele"""
+        raise NotImplementedError
+
+    def read_records(self, session_id: str) -> List[Dict]:
+        raise NotImplementedError
+
+    def session_ids(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def session_size(self, session_id: str) -> int:
+        raise NotImplementedError
+
+    def delete_session(self, session_id: str):
+        raise NotImplementedError
+
+    def changes_since(self, cursor: int, limit: int = CHANGES_BATCH) -> Tuple[List[Mudanca], int]:
+        """Registros gravados por qualquer processo depois do cursor, e o novo cursor"""
+        raise NotImplementedError
+
+    def journal_path(self, session_id: str) -> str:
+        raise NotImplementedError
+
+    def last_record(self, session_id: str, nome_etapa: str) -> Optional[Dict]:
+        for registro in reversed(self.read_records(session_id)):
+            if registro["etapa"] == nome_etapa:
+                return registro
+        return None
+
+    def read_stage(self, session_id: str, nome_etapa: str) -> Optional[Dict]:
+        registro = self.last_record(session_id, nome_etapa)
+        return self.resolve(session_id, registro["dados"]) if registro is not None else None
+
+    def read_stage_bytes(self, session_id: str, nome_etapa: str) -> Optional[bytes]:
+        registro = self.last_record(session_id, nome_etapa)
+        return self.record_bytes(session_id, registro) if registro is not None else None
+
+    def record_bytes(self, session_id: str, registro: Dict) -> bytes:
+        dados = registro["dados"]
+        if is_blob_ref(dados):
+            return self._ler_blob(session_id, dados[BLOB_REF_KEY])
+        return serializar(self.resolve(session_id, dados))
+
+    def record_path(self, session_id: str, registro: Dict) -> Optional[str]:
+        return None
+
+    def has_stage(self, session_id: str, nome_etapa: str) -> bool:
+        return self.last_record(session_id, nome_etapa) is not None
+
+    def stage_path(self, session_id: str, nome_etapa: str) -> Optional[str]:
+        """Não há arquivo local por etapa: os payloads ficam no store"""
+        return None
+
+    def stage_locator(self, session_id: str, nome_etapa: str) -> Optional[str]:
+        """Localizador do registro da etapa no store (<journal>#<etapa>), None se não há"""
+        if not self.has_stage(session_id, nome_etapa):
+            return None
+        return f"{self.journal_path(session_id)}#{nome_etapa}"
+
+    def compact_value(self, session_id: str, valor: Any, blobs_novos: List[int]) -> Any:
+        """Valor inline até BLOB_THRESHOLD_BYTES, senão blob da sessão citado pela referência ({"$blob": sha256})"""
+        bruto = serializar(valor)
+        if len(bruto) <= BLOB_THRESHOLD_BYTES:
+            return valor
+        digest = hashlib.sha256(bruto).hexdigest()
+        if self._gravar_blob(session_id, digest, bruto):
+            blobs_novos.append(len(bruto))
+        return {BLOB_REF_KEY: digest}
+
+    def _gravar_blob(self, session_id: str, digest: str, bruto: bytes) -> bool:
+        """Grava o blob se ainda não existe; True se foi gravado agora"""
+        raise NotImplementedError
+
+    def _ler_blob(self, session_id: str, digest: str) -> bytes:
+        raise NotImplementedError
+
+    def resolve(self, session_id: str, dados: Any) -> Any:
+        """Substitui as referências a blobs (no topo ou em campos de primeiro nível) pelo conteúdo"""
+        if is_blob_ref(dados):
+            return json.loads(self._ler_blob(session_id, dados[BLOB_REF_KEY]))
+        if isinstance(dados, dict):
+            return {
+                chave: self.resolve(session_id, valor) if is_blob_ref(valor) else valor
+                for chave, valor in dados.items()
+            }
+        return dados
+
+    def is_legacy(self, session_id: str) -> bool:
+        return False
+
+    def migrate_legacy(self, session_id: str) -> bool:
+        return False
+
+
+# ==========================================
+# BACKENDS
+# ==========================================
+
+class StateBackend:
+    """
+    Backend de estado. `journal(categoria)` dá acesso aos registros; nos backends compartilhados
+    (`shared`), a fila de jobs também vive no backend:
+
+        enqueue_many([(job_id, payload)], limit) -> posições, ou None se exceder o limite da fila
+        claim(worker_id, lease_seconds)          -> (job_id, payload) ou None
+        renew(job_ids, worker_id, lease_seconds) / ack(job_id) / release(job_id)
+        cancel(job_id)                           -> payload do job retirado da fila, ou None se não pendente
+        position(job_id)                         -> 0 em execução, n >= 1 na fila, None desconhecido
+        queue_stats()                            -> {"queued", "running"}
+
+    A fila entrega os jobs pela `chave_prioridade` do payload (prioridade e prazo), depois por
+    ordem de chegada. Jobs com lease vencida (worker que caiu) voltam a ser entregues por claim().
+
+    Todos os backends guardam a última leitura de status de cada sessão (record_reads /
+    last_reads), usada para cancelar execuções que nenhum cliente acompanha mais.
+    """
+
+    shared = False
+
+    def __init__(self):
+        self._leituras: Dict[str, float] = {}
+
+    def journal(self, categoria: str):
+        raise NotImplementedError
+
+    def record_reads(self, session_ids: List[str], timestamp: float):
+        """Registra que um cliente leu o status das sessões em `timestamp` (epoch)"""
+        for session_id in session_ids:
+            self._leituras[session_id] = timestamp
+
+    def last_reads(self, session_ids: List[str]) -> Dict[str, float]:
+        """Última leitura de status de cada sessão (ausente se nunca lida)"""
+        return {session_id: self._leituras[session_id] for session_id in session_ids if session_id in self._leituras}
+
+    def forget_reads(self, session_ids: List[str]):
+        for session_id in session_ids:
+            self._leituras.pop(session_id, None)
+
+    def enqueue_many(self, jobs: List[Tuple[str, Dict]], limit: int) -> Optional[List[int]]:
+        raise NotImplementedError
+
+    def claim(self, worker_id: str, lease_seconds: float) -> Optional[Tuple[str, Dict]]:
+        raise NotImplementedError
+
+    def renew(self, job_ids: List[str], worker_id: str, lease_seconds: float):
+        raise NotImplementedError
+
+    def ack(self, job_id: str):
+        raise NotImplementedError
+
+    def release(self, job_id: str):
+        raise NotImplementedError
+
+    def cancel(self, job_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def position(self, job_id: str) -> Optional[int]:
+        raise NotImplementedError
+
+    def queue_stats(self) -> Dict[str, int]:
+        raise NotImplementedError
+
+
+class FileStateBackend(StateBackend):
+    """Journals em analyses_data/<categoria>/ - estado de um único processo"""
+
+    def __init__(self, base_path: str):
+        super().__init__()
+        self.base_path = base_path
+        self._lock = threading.Lock()
+        self._journals: Dict[str, SessionJournal] = {}
+
+    def journal(self, categoria: str) -> SessionJournal:
+        with self._lock:
+            journal = self._journals.get(categoria)
+            if journal is None:
+                journal = self._journals[categoria] = SessionJournal(os.path.join(self.base_path, categoria))
+            return journal
+
+
+# ------------------------------------------
+# SQLite (WAL)
+# ------------------------------------------
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS registros (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    categoria TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    etapa TEXT NOT NULL,
+    ts TEXT NOT NULL,
+    dados BLOB NOT NULL,
+    bytes_blobs INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS registros_sessao ON registros (categoria, session_id, seq);
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    payload TEXT NOT NULL,
+    estado TEXT NOT NULL,
+    worker TEXT,
+    lease_ate REAL,
+    ordem INTEGER NOT NULL,
+    prioridade REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS leituras (
+    session_id TEXT PRIMARY KEY,
+    em REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS blobs (
+    categoria TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    dados BLOB NOT NULL,
+    PRIMARY KEY (categoria, session_id, digest)
+);
+"""
+
+# Bancos criados por versões anteriores (sem fila por prioridade ou sem os bytes dos blobs de cada
+# registro) ganham as colunas na abertura
+_SQLITE_MIGRACOES = [
+    ("jobs", "prioridade", "ALTER TABLE jobs ADD COLUMN prioridade REAL NOT NULL DEFAULT 0"),
+    ("registros", "bytes_blobs", "ALTER TABLE registros ADD COLUMN bytes_blobs INTEGER NOT NULL DEFAULT 0"),
+]
+
+_SQLITE_INDICES = """
+CREATE INDEX IF NOT EXISTS jobs_fila_prioridade ON jobs (estado, prioridade, ordem);
+CREATE INDEX IF NOT EXISTS registros_feed ON registros (categoria, seq);
+"""
+
+JOB_NA_FILA = "fila"
+JOB_EM_EXECUCAO = "executando"
+
+
+def _em_blocos(valores: List[str], tamanho: int = SQLITE_IN_BATCH) -> Iterator[List[str]]:
+    for inicio in range(0, len(valores), tamanho):
+        yield valores[inicio:inicio + tamanho]
+
+
+class SQLiteStateBackend(StateBackend):
+    """Registros e fila em um arquivo SQLite (WAL), compartilhado pelos processos do host"""
+
+    shared = True
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        diretorio = os.path.dirname(os.path.abspath(path))
+        os.makedirs(diretorio, exist_ok=True)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._journals: Dict[str, "SQLiteJournal"] = {}
+        conexao = self._conexao()
+        conexao.executescript(_SQLITE_SCHEMA)
+        for tabela, coluna, comando in _SQLITE_MIGRACOES:
+            if coluna not in {linha[1] for linha in conexao.execute(f"PRAGMA table_info({tabela})")}:
+                conexao.execute(comando)
+        conexao.executescript(_SQLITE_INDICES)
+
+    def _conexao(self) -> sqlite3.Connection:
+        conexao = getattr(self._local, "conexao", None)
+        if conexao is None:
+            # Uma conexão por thread; transações explícitas (BEGIN IMMEDIATE) onde há leitura + escrita
+            conexao = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conexao.execute("PRAGMA journal_mode=WAL")
+            conexao.execute(f"PRAGMA synchronous={'FULL' if JOURNAL_FSYNC else 'NORMAL'}")
+            self._local.conexao = conexao
+        return conexao
+
+    @contextmanager
+    def _transacao(self):
+        conexao = self._conexao()
+        conexao.execute("BEGIN IMMEDIATE")
+        try:
+            yield conexao
+        except BaseException:
+            conexao.execute("ROLLBACK")
+            raise
+        conexao.execute("COMMIT")
+
+    def journal(self, categoria: str) -> "SQLiteJournal":
+        with self._lock:
+            journal = self._journals.get(categoria)
+            if journal is None:
+                journal = self._journals[categoria] = SQLiteJournal(self, categoria)
+            return journal
+
+    # Fila de jobs
+
+    def enqueue_many(self, jobs: List[Tuple[str, Dict]], limit: int) -> Optional[List[int]]:
+        with self._transacao() as conexao:
+            existentes = {
+                linha[0]
+                for bloco in _em_blocos([job_id for job_id, _ in jobs])
+                for linha in conexao.execute(f"SELECT job_id FROM jobs WHERE job_id IN ({','.join('?' * len(bloco))})", bloco)
+            }
+            novos = [(job_id, payload) for job_id, payload in jobs if job_id not in existentes]
+            na_fila = conexao.execute("SELECT COUNT(*) FROM jobs WHERE estado = ?", (JOB_NA_FILA,)).fetchone()[0]
+            if na_fila + len(novos) > limit:
+                return None
+
+            ordem = conexao.execute("SELECT COALESCE(MAX(ordem), 0) FROM jobs").fetchone()[0]
+            for deslocamento, (job_id, payload) in enumerate(novos, start=1):
+                conexao.execute(
+                    "INSERT INTO jobs (job_id, payload, estado, ordem, prioridade) VALUES (?, ?, ?, ?, ?)",
+                    (job_id, json.dumps(payload, ensure_ascii=False), JOB_NA_FILA, ordem + deslocamento,
+                     chave_prioridade(payload))
+                )
+            return [self._position(conexao, job_id) for job_id, _ in jobs]
+
+    def claim(self, worker_id: str, lease_seconds: float) -> Optional[Tuple[str, Dict]]:
+        agora = time.time()
+        with self._transacao() as conexao:
+            linha = conexao.execute(
+                "SELECT job_id, payload FROM jobs WHERE estado = ? OR (estado = ? AND lease_ate < ?) "
+                "ORDER BY prioridade, ordem LIMIT 1",
+                (JOB_NA_FILA, JOB_EM_EXECUCAO, agora)
+            ).fetchone()
+            if linha is None:
+                return None
+            conexao.execute(
+                "UPDATE jobs SET estado = ?, worker = ?, lease_ate = ? WHERE job_id = ?",
+                (JOB_EM_EXECUCAO, worker_id, agora + lease_seconds, linha[0])
+            )
+        return linha[0], json.loads(linha[1])
+
+    def renew(self, job_ids: List[str], worker_id: str, lease_seconds: float):
+        expira = time.time() + lease_seconds
+        for bloco in _em_blocos(job_ids):
+            self._conexao().execute(
+                f"UPDATE jobs SET lease_ate = ? WHERE worker = ? AND job_id IN ({','.join('?' * len(bloco))})",
+                [expira, worker_id, *bloco]
+            )
+
+    def ack(self, job_id: str):
+        self._conexao().execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+    def release(self, job_id: str):
+        """Devolve o job à frente dos jobs de mesma prioridade (retomado do checkpoint pelo próximo worker)"""
+        with self._transacao() as conexao:
+            conexao.execute(
+                "UPDATE jobs SET estado = ?, worker = NULL, lease_ate = NULL, "
+                "ordem = (SELECT MIN(ordem) FROM jobs) - 1 WHERE job_id = ?",
+                (JOB_NA_FILA, job_id)
+            )
+
+    def cancel(self, job_id: str) -> Optional[Dict]:
+        with self._transacao() as conexao:
+            linha = conexao.execute(
+                "SELECT payload FROM jobs WHERE job_id = ? AND estado = ?", (job_id, JOB_NA_FILA)
+            ).fetchone()
+            if linha is None:
+                return None
+            conexao.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+        return json.loads(linha[0])
+
+    def position(self, job_id: str) -> Optional[int]:
+        return self._position(self._conexao(), job_id)
+
+    @staticmethod
+    def _position(conexao: sqlite3.Connection, job_id: str) -> Optional[int]:
+        linha = conexao.execute("SELECT estado, prioridade, ordem FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if linha is None:
+            return None
+        if linha[0] == JOB_EM_EXECUCAO:
+            return 0
+        return conexao.execute(
+            "SELECT COUNT(*) FROM jobs WHERE estado = ? AND (prioridade < ? OR (prioridade = ? AND ordem <= ?))",
+            (JOB_NA_FILA, linha[1], linha[1], linha[2])
+        ).fetchone()[0]
+
+    def queue_stats(self) -> Dict[str, int]:
+        contagens = dict(self._conexao().execute("SELECT estado, COUNT(*) FROM jobs GROUP BY estado").fetchall())
+        return {"queued": contagens.get(JOB_NA_FILA, 0), "running": contagens.get(JOB_EM_EXECUCAO, 0)}
+
+    # Leituras de status
+
+    def record_reads(self, session_ids: List[str], timestamp: float):
+        if session_ids:
+            self._conexao().executemany(
+                "INSERT OR REPLACE INTO leituras (session_id, em) VALUES (?, ?)",
+                [(session_id, timestamp) for session_id in session_ids]
+            )
+
+    def last_reads(self, session_ids: List[str]) -> Dict[str, float]:
+        leituras = {}
+        for bloco in _em_blocos(session_ids):
+            leituras.update(self._conexao().execute(
+                f"SELECT session_id, em FROM leituras WHERE session_id IN ({','.join('?' * len(bloco))})", bloco
+            ).fetchall())
+        return leituras
+
+    def forget_reads(self, session_ids: List[str]):
+        if session_ids:
+            self._conexao().executemany("DELETE FROM leituras WHERE session_id = ?", [(session_id,) for session_id in session_ids])
+
+
+class SQLiteJournal(RecordJournal):
+    """Registros de uma categoria na tabela `registros` do backend SQLite"""
+
+    def __init__(self, backend: SQLiteStateBackend, categoria: str):
+        self.backend = backend
+        self.categoria = categoria
+
+    def journal_path(self, session_id: str) -> str:
+        return f"sqlite:{self.backend.path}#{self.categoria}/{session_id}"
+
+    def append(self, session_id: str, nome_etapa: str, dados: Dict, blobs_novos: List[int] = None) -> int:
+        registro = novo_registro(nome_etapa, dados)
+        bruto = serializar(dados)
+        # Os bytes dos blobs seguem no feed junto do registro, para o registro em memória de todos os processos
+        bytes_blobs = sum(blobs_novos or [])
+        self.backend._conexao().execute(
+            "INSERT INTO registros (categoria, session_id, etapa, ts, dados, bytes_blobs) VALUES (?, ?, ?, ?, ?, ?)",
+            (self.categoria, session_id, nome_etapa, registro["ts"], bruto, bytes_blobs)
+        )
+        return len(bruto) + bytes_blobs
+
+    def read_records(self, session_id: str) -> List[Dict]:
+        return [
+            {"etapa": etapa, "ts": ts, "dados": json.loads(dados)}
+            for etapa, ts, dados in self.backend._conexao().execute(
+                "SELECT etapa, ts, dados FROM registros WHERE categoria = ? AND session_id = ? ORDER BY seq",
+                (self.categoria, session_id)
+            )
+        ]
+
+    def last_record(self, session_id: str, nome_etapa: str) -> Optional[Dict]:
+        linha = self.backend._conexao().execute(
+            "SELECT ts, dados FROM registros WHERE categoria = ? AND session_id = ? AND etapa = ? "
+            "ORDER BY seq DESC LIMIT 1",
+            (self.categoria, session_id, nome_etapa)
+        ).fetchone()
+        if linha is None:
+            return None
+        return {"etapa": nome_etapa, "ts": linha[0], "dados": json.loads(linha[1])}
+
+    def session_ids(self) -> Iterator[str]:
+        for (session_id,) in self.backend._conexao().execute(
+            "SELECT session_id FROM registros WHERE categoria = ? AND etapa != ? GROUP BY session_id ORDER BY MIN(seq)",
+            (self.categoria, ETAPA_SESSAO_APAGADA)
+        ).fetchall():
+            yield session_id
+
+    def session_size(self, session_id: str) -> int:
+        return self.backend._conexao().execute(
+            "SELECT (SELECT COALESCE(SUM(LENGTH(dados)), 0) FROM registros WHERE categoria = ? AND session_id = ?)"
+            " + (SELECT COALESCE(SUM(LENGTH(dados)), 0) FROM blobs WHERE categoria = ? AND session_id = ?)",
+            (self.categoria, session_id, self.categoria, session_id)
+        ).fetchone()[0]
+
+    def _gravar_blob(self, session_id: str, digest: str, bruto: bytes) -> bool:
+        return self.backend._conexao().execute(
+            "INSERT OR IGNORE INTO blobs (categoria, session_id, digest, dados) VALUES (?, ?, ?, ?)",
+            (self.categoria, session_id, digest, bruto)
+        ).rowcount == 1
+
+    def _ler_blob(self, session_id: str, digest: str) -> bytes:
+        linha = self.backend._conexao().execute(
+            "SELECT dados FROM blobs WHERE categoria = ? AND session_id = ? AND digest = ?",
+            (self.categoria, session_id, digest)
+        ).fetchone()
+        if linha is None:
+            raise FileNotFoundError(f"Blob {digest} da sessão {session_id} não encontrado")
+        return bytes(linha[0])
+
+    def delete_session(self, session_id: str):
+        registro = novo_registro(ETAPA_SESSAO_APAGADA, {})
+        with self.backend._transacao() as conexao:
+            conexao.execute("DELETE FROM registros WHERE categoria = ? AND session_id = ?", (self.categoria, session_id))
+            conexao.execute("DELETE FROM blobs WHERE categoria = ? AND session_id = ?", (self.categoria, session_id))
+            conexao.execute(
+                "INSERT INTO registros (categoria, session_id, etapa, ts, dados) VALUES (?, ?, ?, ?, ?)",
+                (self.categoria, session_id, ETAPA_SESSAO_APAGADA, registro["ts"], serializar(registro["dados"]))
+            )
+
+    def changes_since(self, cursor: int, limit: int = CHANGES_BATCH) -> Tuple[List[Mudanca], int]:
+        mudancas = []
+        for seq, session_id, etapa, ts, dados, bytes_blobs in self.backend._conexao().execute(
+            "SELECT seq, session_id, etapa, ts, dados, bytes_blobs FROM registros WHERE categoria = ? AND seq > ? "
+            "ORDER BY seq LIMIT ?",
+            (self.categoria, cursor, limit)
+        ):
+            mudancas.append((session_id, {"etapa": etapa, "ts": ts, "dados": json.loads(dados)},
+                             len(dados) + bytes_blobs))
+            cursor = seq
+        return mudancas, cursor
+
+
+# ------------------------------------------
+# Store em rede
+# ------------------------------------------
+
+class _LocalPipeline:
+    """
+    Pipeline do LocalNetworkStore com a interface do redis-py: depois de watch() os comandos executam
+    na hora (leituras da transação); depois de multi(), ou sem watch(), ficam enfileirados até execute(),
+    que os aplica juntos sob o lock do store
+    """
+
+    def __init__(self, store: "LocalNetworkStore"):
+        self._store = store
+        self._comandos: List[Tuple[str, tuple, dict]] = []
+        self._imediato = False
+
+    def watch(self, *names):
+        self._imediato = True
+
+    def multi(self):
+        self._imediato = False
+
+    def execute(self) -> List[Any]:
+        with self._store._lock:
+            resultados = [getattr(self._store, nome)(*args, **kwargs) for nome, args, kwargs in self._comandos]
+        self._comandos = []
+        return resultados
+
+    def __getattr__(self, nome: str):
+        comando = getattr(self._store, nome)
+
+        def chamar(*args, **kwargs):
+            if self._imediato:
+                return comando(*args, **kwargs)
+            self._comandos.append((nome, args, kwargs))
+            return self
+        return chamar
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._comandos = []
+
+
+class LocalNetworkStore:
+    """
+    Stand-in em memória do store em rede: implementa o subconjunto de comandos Redis usado pelo
+    NetworkStoreBackend (listas, hashes e sorted sets de strings, pipelines e transações com watch),
+    com a mesma semântica do redis-py (decode_responses=True). Serve para testes e para rodar o
+    backend de rede em um processo só.
+    """
+
+    def __init__(self):
+        # Reentrante: pipelines e transações executam os comandos do próprio store sob o lock
+        self._lock = threading.RLock()
+        self._listas: Dict[str, List[str]] = {}
+        self._hashes: Dict[str, Dict[str, str]] = {}
+        # Sorted sets: lista ordenada de (score, membro) + membro -> score
+        self._ordenados: Dict[str, Tuple[List[Tuple[float, str]], Dict[str, float]]] = {}
+
+    def rpush(self, name: str, *values) -> int:
+        with self._lock:
+            lista = self._listas.setdefault(name, [])
+            lista.extend(str(valor) for valor in values)
+            return len(lista)
+
+    def lrange(self, name: str, start: int, end: int) -> List[str]:
+        with self._lock:
+            lista = self._listas.get(name, [])
+            fim = len(lista) if end == -1 else end + 1
+            return list(lista[start:fim])
+
+    def lindex(self, name: str, index: int) -> Optional[str]:
+        with self._lock:
+            lista = self._listas.get(name, [])
+            return lista[index] if -len(lista) <= index < len(lista) else None
+
+    def llen(self, name: str) -> int:
+        with self._lock:
+            return len(self._listas.get(name, []))
+
+    def lrem(self, name: str, count: int, value) -> int:
+        with self._lock:
+            lista = self._listas.get(name, [])
+            removidos = 0
+            while str(value) in lista and (count == 0 or removidos < abs(count)):
+                lista.remove(str(value))
+                removidos += 1
+            return removidos
+
+    def hset(self, name: str, key: str, value) -> int:
+        with self._lock:
+            tabela = self._hashes.setdefault(name, {})
+            novo = key not in tabela
+            tabela[key] = str(value)
+            return int(novo)
+
+    def hsetnx(self, name: str, key: str, value) -> bool:
+        with self._lock:
+            tabela = self._hashes.setdefault(name, {})
+            if key in tabela:
+                return False
+            tabela[key] = str(value)
+            return True
+
+    def hget(self, name: str, key: str) -> Optional[str]:
+        with self._lock:
+            return self._hashes.get(name, {}).get(key)
+
+    def hmget(self, name: str, keys: List[str]) -> List[Optional[str]]:
+        with self._lock:
+            tabela = self._hashes.get(name, {})
+            return [tabela.get(chave) for chave in keys]
+
+    def hdel(self, name: str, *keys) -> int:
+        with self._lock:
+            tabela = self._hashes.get(name, {})
+            return sum(1 for chave in keys if tabela.pop(chave, None) is not None)
+
+    def hincrby(self, name: str, key: str, amount: int = 1) -> int:
+        with self._lock:
+            tabela = self._hashes.setdefault(name, {})
+            valor = int(tabela.get(key, 0)) + amount
+            tabela[key] = str(valor)
+            return valor
+
+    def zadd(self, name: str, mapping: Dict[str, float], nx: bool = False, xx: bool = False) -> int:
+        with self._lock:
+            ordenados, scores = self._ordenados.setdefault(name, ([], {}))
+            novos = 0
+            for membro, score in mapping.items():
+                membro = str(membro)
+                if membro in scores:
+                    if nx:
+                        continue
+                    ordenados.remove((scores[membro], membro))
+                elif xx:
+                    continue
+                else:
+                    novos += 1
+                scores[membro] = float(score)
+                bisect.insort(ordenados, (float(score), membro))
+            return novos
+
+    def zrem(self, name: str, *values) -> int:
+        with self._lock:
+            ordenados, scores = self._ordenados.get(name, ([], {}))
+            removidos = 0
+            for membro in map(str, values):
+                if membro in scores:
+                    ordenados.remove((scores.pop(membro), membro))
+                    removidos += 1
+            return removidos
+
+    def zpopmin(self, name: str, count: int = 1) -> List[Tuple[str, float]]:
+        with self._lock:
+            ordenados, scores = self._ordenados.get(name, ([], {}))
+            retirados = ordenados[:count]
+            del ordenados[:count]
+            for _, membro in retirados:
+                scores.pop(membro)
+            return [(membro, score) for score, membro in retirados]
+
+    def zrank(self, name: str, value) -> Optional[int]:
+        with self._lock:
+            ordenados, scores = self._ordenados.get(name, ([], {}))
+            membro = str(value)
+            if membro not in scores:
+                return None
+            return bisect.bisect_left(ordenados, (scores[membro], membro))
+
+    def zscore(self, name: str, value) -> Optional[float]:
+        with self._lock:
+            return self._ordenados.get(name, ([], {}))[1].get(str(value))
+
+    def zrange(self, name: str, start: int, end: int) -> List[str]:
+        with self._lock:
+            ordenados = self._ordenados.get(name, ([], {}))[0]
+            fim = len(ordenados) if end == -1 else end + 1
+            return [membro for _, membro in ordenados[start:fim]]
+
+    def zrangebyscore(self, name: str, min, max, start: Optional[int] = None, num: Optional[int] = None) -> List[str]:
+        with self._lock:
+            ordenados = self._ordenados.get(name, ([], {}))[0]
+            membros = [membro for score, membro in ordenados if float(min) <= score <= float(max)]
+            if start is not None and num is not None:
+                membros = membros[start:start + num]
+            return membros
+
+    def zcard(self, name: str) -> int:
+        with self._lock:
+            return len(self._ordenados.get(name, ([], {}))[1])
+
+    def delete(self, *names) -> int:
+        with self._lock:
+            return sum(
+                1 for nome in names
+                if self._listas.pop(nome, None) is not None or self._hashes.pop(nome, None) is not None
+                or self._ordenados.pop(nome, None) is not None
+            )
+
+    def pipeline(self, transaction: bool = True) -> _LocalPipeline:
+        return _LocalPipeline(self)
+
+    def transaction(self, func, *watches, value_from_callable: bool = False):
+        """Como no redis-py; com o lock do store mantido do watch ao execute, nunca há conflito a repetir"""
+        with self._lock:
+            pipe = self.pipeline()
+            pipe.watch(*watches)
+            valor = func(pipe)
+            resultados = pipe.execute()
+        return valor if value_from_callable else resultados
+
+
+class NetworkStoreBackend(StateBackend):
+    """
+    Backend sobre um store em rede com comandos de listas, hashes e sorted sets (Redis ou LocalNetworkStore).
+    Operações da fila que leem e escrevem várias chaves são transações (WATCH/MULTI/EXEC): dois
+    processos nunca recebem o mesmo job.
+
+    Chaves (prefixo configurável):
+        <p>:registros:<categoria>            feed global: referências (sessão, índice no journal dela, bytes);
+                                             o cursor é o índice na lista
+        <p>:sessao:<categoria>:<id>          registros da sessão
+        <p>:sessoes:<categoria>              ids das sessões, em ordem de criação
+        <p>:tamanho:<categoria>              hash id -> bytes
+        <p>:blobs:<categoria>:<id>           hash sha256 -> blob da sessão (compact_value)
+        <p>:jobs:prioridade                  sorted set dos jobs na fila (score = chave_prioridade)
+        <p>:jobs:em_execucao                 sorted set dos jobs em execução (score = vencimento da lease)
+        <p>:jobs:payload / <p>:jobs:worker   hashes job_id -> payload JSON / worker dono da lease
+        <p>:leituras                         hash session_id -> última leitura de status (epoch)
+    """
+
+    shared = True
+
+    def __init__(self, client, prefix: str = "arqv18"):
+        super().__init__()
+        self.client = client
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._journals: Dict[str, "NetworkStoreJournal"] = {}
+        self._fila = self.chave("jobs", "prioridade")
+        self._em_execucao = self.chave("jobs", "em_execucao")
+        self._payloads = self.chave("jobs", "payload")
+        self._workers = self.chave("jobs", "worker")
+
+    def chave(self, *partes: str) -> str:
+        return ":".join((self.prefix,) + partes)
+
+    def journal(self, categoria: str) -> "NetworkStoreJournal":
+        with self._lock:
+            journal = self._journals.get(categoria)
+            if journal is None:
+                journal = self._journals[categoria] = NetworkStoreJournal(self, categoria)
+            return journal
+
+    # Fila de jobs
+
+    def enqueue_many(self, jobs: List[Tuple[str, Dict]], limit: int) -> Optional[List[int]]:
+        def enfileirar(pipe) -> bool:
+            ids = [job_id for job_id, _ in jobs]
+            existentes = {job_id for job_id, payload in zip(ids, pipe.hmget(self._payloads, ids)) if payload is not None}
+            novos = [(job_id, payload) for job_id, payload in jobs if job_id not in existentes]
+            if pipe.zcard(self._fila) + len(novos) > limit:
+                return False
+            pipe.multi()
+            for job_id, payload in novos:
+                pipe.hset(self._payloads, job_id, json.dumps(payload, ensure_ascii=False))
+            if novos:
+                pipe.zadd(self._fila, {job_id: chave_prioridade(payload) for job_id, payload in novos}, nx=True)
+            return True
+
+        if jobs and not self.client.transaction(enfileirar, self._fila, self._payloads, value_from_callable=True):
+            return None
+        return [self.position(job_id) for job_id, _ in jobs]
+
+    def _recuperar_leases_vencidas(self):
+        """Devolve à fila, em uma transação, os jobs de workers cuja lease venceu"""
+        def recuperar(pipe):
+            vencidos = pipe.zrangebyscore(self._em_execucao, "-inf", time.time())
+            if not vencidos:
+                return
+            payloads = pipe.hmget(self._payloads, vencidos)
+            pipe.multi()
+            pipe.zrem(self._em_execucao, *vencidos)
+            pipe.hdel(self._workers, *vencidos)
+            pipe.zadd(self._fila, {
+                job_id: chave_prioridade(json.loads(payload) if payload else None)
+                for job_id, payload in zip(vencidos, payloads)
+            })
+
+        self.client.transaction(recuperar, self._em_execucao)
+
+    def claim(self, worker_id: str, lease_seconds: float) -> Optional[Tuple[str, Dict]]:
+        self._recuperar_leases_vencidas()
+
+        def retirar(pipe) -> Optional[Tuple[str, Optional[str]]]:
+            primeiros = pipe.zrange(self._fila, 0, 0)
+            if not primeiros:
+                return None
+            job_id = primeiros[0]
+            payload = pipe.hget(self._payloads, job_id)
+            # Sai da fila e entra em execução juntos: se outro processo mexeu na fila, a transação repete
+            pipe.multi()
+            pipe.zrem(self._fila, job_id)
+            pipe.zadd(self._em_execucao, {job_id: time.time() + lease_seconds})
+            pipe.hset(self._workers, job_id, worker_id)
+            return job_id, payload
+
+        retirado = self.client.transaction(retirar, self._fila, value_from_callable=True)
+        if retirado is None:
+            return None
+        job_id, payload = retirado
+        return job_id, json.loads(payload) if payload else {}
+
+    def renew(self, job_ids: List[str], worker_id: str, lease_seconds: float):
+        if not job_ids:
+            return
+
+        def renovar(pipe):
+            donos = pipe.hmget(self._workers, job_ids)
+            meus = [job_id for job_id, dono in zip(job_ids, donos) if dono == worker_id]
+            if not meus:
+                return
+            pipe.multi()
+            # xx: uma lease que venceu e já voltou à fila não é recriada
+            pipe.zadd(self._em_execucao, {job_id: time.time() + lease_seconds for job_id in meus}, xx=True)
+
+        self.client.transaction(renovar, self._workers, self._em_execucao)
+
+    def ack(self, job_id: str):
+        with self.client.pipeline() as pipe:
+            pipe.zrem(self._em_execucao, job_id)
+            pipe.hdel(self._payloads, job_id)
+            pipe.hdel(self._workers, job_id)
+            pipe.execute()
+
+    def release(self, job_id: str):
+        def devolver(pipe):
+            if pipe.zscore(self._em_execucao, job_id) is None:
+                return
+            payload = pipe.hget(self._payloads, job_id)
+            pipe.multi()
+            pipe.zrem(self._em_execucao, job_id)
+            pipe.hdel(self._workers, job_id)
+            pipe.zadd(self._fila, {job_id: chave_prioridade(json.loads(payload) if payload else None)})
+
+        self.client.transaction(devolver, self._em_execucao)
+
+    def cancel(self, job_id: str) -> Optional[Dict]:
+        def retirar(pipe) -> Optional[str]:
+            if pipe.zscore(self._fila, job_id) is None:
+                return None
+            payload = pipe.hget(self._payloads, job_id)
+            pipe.multi()
+            pipe.zrem(self._fila, job_id)
+            pipe.hdel(self._payloads, job_id)
+            return payload or "{}"
+
+        payload = self.client.transaction(retirar, self._fila, value_from_callable=True)
+        return json.loads(payload) if payload is not None else None
+
+    def position(self, job_id: str) -> Optional[int]:
+        if self.client.zscore(self._em_execucao, job_id) is not None:
+            return 0
+        indice = self.client.zrank(self._fila, job_id)
+        return None if indice is None else indice + 1
+
+    def queue_stats(self) -> Dict[str, int]:
+        return {
+            "queued": self.client.zcard(self._fila),
+            "running": self.client.zcard(self._em_execucao),
+        }
+
+    # Leituras de status
+
+    def record_reads(self, session_ids: List[str], timestamp: float):
+        if not session_ids:
+            return
+        with self.client.pipeline(transaction=False) as pipe:
+            for session_id in session_ids:
+                pipe.hset(self.chave("leituras"), session_id, timestamp)
+            pipe.execute()
+
+    def last_reads(self, session_ids: List[str]) -> Dict[str, float]:
+        if not session_ids:
+            return {}
+        return {
+            session_id: float(valor)
+            for session_id, valor in zip(session_ids, self.client.hmget(self.chave("leituras"), session_ids))
+            if valor is not None
+        }
+
+    def forget_reads(self, session_ids: List[str]):
+        if session_ids:
+            self.client.hdel(self.chave("leituras"), *session_ids)
+
+
+class NetworkStoreJournal(RecordJournal):
+    """Registros de uma categoria no store em rede"""
+
+    def __init__(self, backend: NetworkStoreBackend, categoria: str):
+        self.backend = backend
+        self.client = backend.client
+        self.categoria = categoria
+
+    def _chave_sessao(self, session_id: str) -> str:
+        return self.backend.chave("sessao", self.categoria, session_id)
+
+    def journal_path(self, session_id: str) -> str:
+        return self._chave_sessao(session_id)
+
+    def append(self, session_id: str, nome_etapa: str, dados: Dict, blobs_novos: List[int] = None) -> int:
+        registro = novo_registro(nome_etapa, dados)
+        bruto = serializar(registro).decode("utf-8")
+        # Os blobs já entraram no tamanho da sessão ao serem gravados; no feed seguem junto do registro
+        total = len(bruto) + sum(blobs_novos or [])
+        tamanho = self.client.rpush(self._chave_sessao(session_id), bruto)
+        with self.client.pipeline() as pipe:
+            if tamanho == 1:
+                pipe.rpush(self.backend.chave("sessoes", self.categoria), session_id)
+            pipe.hincrby(self.backend.chave("tamanho", self.categoria), session_id, len(bruto))
+            # O feed só cita o registro: apagada a sessão, o payload não fica para trás no feed
+            pipe.rpush(self.backend.chave("registros", self.categoria),
+                       json.dumps({"session_id": session_id, "indice": tamanho - 1, "bytes": total}))
+            pipe.execute()
+        return total
+
+    def read_records(self, session_id: str) -> List[Dict]:
+        return [json.loads(bruto) for bruto in self.client.lrange(self._chave_sessao(session_id), 0, -1)]
+
+    def session_ids(self) -> Iterator[str]:
+        yield from self.client.lrange(self.backend.chave("sessoes", self.categoria), 0, -1)
+
+    def session_size(self, session_id: str) -> int:
+        return int(self.client.hget(self.backend.chave("tamanho", self.categoria), session_id) or 0)
+
+    def _chave_blobs(self, session_id: str) -> str:
+        return self.backend.chave("blobs", self.categoria, session_id)
+
+    def _gravar_blob(self, session_id: str, digest: str, bruto: bytes) -> bool:
+        if not self.client.hsetnx(self._chave_blobs(session_id), digest, bruto.decode("utf-8")):
+            return False
+        self.client.hincrby(self.backend.chave("tamanho", self.categoria), session_id, len(bruto))
+        return True
+
+    def _ler_blob(self, session_id: str, digest: str) -> bytes:
+        bruto = self.client.hget(self._chave_blobs(session_id), digest)
+        if bruto is None:
+            raise FileNotFoundError(f"Blob {digest} da sessão {session_id} não encontrado")
+        return bruto.encode("utf-8")
+
+    def delete_session(self, session_id: str):
+        # As referências da sessão no feed passam a não resolver; a marca faz quem o reaplica removê-la
+        marca = serializar(novo_registro(ETAPA_SESSAO_APAGADA, {})).decode("utf-8")
+        with self.client.pipeline() as pipe:
+            pipe.delete(self._chave_sessao(session_id), self._chave_blobs(session_id))
+            pipe.lrem(self.backend.chave("sessoes", self.categoria), 0, session_id)
+            pipe.hdel(self.backend.chave("tamanho", self.categoria), session_id)
+            pipe.rpush(self.backend.chave("registros", self.categoria),
+                       json.dumps({"session_id": session_id, "registro": marca}, ensure_ascii=False))
+            pipe.execute()
+
+    def changes_since(self, cursor: int, limit: int = CHANGES_BATCH) -> Tuple[List[Mudanca], int]:
+        entradas = [
+            json.loads(bruto)
+            for bruto in self.client.lrange(self.backend.chave("registros", self.categoria), cursor, cursor + limit - 1)
+        ]
+        # Os registros citados são lidos em um único round trip
+        with self.client.pipeline(transaction=False) as pipe:
+            for entrada in entradas:
+                if "indice" in entrada:
+                    pipe.lindex(self._chave_sessao(entrada["session_id"]), entrada["indice"])
+            citados = iter(pipe.execute())
+
+        mudancas = []
+        for entrada in entradas:
+            bruto = next(citados) if "indice" in entrada else entrada["registro"]
+            if bruto is None:
+                continue  # sessão apagada depois: a marca de remoção vem adiante no feed
+            mudancas.append((entrada["session_id"], json.loads(bruto), entrada.get("bytes", len(bruto))))
+        return mudancas, cursor + len(entradas)
+
+
+# ==========================================
+# CONFIGURAÇÃO
+# ==========================================
+
+def caminho_sqlite(spec: str, base_path: str) -> str:
+    """
+    Arquivo do banco em um spec sqlite:, como nas URLs do SQLAlchemy: sqlite:///relativo fica sob o diretório
+    de dados e sqlite:////absoluto é usado como está; sem caminho, <base_path>/state.db
+    """
+    caminho = spec[len("sqlite:"):]
+    if caminho.startswith("///"):
+        caminho = caminho[3:]
+    elif caminho.startswith("//"):
+        raise StateBackendConfigError(
+            f"WORKFLOW_STATE_BACKEND={spec}: use sqlite:///relativo (sob {base_path}) ou sqlite:////absoluto"
+        )
+    if not caminho:
+        caminho = "state.db"
+    return caminho if os.path.isabs(caminho) else os.path.join(base_path, caminho)
+
+
+def criar_backend(spec: str, base_path: str) -> StateBackend:
+    """Instancia o backend descrito em WORKFLOW_STATE_BACKEND (StateBackendConfigError se inválido ou inutilizável)"""
+    spec = (spec or "files").strip()
+    if spec == "files":
+        return FileStateBackend(base_path)
+    if spec == "memory":
+        return NetworkStoreBackend(LocalNetworkStore())
+    if spec.startswith("sqlite:"):
+        caminho = caminho_sqlite(spec, base_path)
+        try:
+            return SQLiteStateBackend(caminho)
+        except (OSError, sqlite3.Error) as e:
+            raise StateBackendConfigError(f"WORKFLOW_STATE_BACKEND={spec}: não foi possível abrir {caminho} ({e})") from e
+    if spec.startswith(("redis://", "rediss://")):
+        if redis is None:
+            raise StateBackendConfigError("Backend redis:// requer o pacote 'redis' (pip install redis)")
+        return NetworkStoreBackend(redis.Redis.from_url(spec, decode_responses=True))
+    raise StateBackendConfigError(f"Backend de estado desconhecido: {spec}")
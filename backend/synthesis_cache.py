@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ARQV18 Enhanced v18.0 - Synthesis Cache
+Cache de sínteses por hash da requisição normalizada, com coalescência de execuções simultâneas
+"""
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Campos do contexto que identificam a partida analisada
+CAMPOS_CHAVE_CONTEXTO = ("opponent", "competition", "match_date", "venue", "specialDirectives")
+
+RESULTADO_HIT = "hit"
+RESULTADO_EM_ANDAMENTO = "in_flight"
+RESULTADO_MISS = "miss"
+
+
+def _normalizar(valor: Any) -> str:
+    if valor is None:
+        return ""
+    return " ".join(str(valor).split()).casefold()
+
+
+def chave_requisicao(segmento: str, context: Dict) -> str:
+    """Hash canônico da requisição: segmento + campos que identificam a partida"""
+    context = context or {}
+    canonico = {"segmento": _normalizar(segmento)}
+    for campo in CAMPOS_CHAVE_CONTEXTO:
+        canonico[campo] = _normalizar(context.get(campo))
+    serializado = json.dumps(canonico, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(serializado.encode("utf-8")).hexdigest()
+
+
+class SynthesisCache:
+    """Cache LRU com TTL das sínteses concluídas + registro das execuções em andamento"""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._in_flight: Dict[str, str] = {}
+        self._hits = 0
+        self._misses = 0
+        self._coalesced = 0
+
+    def lookup_or_begin(self, key: str, session_id: str,
+                        lider_ativo: Callable[[str], bool] = None) -> Tuple[str, Any]:
+        """
+        Resolve uma nova requisição: (hit, entrada) | (in_flight, sessão líder) | (miss, None) - neste caso
+        session_id vira o líder. A decisão final é tomada sob o lock, em uma única operação.
+
+        Com backend compartilhado, o líder pode ter sido executado (e encerrado) por outro processo, sem
+        finish() local: `lider_ativo(session_id)` confirma que ele segue em andamento antes de anexar. A
+        consulta pode ler o backend e roda fora do lock; se o líder mudou nesse meio tempo, a resolução recomeça.
+        """
+        verificado: Optional[Tuple[str, bool]] = None
+        while True:
+            with self._lock:
+                entrada = self._get_locked(key)
+                if entrada is not None:
+                    self._hits += 1
+                    return RESULTADO_HIT, entrada
+
+                lider = self._in_flight.get(key)
+                if lider is not None and verificado != (lider, False):
+                    if lider_ativo is None or verificado == (lider, True):
+                        self._coalesced += 1
+                        return RESULTADO_EM_ANDAMENTO, lider
+                else:
+                    self._misses += 1
+                    self._in_flight[key] = session_id
+                    return RESULTADO_MISS, None
+
+            verificado = (lider, bool(lider_ativo(lider)))
+
+    def begin(self, key: str, session_id: str):
+        """Registra session_id como a execução em andamento para a chave (ignora o cache)"""
+        with self._lock:
+            self._in_flight[key] = session_id
+
+    def finish(self, key: str, session_id: str, synthesis: Optional[Dict] = None):
+        """
+        Encerra a execução líder; com síntese, a sessão passa a ser a origem das requisições idênticas
+        (a entrada guarda só a sessão: a síntese fica no journal dela)
+        """
+        with self._lock:
+            if self._in_flight.get(key) == session_id:
+                del self._in_flight[key]
+            if synthesis is None or self.max_entries <= 0:
+                return
+            self._entries[key] = {
+                "source_session": session_id,
+                "stored_at": time.monotonic(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, key: str, source_session: str):
+        """Descarta a entrada da chave se ela ainda aponta para a sessão (ex.: origem apagada pela retenção)"""
+        with self._lock:
+            entrada = self._entries.get(key)
+            if entrada is not None and entrada["source_session"] == source_session:
+                del self._entries[key]
+
+    def _get_locked(self, key: str) -> Optional[Dict[str, Any]]:
+        entrada = self._entries.get(key)
+        if entrada is None:
+            return None
+        if time.monotonic() - entrada["stored_at"] > self.ttl_seconds:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entrada
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "in_flight": len(self._in_flight),
+                "hits": self._hits,
+                "misses": self._misses,
+                "coalesced": self._coalesced,
+            }
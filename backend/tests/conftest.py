@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""Fixtures compartilhadas: o app com o blueprint do workflow, configurado uma vez por sessão de testes"""
+import importlib
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def app_workflow(tmp_path_factory):
+    # Configuração lida pelo blueprint na importação; os journals ficam no diretório temporário
+    os.environ.update(WORKFLOW_DATA_PATH=str(tmp_path_factory.mktemp("analyses_data")),
+                      WORKFLOW_STAGE_LATENCY="0.01", WORKFLOW_MAX_CONCURRENT_READS="4",
+                      WORKFLOW_READ_RATE="0", WORKFLOW_START_RATE="0", WORKFLOW_RESUME_ON_STARTUP="0")
+    routes = importlib.import_module("routes")
+    workflow = importlib.import_module("enhanced_workflow_routes")
+    yield routes.app, workflow
+    # Para os workers e as threads de fundo antes de o diretório temporário sumir
+    workflow.encerrar_workflows()
+
+
+def aguardar_conclusao(cliente, session_id: str) -> str:
+    prazo = time.monotonic() + 30
+    while time.monotonic() < prazo:
+        status = cliente.get(f"/api/workflow/status/{session_id}").get_json()
+        if status["progress_percentage"] == 100:
+            return session_id
+        time.sleep(0.05)
+    pytest.fail("workflow não concluiu")
+
+
+@pytest.fixture
+def sessao_concluida():
+    """Inicia um workflow com o contexto dado (padrão: contra o Palmeiras) e espera a conclusão"""
+    def iniciar(cliente, **context) -> str:
+        resposta = cliente.post("/api/workflow/full_workflow/start",
+                                json={"segmento": "teste", "context": context or {"opponent": "Palmeiras"}})
+        return aguardar_conclusao(cliente, resposta.get_json()["session_id"])
+    return iniciar
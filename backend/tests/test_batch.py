@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""Lotes de workflows: validação de todos os itens antes de agendar e status agregado do lote"""
+import time
+
+
+def test_lote_valida_todos_os_itens_antes_de_agendar(app_workflow):
+    app, workflow = app_workflow
+    cliente = app.test_client()
+    lotes_antes = len(list(workflow.journal_da_categoria("workflow_batches").session_ids()))
+
+    resposta = cliente.post("/api/workflow/full_workflow/batch", json={"segmento": "teste", "items": [
+        {"context": {"opponent": "Vitória"}},
+        "não é objeto",
+        {"context": "Bahia"},
+        {"segmento": " ", "context": {}},
+    ]})
+    assert resposta.status_code == 400
+    assert [item["index"] for item in resposta.get_json()["invalid_items"]] == [1, 2, 3]
+    assert len(list(workflow.journal_da_categoria("workflow_batches").session_ids())) == lotes_antes
+    assert cliente.post("/api/workflow/full_workflow/batch", json={"items": []}).status_code == 400
+
+
+def test_lote_inicia_itens_e_agrega_o_status(app_workflow):
+    app, _ = app_workflow
+    cliente = app.test_client()
+    resposta = cliente.post("/api/workflow/full_workflow/batch", json={
+        "segmento": "teste", "force_refresh": True,
+        "items": [{"context": {"opponent": "Athletico", "match_date": f"2026-08-0{indice}"}}
+                  for indice in range(1, 4)]
+    })
+    assert resposta.status_code == 200
+    corpo = resposta.get_json()
+    assert [item["index"] for item in corpo["items"]] == [0, 1, 2]
+    assert len({item["session_id"] for item in corpo["items"]}) == 3
+
+    prazo = time.monotonic() + 30
+    while time.monotonic() < prazo:
+        status = cliente.get(corpo["status_endpoint"]).get_json()
+        if status["finished"]:
+            break
+        time.sleep(0.05)
+    assert status["finished"] is True
+    assert status["total"] == 3 and status["completed"] == 3
+    assert status["progress_percentage"] == 100
+    assert [item["session_id"] for item in status["items"]] == [item["session_id"] for item in corpo["items"]]
+
+    assert cliente.get("/api/workflow/full_workflow/batch/batch_inexistente").status_code == 404
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""Checkpoints e retomada: sessões interrompidas continuam da última etapa, com leases renovadas até o fim"""
+import threading
+import time
+import uuid
+
+from job_scheduler import SharedWorkflowScheduler
+from state_backend import LocalNetworkStore, NetworkStoreBackend
+
+
+def test_sessao_interrompida_retoma_do_checkpoint(app_workflow):
+    _, workflow = app_workflow
+    session_id = f"session_retomada_{uuid.uuid4().hex[:8]}"
+    # Estado deixado por um processo que caiu depois das duas primeiras etapas
+    workflow.salvar_etapa(workflow.ETAPA_INICIO, {
+        "session_id": session_id, "segmento": "teste", "context": {"opponent": "Ceará"},
+        "cache_key": None, "priority": 0, "deadline": None
+    }, categoria="workflow", session_id=session_id)
+    workflow.salvar_etapa("etapa1_concluida_full_workflow", {"session_id": session_id, "dados_coletados": {}},
+                          categoria="workflow", session_id=session_id)
+    workflow.salvar_etapa("verificacao_ai_concluida_full_workflow", {"session_id": session_id},
+                          categoria="workflow", session_id=session_id)
+    assert set(workflow.carregar_checkpoint(session_id)) == {"step1", "step2"}
+
+    assert workflow.retomar_sessoes_interrompidas() >= 1
+    prazo = time.monotonic() + 10
+    while workflow.obter_estado(session_id)["status"] == workflow.STATUS_EM_ANDAMENTO and time.monotonic() < prazo:
+        time.sleep(0.02)
+    assert workflow.obter_estado(session_id)["status"] == workflow.STATUS_CONCLUIDO
+
+    etapas = [registro["etapa"] for registro in workflow.session_journal.read_records(session_id)]
+    assert etapas.count("etapa1_concluida_full_workflow") == 1
+    assert etapas.count("verificacao_ai_concluida_full_workflow") == 1
+    assert workflow.ETAPA_RETOMADA in etapas
+    assert "sintese_master_synthesis" in etapas
+
+
+def test_servicos_sobem_na_primeira_requisicao_e_nao_na_importacao(app_workflow, monkeypatch):
+    app, workflow = app_workflow
+    chamadas = []
+    monkeypatch.setattr(workflow, "_servicos_iniciados", False)
+    monkeypatch.setattr(workflow, "iniciar_servicos", lambda: chamadas.append(True))
+
+    assert app.test_client().get("/api/health").status_code == 200
+    assert chamadas == [True]
+
+
+def test_lease_e_renovada_ate_o_ultimo_job_terminar():
+    backend = NetworkStoreBackend(LocalNetworkStore())
+    liberado = threading.Event()
+    iniciado = threading.Event()
+
+    def runner(job):
+        iniciado.set()
+        # Etapa longa que só vê o pedido de parada na próxima fronteira
+        liberado.wait(5)
+        return True
+
+    agendador = SharedWorkflowScheduler(backend, max_workers=1, max_queue=4, runner=runner,
+                                        lease_seconds=0.3, poll_interval=0.01)
+    agendador.submit("s1", {"session_id": "s1"})
+    assert iniciado.wait(5)
+
+    encerramento = threading.Thread(target=agendador.shutdown, args=(5,))
+    encerramento.start()
+    time.sleep(0.8)
+    # Mais de duas leases depois do pedido de encerramento, o job continua deste processo
+    assert backend.claim("outro-processo", 60) is None
+    assert backend.position("s1") == 0
+
+    liberado.set()
+    encerramento.join(5)
+    assert not any(thread.is_alive() for thread in agendador._threads())
+    assert backend.position("s1") is None
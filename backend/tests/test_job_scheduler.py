@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""Scheduler do workflow: fila limitada, prioridade e prazo, posições, cancelamento e encerramento"""
+import threading
+import time
+
+import pytest
+
+from job_scheduler import QueueFullError, SchedulerShutdownError, WorkflowScheduler, chave_prioridade
+from session_registry import ETAPA_CANCELAMENTO, ETAPA_CONCLUSAO, ETAPA_INICIO, SessionRegistry
+from stage_latency import StageLatency
+
+
+class RunnerBloqueante:
+    """Runner que registra a ordem de execução e segura cada job até `liberar`"""
+
+    def __init__(self):
+        self.executados = []
+        self.iniciado = threading.Semaphore(0)
+        self._liberado = threading.Event()
+
+    def __call__(self, job):
+        self.executados.append(job["session_id"])
+        self.iniciado.release()
+        self._liberado.wait(5)
+
+    def aguardar_inicio(self):
+        assert self.iniciado.acquire(timeout=5)
+
+    def liberar(self):
+        self._liberado.set()
+
+
+@pytest.fixture
+def scheduler():
+    runner = RunnerBloqueante()
+    agendador = WorkflowScheduler(max_workers=1, max_queue=2, runner=runner)
+    yield agendador, runner
+    runner.liberar()
+    agendador.shutdown(5)
+
+
+def job(session_id, **agendamento):
+    return {"session_id": session_id, **agendamento}
+
+
+def test_fila_limitada_recusa_com_retry_after(scheduler):
+    agendador, runner = scheduler
+    assert agendador.submit("s1", job("s1")) == 0
+    runner.aguardar_inicio()
+
+    assert agendador.submit("s2", job("s2")) == 1
+    assert agendador.submit("s3", job("s3")) == 2
+    with pytest.raises(QueueFullError) as erro:
+        agendador.submit("s4", job("s4"))
+    assert erro.value.retry_after >= 1
+
+    # Lotes entram inteiros ou não entram
+    agendador.cancel("s3")
+    with pytest.raises(QueueFullError):
+        agendador.submit_many([("s5", job("s5")), ("s6", job("s6"))])
+    assert agendador.stats()["queued"] == 1
+
+
+def test_prioridade_e_prazo_definem_a_ordem_da_fila():
+    agora = time.time()
+    assert chave_prioridade(job("a", priority=1)) < chave_prioridade(job("b"))
+    assert chave_prioridade(job("a", deadline=agora + 10)) < chave_prioridade(job("b", deadline=agora + 60))
+    assert chave_prioridade(job("a", deadline=agora + 60)) < chave_prioridade(job("b"))
+
+    runner = RunnerBloqueante()
+    agendador = WorkflowScheduler(max_workers=1, max_queue=8, runner=runner)
+    try:
+        agendador.submit("s0", job("s0"))
+        runner.aguardar_inicio()
+        agendador.submit_many([
+            ("normal", job("normal")),
+            ("prazo_longo", job("prazo_longo", deadline=agora + 600)),
+            ("urgente", job("urgente", priority=5)),
+            ("prazo_curto", job("prazo_curto", deadline=agora + 60)),
+            ("normal2", job("normal2")),
+        ])
+        assert [agendador.position(session_id) for session_id in
+                ("urgente", "prazo_curto", "prazo_longo", "normal", "normal2")] == [1, 2, 3, 4, 5]
+        runner.liberar()
+        for _ in range(5):
+            runner.aguardar_inicio()
+    finally:
+        runner.liberar()
+        agendador.shutdown(5)
+    assert runner.executados == ["s0", "urgente", "prazo_curto", "prazo_longo", "normal", "normal2"]
+
+
+def test_posicao_e_cancelamento_da_fila(scheduler):
+    agendador, runner = scheduler
+    agendador.submit("s1", job("s1"))
+    runner.aguardar_inicio()
+    agendador.submit_many([("s2", job("s2")), ("s3", job("s3"))])
+
+    assert agendador.position("s1") == 0
+    assert agendador.position("s3") == 2
+    assert agendador.cancel("s2") == job("s2")
+    assert agendador.cancel("s2") is None
+    assert agendador.position("s2") is None
+    assert agendador.position("s3") == 1
+
+    posicao, espera = agendador.progress("s3")
+    assert posicao == 1 and espera > 0
+
+
+def test_encerramento_recusa_submissoes_e_devolve_a_fila(scheduler):
+    agendador, runner = scheduler
+    agendador.submit("s1", job("s1"))
+    runner.aguardar_inicio()
+    agendador.submit("s2", job("s2"))
+
+    threading.Timer(0.1, runner.liberar).start()
+    assert agendador.shutdown(5) == ["s2"]
+    assert runner.executados == ["s1"]
+    with pytest.raises(SchedulerShutdownError):
+        agendador.submit("s3", job("s3"))
+    assert not any(worker.is_alive() for worker in agendador._workers)
+
+
+def test_inicio_com_fila_cheia_responde_503(app_workflow, monkeypatch):
+    app, workflow = app_workflow
+    # Os serviços do processo (que sobem na primeira requisição) usam o scheduler real
+    workflow.iniciar_servicos()
+    runner = RunnerBloqueante()
+    agendador = WorkflowScheduler(max_workers=1, max_queue=0, runner=runner)
+    monkeypatch.setattr(workflow, "workflow_scheduler", agendador)
+    cliente = app.test_client()
+
+    def iniciar(oponente):
+        return cliente.post("/api/workflow/full_workflow/start", json={
+            "segmento": "teste", "force_refresh": True, "context": {"opponent": oponente}
+        })
+
+    try:
+        assert iniciar("Vasco").status_code == 200
+        runner.aguardar_inicio()
+        resposta = iniciar("Botafogo")
+        assert resposta.status_code == 503
+        assert int(resposta.headers["Retry-After"]) >= 1
+        assert resposta.get_json()["success"] is False
+    finally:
+        runner.liberar()
+        agendador.shutdown(5)
+
+
+def test_inicio_recusa_contexto_que_nao_e_objeto(app_workflow):
+    app, _ = app_workflow
+    cliente = app.test_client()
+    resposta = cliente.post("/api/workflow/full_workflow/start", json={"segmento": "teste", "context": "Vasco"})
+    assert resposta.status_code == 400
+    assert cliente.post("/api/workflow/full_workflow/start", data="não é json").status_code == 400
+
+
+def test_cancelamento_aborta_a_etapa_em_andamento_e_libera_o_worker(app_workflow, monkeypatch):
+    app, workflow = app_workflow
+    # Etapas longas: sem abortar, o worker ficaria preso até o fim da primeira
+    monkeypatch.setattr(workflow, "stage_latency", StageLatency.from_spec("30"))
+    cliente = app.test_client()
+    session_id = cliente.post("/api/workflow/full_workflow/start", json={
+        "segmento": "teste", "force_refresh": True, "context": {"opponent": "Juventude"}
+    }).get_json()["session_id"]
+
+    prazo = time.monotonic() + 5
+    while session_id not in workflow._execucoes and time.monotonic() < prazo:
+        time.sleep(0.01)
+    assert cliente.post(f"/api/workflow/cancel/{session_id}").get_json()["status"] == "cancelado"
+
+    while workflow.workflow_scheduler.position(session_id) is not None and time.monotonic() < prazo:
+        time.sleep(0.01)
+    assert workflow.workflow_scheduler.position(session_id) is None
+    assert session_id not in workflow._execucoes
+
+    # Depois do cancelamento nenhuma etapa é gravada
+    with pytest.raises(workflow.WorkflowInterrupted):
+        workflow.salvar_etapa("etapa1_concluida_full_workflow", {"session_id": session_id},
+                              categoria="workflow", session_id=session_id)
+    etapas = [registro["etapa"] for registro in workflow.session_journal.read_records(session_id)]
+    assert etapas == [workflow.ETAPA_INICIO, workflow.ETAPA_CANCELAMENTO]
+
+
+def test_primeiro_desfecho_gravado_define_o_status():
+    registro = SessionRegistry()
+    registro.record_stage("s1", ETAPA_INICIO, {})
+    registro.record_stage("s1", ETAPA_CONCLUSAO, {})
+    registro.record_stage("s1", ETAPA_CANCELAMENTO, {})
+    assert registro.get("s1")["status"] == "concluido"
+
+    registro.record_stage("s2", ETAPA_INICIO, {})
+    registro.record_stage("s2", ETAPA_CANCELAMENTO, {})
+    registro.record_stage("s2", ETAPA_CONCLUSAO, {})
+    assert registro.get("s2")["status"] == "cancelado"
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""Controle de admissão: token bucket por cliente e vagas de concorrência liberadas ao fim de cada resposta"""
+import math
+
+from rate_limiter import TokenBucketLimiter
+
+
+def test_vaga_de_leitura_liberada_apos_download_do_bundle(app_workflow, sessao_concluida):
+    app, workflow = app_workflow
+    cliente = app.test_client()
+    session_id = sessao_concluida(cliente)
+    leituras = workflow.concurrency_limiters["read"]
+
+    # Mais downloads que vagas: cada um precisa devolver a sua
+    for _ in range(leituras.limite + 2):
+        resposta = cliente.get(f"/api/workflow/results/{session_id}/bundle")
+        assert resposta.status_code == 200
+        assert resposta.data
+        resposta.close()
+        assert leituras.in_flight() == 0
+
+    assert cliente.get(f"/api/workflow/status/{session_id}").status_code == 200
+
+
+def test_vaga_de_leitura_mantida_enquanto_stream_aberto(app_workflow, sessao_concluida):
+    app, workflow = app_workflow
+    cliente = app.test_client()
+    session_id = sessao_concluida(cliente)
+    leituras = workflow.concurrency_limiters["read"]
+
+    resposta = cliente.get(f"/api/workflow/stream/{session_id}", buffered=False)
+    assert leituras.in_flight() == 1
+    resposta.close()
+    assert leituras.in_flight() == 0
+
+
+def test_bucket_recusa_com_tempo_ate_haver_saldo():
+    limiter = TokenBucketLimiter(rate=1, burst=2)
+    assert limiter.acquire("cliente") == 0
+    assert limiter.acquire("cliente") == 0
+    espera = limiter.acquire("cliente")
+    assert 0 < espera <= 1
+    # Outro cliente tem o próprio bucket
+    assert limiter.acquire("outro") == 0
+
+
+def test_bucket_nunca_admite_custo_acima_da_rajada():
+    limiter = TokenBucketLimiter(rate=1, burst=2)
+    assert limiter.acquire("cliente", cost=3) == math.inf
+    # Nada foi consumido: o custo não é limitado à rajada
+    assert limiter.tokens("cliente") == 2
+    assert limiter.acquire("cliente", cost=2) == 0
+
+
+def test_leituras_acima_da_taxa_recebem_429_com_retry_after(app_workflow, monkeypatch):
+    app, workflow = app_workflow
+    monkeypatch.setitem(workflow.rate_limiters, workflow.ORCAMENTO_LEITURA, TokenBucketLimiter(rate=0.01, burst=2))
+    cliente = app.test_client()
+
+    for _ in range(2):
+        assert cliente.get("/api/workflow/status/session_inexistente").status_code != 429
+    resposta = cliente.get("/api/workflow/status/session_inexistente")
+    assert resposta.status_code == 429
+    assert int(resposta.headers["Retry-After"]) >= 1
+    assert resposta.get_json()["budget"] == workflow.ORCAMENTO_LEITURA
+
+
+def test_lote_maior_que_a_rajada_recebe_413_sem_consumir_tokens(app_workflow, monkeypatch):
+    app, workflow = app_workflow
+    limiter = TokenBucketLimiter(rate=0.01, burst=2)
+    monkeypatch.setitem(workflow.rate_limiters, workflow.ORCAMENTO_INICIO, limiter)
+    cliente = app.test_client()
+
+    itens = [{"segmento": "teste", "context": {"opponent": f"Time {i}"}} for i in range(3)]
+    resposta = cliente.post("/api/workflow/full_workflow/batch", json={"items": itens})
+    assert resposta.status_code == 413
+    assert resposta.get_json()["max_items"] == 2
+    assert limiter.tokens("addr:127.0.0.1") == 2
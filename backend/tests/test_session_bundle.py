@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""Bundles de sessão: arquivo por versão servido com Range/ETag e contado no tamanho da sessão"""
+import io
+import os
+import time
+import zipfile
+
+from session_bundle import BundleCache, _de_bytes
+
+
+def artefatos(conteudo: bytes):
+    return lambda: [_de_bytes("sintese.json", conteudo, time.time())]
+
+
+def test_nova_versao_substitui_a_anterior_e_informa_a_variacao(tmp_path):
+    variacoes = []
+    cache = BundleCache(str(tmp_path), on_resize=lambda session_id, delta: variacoes.append((session_id, delta)))
+
+    primeiro = cache.get_or_build("s1", 1, "zip", artefatos(b"a" * 100))
+    assert variacoes == [("s1", os.path.getsize(primeiro))]
+    assert cache.get_or_build("s1", 1, "zip", artefatos(b"outro")) == primeiro
+    assert len(variacoes) == 1
+    segundo = cache.get_or_build("s1", 2, "zip", artefatos(b"b" * 100))
+    assert not os.path.exists(primeiro)
+    # Sessão cujo id começa por "s1-" não é afetada pelos bundles de "s1"
+    vizinho = cache.get_or_build("s1-x", 1, "zip", artefatos(b"c"))
+
+    assert sum(delta for session_id, delta in variacoes if session_id == "s1") == os.path.getsize(segundo)
+    assert cache.sizes() == {"s1": os.path.getsize(segundo), "s1-x": os.path.getsize(vizinho)}
+
+    cache.invalidate("s1")
+    assert sum(delta for session_id, delta in variacoes if session_id == "s1") == 0
+    assert cache.sizes() == {"s1-x": os.path.getsize(vizinho)}
+    assert [nome for nome in os.listdir(tmp_path) if nome.endswith(".tmp")] == []
+
+
+def test_bundle_responde_range_e_etag_e_entra_no_tamanho_da_sessao(app_workflow, sessao_concluida):
+    app, workflow = app_workflow
+    cliente = app.test_client()
+    session_id = sessao_concluida(cliente, opponent="Fortaleza")
+    bytes_journal = workflow.session_registry.get(session_id)["bytes"]
+
+    resposta = cliente.get(f"/api/workflow/results/{session_id}/bundle")
+    assert resposta.status_code == 200
+    nomes = zipfile.ZipFile(io.BytesIO(resposta.data)).namelist()
+    assert f"{session_id}/sintese_master_synthesis.json" in nomes
+    etag = resposta.headers["ETag"]
+    assert workflow.session_registry.get(session_id)["bytes"] == bytes_journal + len(resposta.data)
+
+    parcial = cliente.get(f"/api/workflow/results/{session_id}/bundle", headers={"Range": "bytes=0-9"})
+    assert parcial.status_code == 206
+    assert parcial.data == resposta.data[:10]
+    assert parcial.headers["Content-Range"] == f"bytes 0-9/{len(resposta.data)}"
+
+    assert cliente.get(f"/api/workflow/results/{session_id}/bundle",
+                       headers={"If-None-Match": etag}).status_code == 304
+
+    # A retenção apaga a sessão e, pelo on_delete, os bundles dela
+    workflow.ao_apagar_sessao(session_id)
+    assert session_id not in workflow.bundle_cache.sizes()
+    assert workflow.session_registry.get(session_id)["bytes"] == bytes_journal
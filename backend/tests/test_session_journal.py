@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""Journal de sessão: registros compactos, blobs por conteúdo, índice de etapas e layout legado"""
+import json
+import os
+
+import pytest
+
+from session_journal import BLOB_REF_KEY, BLOB_THRESHOLD_BYTES, SessionJournal, is_blob_ref
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return SessionJournal(str(tmp_path))
+
+
+def payload_grande(marca: str) -> dict:
+    return {"marca": marca, "texto": "x" * (BLOB_THRESHOLD_BYTES + 1)}
+
+
+def test_payload_grande_vira_blob_gravado_uma_unica_vez(journal):
+    primeiro = journal.append("s1", "etapa1", {"resultado": payload_grande("a")})
+    segundo = journal.append("s1", "etapa2", {"resultado": payload_grande("a")})
+    # O segundo registro cita o blob já gravado: só a linha do journal entra nos bytes
+    assert segundo < primeiro
+
+    registros = journal.read_records("s1")
+    assert [registro["etapa"] for registro in registros] == ["etapa1", "etapa2"]
+    assert is_blob_ref(registros[0]["dados"]["resultado"])
+    assert registros[0]["dados"]["resultado"] == registros[1]["dados"]["resultado"]
+    assert journal.read_stage("s1", "etapa2") == {"resultado": payload_grande("a")}
+    assert len(os.listdir(os.path.join(journal.session_path("s1"), "blobs"))) == 1
+
+
+def test_ultimo_registro_acompanha_appends_e_recriacao(journal):
+    journal.append("s1", "etapa", {"versao": 1})
+    assert journal.last_record("s1", "etapa")["dados"] == {"versao": 1}
+
+    journal.append("s1", "outra", {"versao": 1})
+    journal.append("s1", "etapa", {"versao": 2})
+    assert journal.last_record("s1", "etapa")["dados"] == {"versao": 2}
+    assert journal.has_stage("s1", "outra")
+    assert not journal.has_stage("s1", "inexistente")
+
+    # Linha ainda sendo gravada por outro processo não entra no índice
+    with open(journal.journal_path("s1"), "ab") as f:
+        f.write(b'{"etapa": "etapa", "dados": {"vers')
+    assert journal.last_record("s1", "etapa")["dados"] == {"versao": 2}
+
+    journal.delete_session("s1")
+    assert journal.last_record("s1", "etapa") is None
+    journal.append("s1", "outra", {"versao": 3})
+    assert journal.last_record("s1", "etapa") is None
+    assert journal.last_record("s1", "outra")["dados"] == {"versao": 3}
+
+
+def test_sessao_legada_e_lida_e_migrada(journal):
+    pasta = journal.session_path("antiga")
+    os.makedirs(pasta)
+    for indice, etapa in enumerate(("etapa1", "etapa2")):
+        caminho = os.path.join(pasta, f"{etapa}.json")
+        with open(caminho, "w", encoding="utf-8") as f:
+            json.dump({"etapa": etapa, "timestamp": f"2026-01-0{indice + 1}T10:00:00"}, f, indent=2)
+        os.utime(caminho, (1_700_000_000 + indice, 1_700_000_000 + indice))
+
+    assert journal.is_legacy("antiga")
+    assert [registro["etapa"] for registro in journal.read_records("antiga")] == ["etapa1", "etapa2"]
+    assert journal.last_record("antiga", "etapa2")["ts"] == "2026-01-02T10:00:00"
+
+    assert journal.migrate_legacy("antiga")
+    assert not journal.is_legacy("antiga")
+    assert sorted(os.listdir(pasta)) == ["journal.jsonl"]
+    assert journal.read_stage("antiga", "etapa1") == {"etapa": "etapa1", "timestamp": "2026-01-01T10:00:00"}
+
+
+def test_referencia_a_blob_tem_formato_fixo():
+    assert is_blob_ref({BLOB_REF_KEY: "abc"})
+    assert not is_blob_ref({BLOB_REF_KEY: "abc", "outro": 1})
+
+
+def test_caminho_da_etapa_so_existe_quando_o_payload_esta_em_arquivo(journal):
+    journal.append("s1", "pequena", {"versao": 1})
+    journal.append("s1", "grande", payload_grande("a"))
+
+    assert journal.stage_path("s1", "pequena") is None
+    with open(journal.stage_path("s1", "grande"), encoding="utf-8") as f:
+        assert json.load(f) == payload_grande("a")
+    assert journal.stage_locator("s1", "pequena") == f"{journal.journal_path('s1')}#pequena"
+    assert journal.stage_locator("s1", "inexistente") is None
+
+
+def test_primeiro_append_em_sessao_legada_migra_antes(journal):
+    pasta = journal.session_path("antiga")
+    os.makedirs(pasta)
+    with open(os.path.join(pasta, "etapa1.json"), "w", encoding="utf-8") as f:
+        json.dump({"etapa": "etapa1", "timestamp": "2026-01-01T10:00:00"}, f)
+
+    journal.append("antiga", "etapa2", {"versao": 1})
+    assert not journal.is_legacy("antiga")
+    assert [registro["etapa"] for registro in journal.read_records("antiga")] == ["etapa1", "etapa2"]
+    assert sorted(os.listdir(pasta)) == ["journal.jsonl"]
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""DAG de etapas: abortar uma execução cancela as etapas em andamento"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from stage_dag import AbortHandle, Stage, StageDAG, WorkflowInterrupted
+
+
+def test_abortar_cancela_etapas_em_andamento():
+    concluidas = []
+
+    async def rapida(ctx):
+        concluidas.append("rapida")
+
+    async def lenta(ctx):
+        await asyncio.sleep(30)
+        concluidas.append("lenta")
+
+    dag = StageDAG([Stage("rapida", rapida), Stage("lenta", lenta, depends_on=["rapida"]),
+                    Stage("depois", rapida, depends_on=["lenta"])])
+    abort = AbortHandle()
+    threading.Timer(0.1, abort.abort).start()
+
+    inicio = time.monotonic()
+    with pytest.raises(WorkflowInterrupted):
+        dag.run_sync({}, abort=abort)
+    assert time.monotonic() - inicio < 5
+    assert concluidas == ["rapida"]
+
+
+def test_abortar_antes_de_iniciar_nao_executa_etapas():
+    executadas = []
+
+    async def etapa(ctx):
+        executadas.append(True)
+
+    abort = AbortHandle()
+    abort.abort()
+    with pytest.raises(WorkflowInterrupted):
+        StageDAG([Stage("unica", etapa)]).run_sync({}, abort=abort)
+    assert executadas == []
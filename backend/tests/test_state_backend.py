@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""Backends compartilhados: fila com claim e lease entre processos, feed de mudanças e leituras de status"""
+import multiprocessing
+import time
+
+import pytest
+
+from state_backend import LocalNetworkStore, NetworkStoreBackend, SQLiteStateBackend, SQLITE_IN_BATCH
+
+
+def reivindicar_todos(caminho: str, worker_id: str) -> list:
+    """Roda em outro processo: retira jobs da fila SQLite até esvaziá-la"""
+    backend = SQLiteStateBackend(caminho)
+    retirados = []
+    while True:
+        job = backend.claim(worker_id, 60)
+        if job is None:
+            return retirados
+        retirados.append(job[0])
+        backend.ack(job[0])
+
+
+@pytest.fixture(params=["sqlite", "rede"])
+def backend(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteStateBackend(str(tmp_path / "state.db"))
+    return NetworkStoreBackend(LocalNetworkStore())
+
+
+def test_processos_nunca_recebem_o_mesmo_job(tmp_path):
+    caminho = str(tmp_path / "state.db")
+    SQLiteStateBackend(caminho).enqueue_many([(f"job{indice}", {}) for indice in range(60)], 100)
+
+    with multiprocessing.get_context("spawn").Pool(3) as pool:
+        retirados = pool.starmap(reivindicar_todos, [(caminho, f"w{indice}") for indice in range(3)])
+
+    todos = [job_id for lista in retirados for job_id in lista]
+    assert sorted(todos) == sorted(f"job{indice}" for indice in range(60))
+
+
+def test_lease_vencida_volta_para_outro_worker(backend):
+    backend.enqueue_many([("s1", {"priority": 0})], 10)
+    assert backend.claim("w1", 0.05)[0] == "s1"
+    assert backend.position("s1") == 0
+    assert backend.claim("w2", 60) is None
+
+    time.sleep(0.1)
+    # w1 caiu: a renovação de outro worker não vale e a lease vencida é entregue a w2
+    backend.renew(["s1"], "w2", 60)
+    assert backend.claim("w2", 60)[0] == "s1"
+    backend.renew(["s1"], "w1", 60)
+    assert backend.queue_stats() == {"queued": 0, "running": 1}
+
+    backend.ack("s1")
+    assert backend.position("s1") is None
+    assert backend.queue_stats() == {"queued": 0, "running": 0}
+
+
+def test_fila_por_prioridade_limite_e_cancelamento(backend):
+    assert backend.enqueue_many([("a", {}), ("b", {"priority": 2})], 2) == [2, 1]
+    assert backend.enqueue_many([("c", {})], 2) is None
+    assert backend.position("c") is None
+
+    assert backend.cancel("a") == {}
+    assert backend.cancel("a") is None
+    assert backend.claim("w1", 60)[0] == "b"
+    backend.release("b")
+    assert backend.position("b") == 1
+
+
+def test_leituras_de_status_em_blocos(backend):
+    ids = [f"s{indice}" for indice in range(SQLITE_IN_BATCH * 2 + 1)]
+    backend.record_reads(ids, 1234.0)
+    assert backend.last_reads(ids + ["desconhecida"]) == {session_id: 1234.0 for session_id in ids}
+    backend.forget_reads(ids[:1])
+    assert "s0" not in backend.last_reads(ids[:2])
+
+
+def test_feed_nao_guarda_payload_de_sessao_apagada():
+    store = LocalNetworkStore()
+    journal = NetworkStoreBackend(store).journal("workflow")
+    journal.append("s1", "etapa", {"segredo": "x" * 100})
+    journal.append("s2", "etapa", {"valor": 1})
+
+    mudancas, cursor = journal.changes_since(0)
+    assert [(session_id, registro["dados"]) for session_id, registro, _ in mudancas] == [
+        ("s1", {"segredo": "x" * 100}), ("s2", {"valor": 1})
+    ]
+
+    journal.delete_session("s1")
+    assert not any("segredo" in entrada for entrada in store.lrange("arqv18:registros:workflow", 0, -1))
+    # Quem reaplica o feed desde o início vê só a sessão que existe e a marca de remoção
+    mudancas, novo_cursor = journal.changes_since(0)
+    assert [(session_id, registro["etapa"]) for session_id, registro, _ in mudancas] == [
+        ("s2", "etapa"), ("s1", "sessao_apagada")
+    ]
+    assert novo_cursor == cursor + 1
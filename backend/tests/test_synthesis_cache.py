@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""Cache de sínteses: coalescência de inícios idênticos e sessões concluídas a partir do cache"""
+import threading
+
+from synthesis_cache import (
+    RESULTADO_EM_ANDAMENTO, RESULTADO_HIT, RESULTADO_MISS, SynthesisCache, chave_requisicao
+)
+
+
+def test_chave_ignora_caixa_espacos_e_campos_irrelevantes():
+    assert (chave_requisicao("Teste", {"opponent": " São  Paulo ", "extra": 1})
+            == chave_requisicao("teste", {"opponent": "são paulo"}))
+    assert chave_requisicao("teste", {"opponent": "Santos"}) != chave_requisicao("teste", {"opponent": "Vasco"})
+
+
+def test_inicios_identicos_simultaneos_tem_um_unico_lider():
+    cache = SynthesisCache(max_entries=8, ttl_seconds=60)
+    resultados = []
+    barreira = threading.Barrier(8)
+
+    def iniciar(indice):
+        barreira.wait()
+        resultados.append((f"s{indice}", cache.lookup_or_begin("chave", f"s{indice}")))
+
+    threads = [threading.Thread(target=iniciar, args=(indice,)) for indice in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    lideres = [session_id for session_id, (tipo, _) in resultados if tipo == RESULTADO_MISS]
+    assert len(lideres) == 1
+    lider = lideres[0]
+    assert all(valor == lider for _, (tipo, valor) in resultados if tipo == RESULTADO_EM_ANDAMENTO)
+    assert cache.stats()["coalesced"] == 7
+
+    cache.finish("chave", lider, {"sintese": True})
+    tipo, entrada = cache.lookup_or_begin("chave", "s9")
+    assert tipo == RESULTADO_HIT
+    assert entrada["source_session"] == lider
+    assert "synthesis" not in entrada
+
+
+def test_lider_encerrado_em_outro_processo_e_substituido_fora_do_lock():
+    cache = SynthesisCache(max_entries=8, ttl_seconds=60)
+    cache.lookup_or_begin("chave", "s1")
+    consultas = []
+
+    def lider_ativo(session_id):
+        # A consulta (que pode sincronizar com o backend) não pode segurar o lock do cache
+        livre = cache._lock.acquire(blocking=False)
+        if livre:
+            cache._lock.release()
+        consultas.append((session_id, livre))
+        return False
+
+    assert cache.lookup_or_begin("chave", "s2", lider_ativo) == (RESULTADO_MISS, None)
+    assert consultas == [("s1", True)]
+    assert cache.lookup_or_begin("chave", "s3", lambda session_id: True) == (RESULTADO_EM_ANDAMENTO, "s2")
+
+
+def test_inicio_identico_conclui_com_um_registro_que_aponta_para_a_origem(app_workflow, sessao_concluida):
+    app, workflow = app_workflow
+    cliente = app.test_client()
+    context = {"opponent": "Cruzeiro", "match_date": "2026-06-01"}
+    origem = sessao_concluida(cliente, **context)
+
+    resposta = cliente.post("/api/workflow/full_workflow/start",
+                            json={"segmento": "teste", "context": context}).get_json()
+    assert resposta["cached"] is True
+    copia = resposta["session_id"]
+
+    etapas = [registro["etapa"] for registro in workflow.session_journal.read_records(copia)]
+    assert etapas == [workflow.ETAPA_INICIO, workflow.ETAPA_CONCLUSAO_DO_CACHE]
+
+    status = cliente.get(f"/api/workflow/status/{copia}").get_json()
+    assert status["progress_percentage"] == 100
+    sintese_origem = cliente.get(f"/api/workflow/results/synthesis/{origem}")
+    sintese_copia = cliente.get(f"/api/workflow/results/synthesis/{copia}")
+    assert sintese_copia.status_code == 200
+    assert sintese_copia.data == sintese_origem.data
+    secoes = cliente.get(f"/api/workflow/results/synthesis/{copia}?fields=head_to_head").get_json()
+    assert secoes["ready"] == {"head_to_head": True}
+    assert workflow.session_registry.copies_of(origem) == [copia]
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""Rotas de leitura e controle: ETag/304 da síntese, projeção ?fields=, listagem, busca e cancelamento"""
+import time
+
+import pytest
+from flask import Response, g
+
+from stage_latency import StageLatency
+
+
+@pytest.fixture
+def sessao_lenta(app_workflow, monkeypatch):
+    """Sessão nova presa na primeira etapa (latência alta); cancelada ao fim do teste"""
+    app, workflow = app_workflow
+    monkeypatch.setattr(workflow, "stage_latency", StageLatency.from_spec("0.5"))
+    cliente = app.test_client()
+    resposta = cliente.post("/api/workflow/full_workflow/start", json={
+        "segmento": "teste", "force_refresh": True, "context": {"opponent": "Bragantino"}
+    })
+    assert resposta.status_code == 200
+    session_id = resposta.get_json()["session_id"]
+    yield session_id
+    cliente.post(f"/api/workflow/cancel/{session_id}")
+
+
+def test_sintese_responde_304_para_etag_conhecida(app_workflow, sessao_concluida):
+    app, _ = app_workflow
+    cliente = app.test_client()
+    session_id = sessao_concluida(cliente)
+
+    resposta = cliente.get(f"/api/workflow/results/synthesis/{session_id}")
+    assert resposta.status_code == 200
+    assert resposta.get_json()["head_to_head"]
+    etag = resposta.headers["ETag"]
+
+    revalidacao = cliente.get(f"/api/workflow/results/synthesis/{session_id}",
+                              headers={"If-None-Match": etag})
+    assert revalidacao.status_code == 304
+    assert revalidacao.data == b""
+
+    # Representação comprimida tem ETag própria: a da identidade não a revalida
+    comprimida = cliente.get(f"/api/workflow/results/synthesis/{session_id}",
+                             headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert comprimida.status_code == 200
+    assert comprimida.headers["Content-Encoding"] == "gzip"
+    assert comprimida.headers["ETag"] != etag
+
+
+def test_sintese_projeta_secoes_pedidas(app_workflow, sessao_concluida):
+    app, workflow = app_workflow
+    cliente = app.test_client()
+    session_id = sessao_concluida(cliente)
+
+    resposta = cliente.get(f"/api/workflow/results/synthesis/{session_id}?fields=head_to_head,tactical_analysis")
+    assert resposta.status_code == 200
+    corpo = resposta.get_json()
+    assert corpo["complete"] is True
+    assert set(corpo["sections"]) == {"head_to_head", "tactical_analysis"}
+    assert corpo["ready"] == {"head_to_head": True, "tactical_analysis": True}
+    assert corpo["pending"] == []
+
+    revalidacao = cliente.get(f"/api/workflow/results/synthesis/{session_id}?fields=head_to_head,tactical_analysis",
+                              headers={"If-None-Match": resposta.headers["ETag"]})
+    assert revalidacao.status_code == 304
+
+    todas = cliente.get(f"/api/workflow/results/synthesis/{session_id}?fields=").get_json()
+    assert set(todas["sections"]) == set(workflow.NOMES_SECOES_SINTESE)
+
+
+def test_sintese_recusa_secao_desconhecida(app_workflow, sessao_concluida):
+    app, workflow = app_workflow
+    cliente = app.test_client()
+    session_id = sessao_concluida(cliente)
+
+    resposta = cliente.get(f"/api/workflow/results/synthesis/{session_id}?fields=head_to_head,inexistente")
+    assert resposta.status_code == 400
+    assert resposta.get_json()["available_sections"] == workflow.NOMES_SECOES_SINTESE
+
+
+def test_sintese_projecao_durante_execucao_marca_pendentes(app_workflow, sessao_lenta):
+    app, _ = app_workflow
+    cliente = app.test_client()
+
+    resposta = cliente.get(f"/api/workflow/results/synthesis/{sessao_lenta}?fields=head_to_head")
+    assert resposta.status_code == 200
+    corpo = resposta.get_json()
+    assert corpo["complete"] is False
+    assert corpo["sections"] == {}
+    assert corpo["ready"] == {"head_to_head": False}
+    assert corpo["pending"] == ["head_to_head"]
+
+    # Sem síntese completa, a projeção ainda exige uma sessão conhecida
+    assert cliente.get("/api/workflow/results/synthesis/session_inexistente?fields=head_to_head").status_code == 404
+
+
+def test_busca_filtra_e_agrega_sessoes(app_workflow, sessao_concluida):
+    app, _ = app_workflow
+    cliente = app.test_client()
+    session_id = sessao_concluida(cliente, opponent="Santos", competition="Copa do Brasil", match_date="2026-05-10")
+
+    resposta = cliente.get("/api/workflow/search?opponent=santos&match_date_from=2026-05-01")
+    assert resposta.status_code == 200
+    corpo = resposta.get_json()
+    assert corpo["total"] == 1
+    assert corpo["sessions"][0]["session_id"] == session_id
+    assert corpo["sessions"][0]["match_date"] == "2026-05-10"
+    assert corpo["facets"]["competition"] == {"Copa do Brasil": 1}
+    assert corpo["head_to_head_trend"]["summary"]["points"] == 1
+    assert corpo["head_to_head_trend"]["points"][0]["session_id"] == session_id
+
+    assert cliente.get("/api/workflow/search?opponent=santos&match_date_to=2026-04-30").get_json()["total"] == 0
+
+
+def test_busca_pagina_por_cursor_com_agregados_do_resultado_inteiro(app_workflow, sessao_concluida):
+    app, _ = app_workflow
+    cliente = app.test_client()
+    datas = ["2026-07-01", "2026-07-08", "2026-07-15"]
+    for data in datas:
+        sessao_concluida(cliente, opponent="Grêmio", competition="Brasileirão", match_date=data)
+
+    vistas, cursor = [], None
+    while True:
+        url = "/api/workflow/search?opponent=grêmio&limit=2" + (f"&cursor={cursor}" if cursor else "")
+        corpo = cliente.get(url).get_json()
+        assert corpo["total"] == 3
+        assert corpo["facets"]["competition"] == {"Brasileirão": 3}
+        assert corpo["head_to_head_trend"]["summary"]["points"] == 3
+        vistas.extend(sessao["match_date"] for sessao in corpo["sessions"])
+        cursor = corpo["next_cursor"]
+        if cursor is None:
+            break
+    assert vistas == sorted(datas, reverse=True)
+
+
+def test_busca_recusa_data_ou_cursor_invalidos(app_workflow):
+    app, _ = app_workflow
+    resposta = app.test_client().get("/api/workflow/search?match_date=ontem")
+    assert resposta.status_code == 400
+    assert "match_date" in resposta.get_json()["error"]
+    assert app.test_client().get("/api/workflow/search?cursor=xyz").status_code == 400
+
+
+def test_cancelamento_de_sessao_em_execucao(app_workflow, sessao_lenta):
+    app, workflow = app_workflow
+    cliente = app.test_client()
+
+    resposta = cliente.post(f"/api/workflow/cancel/{sessao_lenta}")
+    assert resposta.status_code == 200
+    assert resposta.get_json()["status"] == "cancelado"
+
+    prazo = time.monotonic() + 5
+    while time.monotonic() < prazo:
+        status = cliente.get(f"/api/workflow/status/{sessao_lenta}").get_json()
+        if status.get("cancelled"):
+            break
+        time.sleep(0.05)
+    assert status.get("cancelled") is True
+    assert status["progress_percentage"] < 100
+
+    # Repetir o pedido é idempotente: nenhum novo registro de cancelamento
+    repeticao = cliente.post(f"/api/workflow/cancel/{sessao_lenta}")
+    assert repeticao.status_code == 200
+    assert repeticao.get_json()["status"] == "cancelado"
+    etapas = [registro["etapa"] for registro in workflow.session_journal.read_records(sessao_lenta)]
+    assert etapas.count(workflow.ETAPA_CANCELAMENTO) == 1
+
+
+def test_cancelamento_de_sessao_concluida_ou_desconhecida(app_workflow, sessao_concluida):
+    app, _ = app_workflow
+    cliente = app.test_client()
+    session_id = sessao_concluida(cliente)
+
+    resposta = cliente.post(f"/api/workflow/cancel/{session_id}")
+    assert resposta.status_code == 409
+    assert resposta.get_json()["status"] == "concluido"
+    assert cliente.post("/api/workflow/cancel/session_inexistente").status_code == 404
+
+
+def test_metrica_de_rota_sem_endpoint_usa_rotulo_fixo(app_workflow):
+    app, workflow = app_workflow
+    with app.test_request_context("/api/workflow/inexistente"):
+        g.inicio_requisicao = time.perf_counter()
+        workflow._registrar_medicao_requisicao(Response(status=404))
+
+    metricas = workflow.metrics_registry.render()
+    assert 'endpoint="unmatched"' in metricas
+    assert 'endpoint="None"' not in metricas
+
+
+def test_listagem_pagina_e_sincroniza_o_backend_compartilhado(app_workflow, sessao_concluida, monkeypatch):
+    app, workflow = app_workflow
+    cliente = app.test_client()
+    sessao_concluida(cliente, opponent="Mirassol")
+    sessao_concluida(cliente, opponent="Sport")
+
+    primeira = cliente.get("/api/workflow/sessions?limit=1").get_json()
+    assert primeira["count"] == 1 and primeira["next_cursor"]
+    segunda = cliente.get(f"/api/workflow/sessions?limit=1&cursor={primeira['next_cursor']}").get_json()
+    assert segunda["sessions"][0]["session_id"] != primeira["sessions"][0]["session_id"]
+
+    # Com backend compartilhado, sessões criadas por outros processos entram antes de paginar
+    sincronizacoes = []
+    monkeypatch.setattr(workflow.state_backend, "shared", True)
+    monkeypatch.setattr(workflow, "sincronizar_estado", lambda *args: sincronizacoes.append(args))
+    assert cliente.get("/api/workflow/sessions").status_code == 200
+    assert sincronizacoes == [()]
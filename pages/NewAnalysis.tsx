@@ -1,6 +1,6 @@
 import React, { useState, useRef, useEffect } from "react";
 import { useNavigate } from "react-router-dom";
-import { Brain, ArrowLeft, CheckCircle, Wand2, Eye, Info, Zap, Cloud, HardDrive, Loader2, UploadCloud, AlertTriangle, RefreshCw, Server } from "lucide-react";
+import { Brain, ArrowLeft, CheckCircle, Wand2, Eye, Info, Zap, Cloud, HardDrive, Loader2, UploadCloud, AlertTriangle, RefreshCw, Server, XCircle } from "lucide-react";
 import { Match, Player, AutoCollectedData, Prediction } from '../types';
 import * as workflowService from '../services/workflowService';
 import { WorkflowStatusResponse } from '../services/workflowService';
@@ -12,6 +12,9 @@ interface NewAnalysisProps {
   updatePlayers: (players: Player[] | undefined) => void;
 }
 
+// Synthesis sections read by mapSynthesisToMatch: the report is built from these alone, fetched with `?fields=`
+const REPORT_SECTIONS = ['insights_principais', 'pontos_atencao_criticos', 'dados_mercado_validados', 'validacao_dados'];
+
 // Helper function to map the backend's synthesis JSON to the frontend's Match object structure
 const mapSynthesisToMatch = (synthesisData: any, currentMatch: Match): Match => {
     const prediction: Partial<Prediction> = {};
@@ -83,7 +86,8 @@ const NewAnalysis: React.FC<NewAnalysisProps> = ({ addOrUpdateMatch, updatePlaye
   const [currentMatch, setCurrentMatch] = useState<Match | null>(null);
   const [sessionId, setSessionId] = useState<string | null>(null);
 
-  const pollingIntervalRef = useRef<number | null>(null);
+  const unsubscribeRef = useRef<(() => void) | null>(null);
+  const previewShownRef = useRef(false);
 
   const stepMessages: { [key: number]: string } = {
     0: 'Iniciando fluxo de trabalho...',
@@ -98,40 +102,62 @@ const NewAnalysis: React.FC<NewAnalysisProps> = ({ addOrUpdateMatch, updatePlaye
     setLog(prev => [...prev, message]);
   };
   
+  const stopSubscription = () => {
+    if (unsubscribeRef.current) {
+      unsubscribeRef.current();
+      unsubscribeRef.current = null;
+    }
+  };
+
   useEffect(() => {
-    // Cleanup polling on component unmount
-    return () => {
-      if (pollingIntervalRef.current) {
-        clearInterval(pollingIntervalRef.current);
-      }
-    };
+    // Cleanup the progress subscription on component unmount
+    return stopSubscription;
   }, []);
   
-  // Polling effect
+  // Progress subscription effect (pushed by the backend instead of polled)
   useEffect(() => {
     if (sessionId && pageState === 'analyzing') {
-      pollingIntervalRef.current = window.setInterval(async () => {
+      const failAnalysis = (error: unknown) => {
+          stopSubscription();
+          const errorMessage = error instanceof Error ? error.message : "An unknown error occurred during polling.";
+          addLog(`[FATAL_ERROR] ${errorMessage}`);
+          if (currentMatch) {
+             addOrUpdateMatch({ ...currentMatch, status: 'Erro', error: errorMessage });
+          }
+          setIsLoading(false);
+      };
+
+      const handleStatus = async (status: WorkflowStatusResponse) => {
         try {
-          const status = await workflowService.getWorkflowStatus(sessionId);
-          
           const currentStepMessage = stepMessages[status.current_step];
           const logMessage = `[CRITICAL] ${currentStepMessage} (${status.progress_percentage}%)`;
 
-          if (currentStepMessage && !log.some(l => l.startsWith(`[CRITICAL] ${currentStepMessage}`))) {
-            addLog(logMessage);
+          if (currentStepMessage) {
+            setLog(prev => prev.some(l => l.startsWith(`[CRITICAL] ${currentStepMessage}`)) ? prev : [...prev, logMessage]);
           }
 
-          if (status.progress_percentage >= 100 || status.error) {
-            if (pollingIntervalRef.current) clearInterval(pollingIntervalRef.current);
+          // The executive summary is shown as soon as its section is persisted, while the remaining stages run
+          if (!previewShownRef.current && status.synthesis_sections?.insights_principais === 'completed') {
+            previewShownRef.current = true;
+            workflowService.getSynthesisSections(sessionId, ['insights_principais'])
+              .then(({ sections }) => (sections.insights_principais || []).forEach((insight: string) => addLog(`[PREVIEW] ${insight}`)))
+              .catch(() => { previewShownRef.current = false; });
+          }
+
+          if (status.progress_percentage >= 100 || status.error || status.cancelled) {
+            stopSubscription();
             
             if (status.error) {
                 throw new Error(status.error);
             }
+            if (status.cancelled) {
+                throw new Error('A análise foi cancelada no backend.');
+            }
 
             addLog('[SUCCESS] Análise do backend concluída. Buscando e processando resultados finais...');
             setIsLoading(true);
             try {
-                const synthesisData = await workflowService.getFinalAnalysisData(sessionId);
+                const synthesisData = await workflowService.getFinalAnalysisData(sessionId, REPORT_SECTIONS);
                 if (!synthesisData) throw new Error("Os dados da síntese final retornaram vazios.");
 
                 addLog('[INFO] Mapeando dados da síntese para o formato do relatório...');
@@ -155,22 +181,23 @@ const NewAnalysis: React.FC<NewAnalysisProps> = ({ addOrUpdateMatch, updatePlaye
             }
           }
         } catch (error) {
-          if (pollingIntervalRef.current) clearInterval(pollingIntervalRef.current);
-          const errorMessage = error instanceof Error ? error.message : "An unknown error occurred during polling.";
-          addLog(`[FATAL_ERROR] ${errorMessage}`);
-          if (currentMatch) {
-             addOrUpdateMatch({ ...currentMatch, status: 'Erro', error: errorMessage });
-          }
-          setIsLoading(false);
+          failAnalysis(error);
         }
-      }, 5000); // Poll every 5 seconds
+      };
+
+      unsubscribeRef.current = workflowService.subscribeWorkflowStatus(sessionId, handleStatus, failAnalysis);
+      return stopSubscription;
     }
-  }, [sessionId, pageState, log, currentMatch, addOrUpdateMatch, updatePlayers]);
+    // The App callbacks are left out on purpose: a new identity must never reopen the subscription,
+    // otherwise a terminal event (error, cancel) would reconnect and replay itself in a loop.
+  }, [sessionId, pageState, currentMatch]);
 
   const startAnalysis = async () => {
     setIsLoading(true);
     setPageState('analyzing');
     setLog([]);
+    setSessionId(null);
+    previewShownRef.current = false;
 
     const newMatch: Match = {
       id: crypto.randomUUID(),
@@ -189,6 +216,7 @@ const NewAnalysis: React.FC<NewAnalysisProps> = ({ addOrUpdateMatch, updatePlaye
       setSessionId(newSessionId);
       addLog(`[SUCCESS] Fluxo de trabalho iniciado com sucesso. ID da Sessão: ${newSessionId}`);
       addLog('[INFO] O backend está processando. O log será atualizado com o progresso.');
+      logPastAnalyses(formData.opponent);
       
     } catch (error) {
       const errorMessage = error instanceof Error ? error.message : "An unknown error occurred.";
@@ -198,6 +226,34 @@ const NewAnalysis: React.FC<NewAnalysisProps> = ({ addOrUpdateMatch, updatePlaye
     } 
   };
   
+  // Summarizes past completed analyses against the same opponent from the backend's session index
+  const logPastAnalyses = async (opponent: string) => {
+    try {
+      const result = await workflowService.searchSessions({ opponent, status: 'concluido', limit: 1 });
+      if (!result.total) return;
+      addLog(`[HISTORY] ${result.total} análise(s) anterior(es) contra ${opponent}.`);
+      const summary = result.head_to_head_trend?.summary;
+      if (summary) {
+        addLog(`[HISTORY] Aproveitamento médio do Corinthians no confronto direto: ${Math.round(summary.avg_corinthians_win_rate * 100)}%.`);
+      }
+    } catch (error) {
+      // The comparison is informative only; the analysis goes on without it
+      console.error('Could not load past analyses.', error);
+    }
+  };
+
+  // Stops the run on the backend; the progress stream then delivers the 'cancelled' event
+  const cancelAnalysis = async () => {
+    if (!sessionId) return;
+    addLog('[INFO] Cancelamento solicitado ao backend...');
+    try {
+      await workflowService.cancelWorkflow(sessionId);
+    } catch (error) {
+      const errorMessage = error instanceof Error ? error.message : "An unknown error occurred while cancelling.";
+      addLog(`[ERROR] ${errorMessage}`);
+    }
+  };
+  
   const renderContent = () => {
     switch (pageState) {
         case 'analyzing':
@@ -216,6 +272,11 @@ const NewAnalysis: React.FC<NewAnalysisProps> = ({ addOrUpdateMatch, updatePlaye
                                 <p className="text-gray-400 flex items-center justify-center gap-2">
                                   <Loader2 className="w-5 h-5 animate-spin"/> Buscando status do backend...
                                 </p>
+                                {sessionId && !log.some(l => l.includes('FATAL_ERROR')) && (
+                                    <button onClick={cancelAnalysis} className="mt-4 text-gray-400 hover:text-red-400 flex items-center justify-center gap-2 mx-auto transition-colors">
+                                      <XCircle className="w-5 h-5"/> Cancelar análise
+                                    </button>
+                                )}
                             </div>
                         )}
                     </div>
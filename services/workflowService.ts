@@ -18,6 +18,9 @@ interface WorkflowStartResponse {
     success: boolean;
     session_id: string;
     message: string;
+    queue_position?: number;
+    estimated_wait_seconds?: number;
+    estimated_total_duration?: string;
 }
 
 export interface WorkflowStatusResponse {
@@ -30,8 +33,20 @@ export interface WorkflowStatusResponse {
         step4: 'pending' | 'completed' | 'failed';
         cpl_devastador: 'pending' | 'completed' | 'failed';
     };
+    synthesis_sections?: Record<string, 'pending' | 'completed'>;
     progress_percentage: number;
+    estimated_remaining?: string;
+    queue_position?: number;
     error?: string;
+    cancelled?: boolean;
+}
+
+export interface SynthesisSectionsResponse {
+    session_id: string;
+    complete: boolean;
+    sections: Record<string, any>;
+    ready: Record<string, boolean>;
+    pending: string[];
 }
 
 // Helper to make fetch requests
@@ -85,18 +100,109 @@ export async function startFullWorkflow(formData: FormData, specialDirectives: s
     return response.session_id;
 }
 
+// Stops a queued or running analysis; the backend halts it before the next stage.
+export async function cancelWorkflow(sessionId: string): Promise<void> {
+    await fetchApi<{ success: boolean }>(`/api/workflow/cancel/${sessionId}`, { method: 'POST' });
+}
+
 export async function getWorkflowStatus(sessionId: string): Promise<WorkflowStatusResponse> {
     return fetchApi<WorkflowStatusResponse>(`/api/workflow/status/${sessionId}`);
 }
 
+// Subscribes to workflow progress pushed by the backend. Uses Server-Sent Events when
+// available and falls back to long-polling the status endpoint with `?since=<step>`.
+// Returns a function that stops the subscription.
+export function subscribeWorkflowStatus(
+    sessionId: string,
+    onStatus: (status: WorkflowStatusResponse) => void,
+    onError: (error: Error) => void,
+): () => void {
+    if (typeof EventSource !== 'undefined') {
+        const source = new EventSource(`${API_BASE_URL}/api/workflow/stream/${sessionId}`);
+        const handle = (event: Event) => onStatus(JSON.parse((event as MessageEvent).data));
+        const handleFinal = (event: Event) => {
+            source.close();
+            handle(event);
+        };
+
+        source.addEventListener('progress', handle);
+        source.addEventListener('completed', handleFinal);
+        source.addEventListener('workflow_erro', handleFinal);
+        source.addEventListener('cancelled', handleFinal);
+        source.addEventListener('removed', () => {
+            // The session was deleted while streaming (e.g. by retention); there is nothing left to follow.
+            source.close();
+            onError(new Error('A análise foi removida do backend.'));
+        });
+        source.onerror = () => {
+            // The browser reconnects on its own unless the server refused the stream.
+            if (source.readyState === EventSource.CLOSED) {
+                onError(new Error('A conexão de progresso com o backend foi encerrada.'));
+            }
+        };
+        return () => source.close();
+    }
+
+    let stopped = false;
+    const longPoll = async (since: number) => {
+        while (!stopped) {
+            try {
+                const status = await fetchApi<WorkflowStatusResponse>(`/api/workflow/status/${sessionId}?since=${since}`);
+                if (stopped) return;
+                if (status.current_step > since || status.error || status.cancelled) {
+                    onStatus(status);
+                }
+                if (status.progress_percentage >= 100 || status.error || status.cancelled) return;
+                since = status.current_step;
+            } catch (error) {
+                if (!stopped) onError(error instanceof Error ? error : new Error(String(error)));
+                return;
+            }
+        }
+    };
+    longPoll(-1);
+    return () => { stopped = true; };
+}
+
 // This function calls the new backend endpoint to get the final analysis data.
-export async function getFinalAnalysisData(sessionId: string): Promise<any> {
+// Only the given synthesis sections are transferred (`?fields=` projection); all of them when `fields` is empty.
+export async function getFinalAnalysisData(sessionId: string, fields: string[] = []): Promise<any> {
      try {
-        // This endpoint returns the content of `sintese_master_synthesis.json`.
-        const synthesisData = await fetchApi<any>(`/api/workflow/results/synthesis/${sessionId}`);
-        return synthesisData;
+        const { complete, sections } = await getSynthesisSections(sessionId, fields);
+        if (!complete) throw new Error('Synthesis not persisted yet');
+        return sections;
     } catch (e) {
         console.error(`Could not fetch final analysis data for session ${sessionId}.`, e);
         throw new Error('Não foi possível buscar os dados finais da análise. Verifique o log do backend para garantir que o arquivo de síntese foi gerado corretamente.');
     }
 }
+
+// Fetches only the requested synthesis sections (all of them when `fields` is empty).
+// Sections are returned as soon as the backend persists them, before the synthesis completes.
+export async function getSynthesisSections(sessionId: string, fields: string[] = []): Promise<SynthesisSectionsResponse> {
+    const query = encodeURIComponent(fields.join(','));
+    return fetchApi<SynthesisSectionsResponse>(`/api/workflow/results/synthesis/${sessionId}?fields=${query}`);
+}
+
+export interface SessionSearchParams {
+    opponent?: string;
+    competition?: string;
+    venue?: string;
+    formation?: string;
+    status?: string;
+    match_date_from?: string;
+    match_date_to?: string;
+    limit?: number;
+    cursor?: string;
+}
+
+// Queries past analyses through the backend's session index (no raw files are read).
+// Besides one page of matching sessions (pass next_cursor back as `cursor` for the next one), returns
+// per-field facets and the head-to-head trend over time for all matches.
+export async function searchSessions(params: SessionSearchParams): Promise<any> {
+    const query = new URLSearchParams();
+    Object.entries(params).forEach(([key, value]) => {
+        if (value !== undefined && value !== '') query.set(key, String(value));
+    });
+    return fetchApi<any>(`/api/workflow/search?${query.toString()}`);
+}